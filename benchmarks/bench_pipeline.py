@@ -0,0 +1,131 @@
+"""
+End-to-end benchmark of the brlcad_tcl export pipeline, against the stand-in BRL-CAD tools
+in benchmarks/fake_brlcad (so it runs without BRL-CAD installed).
+
+Every stage's wall time is split into the time spent inside the (fake) tools, as recorded by
+brlcad_tcl's tracer, and the rest: the python-side script generation, parsing, scheduling and I/O.
+
+run with:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --slices 20 --pixels 256 --latency 0.05 --output-bytes 100000
+    python -m benchmarks.bench_pipeline --raster-engines nirt,rt,voxel,numpy
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from python_brlcad_tcl.brlcad_tcl import brlcad_tcl
+
+FAKE_BRLCAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_brlcad')
+
+
+def use_fake_brlcad(latency=0., latency_per_item=0., output_bytes=0, stl_triangles=1000):
+    """
+    put the stand-in tools first on the PATH, so that brlcad_tcl (and the shell it uses) finds them
+    """
+    os.environ['PATH'] = FAKE_BRLCAD_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_BRLCAD_LATENCY'] = str(latency)
+    os.environ['FAKE_BRLCAD_LATENCY_PER_ITEM'] = str(latency_per_item)
+    os.environ['FAKE_BRLCAD_OUTPUT_BYTES'] = str(output_bytes)
+    os.environ['FAKE_BRLCAD_STL_TRIANGLES'] = str(stl_triangles)
+
+
+def build_pump(brl_db):
+    from examples.microfluidic_pump import peristaltic_3_finger_pump
+    pump = peristaltic_3_finger_pump(brl_db)
+    pipes = []
+    for connection, radius in [('flow_control_a_coord', 750),
+                               ('flow_control_b_coord', 750),
+                               ('flow_control_c_coord', 750),
+                               ('flow_in', 100),
+                               ('flow_out', 100)]:
+        c = pump.get_connection(connection)
+        pipes.append(brl_db.circular_cylinder(None, c[1], [_c * 5000 for _c in c[2]], radius=radius))
+    final_name = 'new_' + pump.final_name
+    brl_db.region(final_name, 'u {} u {}'.format(pump.final_name, ' u '.join(pipes)))
+    return final_name
+
+
+class StageTimer(object):
+    def __init__(self, brl_db):
+        self.brl_db = brl_db
+        self.results = []
+
+    def run(self, stage_name, function, *args, **kwargs):
+        first_event = len(self.brl_db.tracer.events)
+        start = time.time()
+        function(*args, **kwargs)
+        wall_time = time.time() - start
+        events = self.brl_db.tracer.events[first_event:]
+        tool_time = sum(e.wall_time for e in events)
+        result = {'stage': stage_name,
+                  'wall_seconds': wall_time,
+                  'tool_invocations': len(events),
+                  'tool_seconds': tool_time,
+                  'python_seconds': wall_time - tool_time,
+                  'bytes_in': sum(e.bytes_in for e in events),
+                  'bytes_out': sum(e.bytes_out for e in events)}
+        self.results.append(result)
+        print('{stage:<22} {wall_seconds:>9.3f} {tool_invocations:>6} {tool_seconds:>9.3f} {python_seconds:>9.3f}'
+              ' {bytes_in:>12} {bytes_out:>12}'.format(**result))
+        sys.stdout.flush()
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slices', type=int, default=10, help='number of slices exported')
+    parser.add_argument('--pixels', type=int, default=128, help='raster slice width and height')
+    parser.add_argument('--latency', type=float, default=0., help='seconds every fake tool run takes to start')
+    parser.add_argument('--latency-per-item', type=float, default=0.,
+                        help='seconds per mged command / nirt ray / rt row / g-stl facet')
+    parser.add_argument('--output-bytes', type=int, default=0, help='extra bytes every fake tool prints')
+    parser.add_argument('--stl-triangles', type=int, default=1000, help='facets per object g-stl writes')
+    parser.add_argument('--raster-engines', default='nirt,rt',
+                        help='comma-separated raster engines to time the raster slices with (see export_model_slices)')
+    parser.add_argument('--json', help='also write the results to this path')
+    parser.add_argument('--trace', help='write the Chrome trace of the tool invocations to this path')
+    args = parser.parse_args(argv)
+
+    use_fake_brlcad(args.latency, args.latency_per_item, args.output_bytes, args.stl_triangles)
+    temp_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        brl_db = brlcad_tcl(os.path.join(temp_dir, 'pump.tcl'), 'pipeline benchmark', units='um')
+        timer = StageTimer(brl_db)
+        print('{:<22} {:>9} {:>6} {:>9} {:>9} {:>12} {:>12}'.format('stage', 'wall s', 'tools', 'tool s',
+                                                                     'python s', 'bytes in', 'bytes out'))
+        final_name = []
+        timer.run('build_model', lambda: final_name.append(build_pump(brl_db)))
+        timer.run('save_tcl', brl_db.save_tcl)
+        timer.run('save_g', brl_db.save_g)
+        timer.run('top_level_names', brl_db.get_top_level_object_names)
+        timer.run('bounding_box', brl_db.get_bounding_box_coords, final_name[0])
+        timer.run('save_stl', brl_db.save_stl, final_name)
+        timer.run('export_image_from_Z', brl_db.export_image_from_Z, final_name[0], args.pixels, args.pixels)
+        for raster_engine in args.raster_engines.split(','):
+            timer.run('slices_raster' if raster_engine == 'nirt' else 'slices_raster_' + raster_engine,
+                      brl_db.export_model_slices, args.slices, 30000, 30000,
+                      output_format='raster',
+                      output_option_kwargs={'output_greyscale': True,
+                                            'num_pix_x': args.pixels,
+                                            'num_pix_y': args.pixels},
+                      raster_engine=raster_engine)
+        timer.run('slices_stl', brl_db.export_model_slices, args.slices, 30000, 30000,
+                  output_format='stl', output_path_format='{}_slice_{}')
+
+        if args.trace:
+            brl_db.tracer.write_chrome_trace(args.trace)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'stages': timer.results, 'tools': brl_db.tracer.summary()}, f, indent=2)
+        return timer.results
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Benchmarks the tcl script emission of brlcad_tcl, no BRL-CAD install needed.
+
+Every case builds a synthetic model of N primitives through the public brlcad_tcl API,
+in a fresh process, and reports the throughput, the peak memory and the size of the emitted script.
+
+run with:
+    python -m benchmarks.bench_script_generation
+    python -m benchmarks.bench_script_generation --sizes 1000,1000000 --cases named_rpp,wide_combination
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+from python_brlcad_tcl.brlcad_tcl import brlcad_tcl
+
+
+DEFAULT_SIZES = [10**3, 10**4, 10**5]
+FULL_SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+def _arb8_points(x):
+    return [(x, 0, 0), (x + 1, 0, 0), (x + 1, 1, 0), (x, 1, 0),
+            (x, 0, 1), (x + 1, 0, 1), (x + 1, 1, 1), (x, 1, 1)]
+
+
+# each primitive type, as a function of (brl_db, name, x offset)
+PRIMITIVES = {'rpp': lambda db, name, x: db.rpp(name, (x, 0, 0), (x + 1, 1, 1)),
+              'rcc': lambda db, name, x: db.rcc(name, (x, 0, 0), (0, 0, 1), 0.5),
+              'trc': lambda db, name, x: db.trc(name, (x, 0, 0), (0, 0, 1), 0.5, 0.25),
+              'tgc': lambda db, name, x: db.tgc(name, (x, 0, 0), (0, 0, 1), (0.5, 0, 0), (0, 0.25, 0), 0.3, 0.2),
+              'sph': lambda db, name, x: db.sph(name, (x, 0, 0), 0.5),
+              'tor': lambda db, name, x: db.tor(name, (x, 0, 0), (0, 0, 1), 1, 0.2),
+              'arb8': lambda db, name, x: db.arb8(name, _arb8_points(x)),
+              'ell': lambda db, name, x: db.Ellipsoid(name, (x, 0, 0), (0.5, 0, 0), (0, 0.3, 0), (0, 0, 0.2))}
+# Ellipsoid doesn't generate names
+UNNAMED_PRIMITIVES = [p for p in sorted(PRIMITIVES) if p != 'ell']
+
+
+def _named(primitive):
+    def build(db, n):
+        make = PRIMITIVES[primitive]
+        for i in range(n):
+            make(db, 'p{}.s'.format(i), i)
+    return build
+
+
+def _unnamed(primitive):
+    def build(db, n):
+        make = PRIMITIVES[primitive]
+        for i in range(n):
+            make(db, None, i)
+    return build
+
+
+def deep_combination(db, n):
+    # a chain of combinations, each one adding a primitive to the previous one
+    previous = db.rpp('p0.s', (0, 0, 0), (1, 1, 1))
+    for i in range(1, n):
+        primitive = db.rpp('p{}.s'.format(i), (i, 0, 0), (i + 1, 1, 1))
+        previous = db.combination('c{}.c'.format(i), 'u {} u {}'.format(previous, primitive))
+    db.region('deep.r', 'u {}'.format(previous))
+
+
+def wide_combination(db, n):
+    # a single region that unions every primitive
+    names = [db.rpp('p{}.s'.format(i), (i, 0, 0), (i + 1, 1, 1)) for i in range(n)]
+    db.region('wide.r', 'u {}'.format(' u '.join(names)))
+
+
+def _build_tobacco_device(db, num_output_ports):
+    from examples import tobacco_mesophyll_protoplast_fusion_device as tobacco
+    # the example's methods use its module-level brl_db
+    tobacco.brl_db = db
+    return tobacco.tobacco_mesophyll_protoplast_fusion_device(input_port_diameter=1200,
+                                                              input_symmetric_bifurcation_inner_width=200,
+                                                              input_symmetric_bifurcation_outer_width=900,
+                                                              symmetric_bifurcation_post_w=20,
+                                                              symmetric_bifurcation_post_h=30,
+                                                              symmetric_bifurcation_post_roundness=15,
+                                                              symmetric_bifurcation_post_pitch=40,
+                                                              length_catcher=3200,
+                                                              width_catcher=900,
+                                                              catcher_post_w=20,
+                                                              catcher_post_h=30,
+                                                              catcher_post_roundness=20,
+                                                              catcher_post_pitch=20 + (20 / 2),
+                                                              distance_output_port_from_center=3200 + 200 + 800,
+                                                              dist_center_catcher_to_center_device=(3200 / 2) + 800,
+                                                              io_height=500,
+                                                              protoplast_chamber_height=55,
+                                                              output_port_diameter=1200,
+                                                              num_output_ports=num_output_ports,
+                                                              brl_db=db)
+
+
+def _count_primitives(db):
+    return sum(1 for line in db.script_string_list if line.lstrip().startswith('in '))
+
+
+def tobacco_fusion_device(db, n):
+    # the bundled example, scaled up by adding output ports (each one brings its own catcher posts)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        probe = brlcad_tcl(os.path.join(temp_dir, 'probe.tcl'), 'probe')
+        _build_tobacco_device(probe, 1)
+        one_port = _count_primitives(probe)
+        probe = brlcad_tcl(os.path.join(temp_dir, 'probe.tcl'), 'probe')
+        _build_tobacco_device(probe, 2)
+        per_port = max(_count_primitives(probe) - one_port, 1)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    _build_tobacco_device(db, max(1, 1 + int(round((n - one_port) / float(per_port)))))
+
+
+CASES = dict([('named_{}'.format(p), _named(p)) for p in PRIMITIVES] +
+             [('unnamed_{}'.format(p), _unnamed(p)) for p in UNNAMED_PRIMITIVES] +
+             [('deep_combination', deep_combination),
+              ('wide_combination', wide_combination),
+              ('tobacco_fusion_device', tobacco_fusion_device)])
+
+
+def _get_max_rss_bytes():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _run_case(case_name, n, result_queue):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        tcl_path = os.path.join(temp_dir, 'bench.tcl')
+        rss_before = _get_max_rss_bytes()
+        db = brlcad_tcl(tcl_path, 'benchmark')
+
+        start = time.time()
+        CASES[case_name](db, n)
+        build_time = time.time() - start
+
+        start = time.time()
+        db.save_tcl()
+        save_time = time.time() - start
+
+        num_primitives = _count_primitives(db)
+        result_queue.put({'case': case_name,
+                          'size': n,
+                          'primitives': num_primitives,
+                          'script_lines': len(db.script_string_list),
+                          'script_bytes': os.path.getsize(tcl_path),
+                          'build_seconds': build_time,
+                          'save_tcl_seconds': save_time,
+                          'primitives_per_second': num_primitives / build_time if build_time else float('inf'),
+                          'peak_rss_bytes': _get_max_rss_bytes(),
+                          'peak_rss_growth_bytes': _get_max_rss_bytes() - rss_before})
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def run_case(case_name, n):
+    """
+    run one case in a new process, so its peak memory isn't hidden by the previous cases
+    """
+    result_queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_run_case, args=(case_name, n, result_queue))
+    p.start()
+    while True:
+        try:
+            result = result_queue.get(timeout=1)
+            break
+        except Queue.Empty:
+            if not p.is_alive():
+                raise Exception('benchmark case {} (size {}) failed with exit code {}'.format(case_name, n, p.exitcode))
+    p.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', help='comma-separated number of primitives per case (default: {})'
+                                        .format(','.join(str(s) for s in DEFAULT_SIZES)))
+    parser.add_argument('--full', action='store_true', help='also run the 10^6 primitive models')
+    parser.add_argument('--cases', help='comma-separated cases, from: {}'.format(', '.join(sorted(CASES))))
+    parser.add_argument('--json', help='also write the results to this path')
+    args = parser.parse_args(argv)
+
+    if args.sizes:
+        sizes = [int(s) for s in args.sizes.split(',')]
+    else:
+        sizes = FULL_SIZES if args.full else DEFAULT_SIZES
+    case_names = args.cases.split(',') if args.cases else sorted(CASES)
+
+    results = []
+    print('{:<24} {:>9} {:>11} {:>10} {:>14} {:>12} {:>13}'.format('case', 'size', 'primitives', 'build s',
+                                                                    'primitives/s', 'script MB', 'peak RSS MB'))
+    for case_name in case_names:
+        for n in sizes:
+            result = run_case(case_name, n)
+            results.append(result)
+            print('{case:<24} {size:>9} {primitives:>11} {build_seconds:>10.3f} {primitives_per_second:>14.0f}'
+                  ' {script_mb:>12.2f} {peak_rss_mb:>13.1f}'.format(script_mb=result['script_bytes'] / 2.**20,
+                                                                   peak_rss_mb=result['peak_rss_bytes'] / 2.**20,
+                                                                   **result))
+            sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
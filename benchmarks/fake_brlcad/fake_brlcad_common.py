@@ -0,0 +1,218 @@
+"""
+Shared code for the deterministic stand-ins of the BRL-CAD tools (mged, g-stl, rt, nirt).
+
+The stand-in "database" is a text file holding every tcl command mged was fed,
+which is enough to answer the questions brlcad_tcl asks (tops, bounding-boxes, ...).
+
+Configured with environment variables:
+    FAKE_BRLCAD_LATENCY            seconds every invocation sleeps before doing anything (default 0)
+    FAKE_BRLCAD_LATENCY_PER_ITEM   extra seconds per mged command / nirt ray / rt row / g-stl facet (default 0)
+    FAKE_BRLCAD_OUTPUT_BYTES       bytes of extra chatter every invocation writes to stdout (default 0)
+    FAKE_BRLCAD_STL_TRIANGLES      facets g-stl writes per object at the default tolerance (default 1000)
+"""
+import os
+import sys
+import math
+import time
+import zlib
+import struct
+
+
+UNITS_TO_MM = {'um': 0.001, 'mm': 1., 'cm': 10., 'm': 1000., 'in': 25.4, 'ft': 304.8}
+
+
+def get_env_float(name, default=0.):
+    return float(os.environ.get(name, default))
+
+
+def startup():
+    time.sleep(get_env_float('FAKE_BRLCAD_LATENCY'))
+    output_bytes = int(get_env_float('FAKE_BRLCAD_OUTPUT_BYTES'))
+    if output_bytes:
+        line = 'fake BRL-CAD chatter ' * 3 + '\n'
+        sys.stdout.write((line * (output_bytes // len(line) + 1))[:output_bytes])
+        sys.stdout.flush()
+
+
+def item_latency(num_items=1):
+    per_item = get_env_float('FAKE_BRLCAD_LATENCY_PER_ITEM')
+    if per_item:
+        time.sleep(per_item * num_items)
+
+
+def _points_bbox(points, pad=0.):
+    mins = [min(p[i] for p in points) - pad for i in range(3)]
+    maxs = [max(p[i] for p in points) + pad for i in range(3)]
+    return mins, maxs
+
+
+def _length(v):
+    return math.sqrt(sum(c * c for c in v))
+
+
+def primitive_bbox(primitive_type, args):
+    if primitive_type == 'rpp':
+        minx, maxx, miny, maxy, minz, maxz = args[:6]
+        return [minx, miny, minz], [maxx, maxy, maxz]
+    if primitive_type == 'sph':
+        return _points_bbox([args[:3]], args[3])
+    if primitive_type == 'ell':
+        v, a, b, c = args[0:3], args[3:6], args[6:9], args[9:12]
+        half = [math.sqrt(a[i] ** 2 + b[i] ** 2 + c[i] ** 2) for i in range(3)]
+        return [v[i] - half[i] for i in range(3)], [v[i] + half[i] for i in range(3)]
+    if primitive_type.startswith('arb'):
+        return _points_bbox([args[i:i + 3] for i in range(0, len(args) - 2, 3)])
+    if primitive_type in ('rcc', 'trc', 'tgc', 'tec', 'rec'):
+        base, height = args[0:3], args[3:6]
+        top = [base[i] + height[i] for i in range(3)]
+        if primitive_type in ('rcc', 'trc'):
+            radius = max(args[6:])
+        else:
+            radius = max([_length(args[6:9]), _length(args[9:12])] + [abs(a) for a in args[12:]])
+        return _points_bbox([base, top], radius)
+    if primitive_type == 'tor':
+        return _points_bbox([args[:3]], args[6] + args[7])
+    # anything else: around its vertex, as big as its biggest parameter
+    return _points_bbox([args[:3]], max([abs(a) for a in args[3:]] + [1.]))
+
+
+def _intersect_bbox(bb1, bb2):
+    return ([max(bb1[0][i], bb2[0][i]) for i in range(3)],
+            [min(bb1[1][i], bb2[1][i]) for i in range(3)])
+
+
+def _union_bbox(bb1, bb2):
+    return ([min(bb1[0][i], bb2[0][i]) for i in range(3)],
+            [max(bb1[1][i], bb2[1][i]) for i in range(3)])
+
+
+class FakeDatabase(object):
+    def __init__(self, path):
+        self.path = path
+        self.primitives = {}
+        # name -> (kind, [(op, member), ...])
+        self.combinations = {}
+        self.units = 'mm'
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    self.apply(line)
+
+    def apply(self, line):
+        tokens = line.split()
+        if not tokens:
+            return
+        if tokens[0] == 'in' and len(tokens) > 3:
+            try:
+                self.primitives[tokens[1]] = (tokens[2], [float(t) for t in tokens[3:]])
+            except ValueError:
+                pass
+        elif tokens[0] in ('comb', 'r') and len(tokens) > 2:
+            ops = tokens[2:]
+            self.combinations[tokens[1]] = (tokens[0], list(zip(ops[0::2], ops[1::2])))
+        elif tokens[0] == 'g' and len(tokens) > 2:
+            self.combinations[tokens[1]] = ('g', [('u', member) for member in tokens[2:]])
+        elif tokens[0] in ('make_bb', 'bb') and len(tokens) > 2:
+            names = [t for t in tokens[1:] if not t.startswith('-')]
+            bbox = self.bbox(names[1:])
+            if bbox:
+                (x1, y1, z1), (x2, y2, z2) = bbox
+                self.primitives[names[0]] = ('rpp', [x1, x2, y1, y2, z1, z2])
+        elif tokens[0] == 'units' and len(tokens) == 2:
+            self.units = tokens[1]
+        elif tokens[0] == 'kill':
+            for name in tokens[1:]:
+                self.primitives.pop(name, None)
+                self.combinations.pop(name, None)
+
+    def exists(self, name):
+        return name in self.primitives or name in self.combinations
+
+    def tops(self):
+        referenced = set(member for kind, ops in self.combinations.values() for op, member in ops)
+        names = sorted(set(self.primitives) | set(self.combinations))
+        return [name for name in names if name not in referenced]
+
+    def is_region(self, name):
+        return self.combinations.get(name, (None,))[0] == 'r'
+
+    def bbox(self, names):
+        bbox = None
+        for name in names:
+            name_bbox = self._object_bbox(name, set())
+            if name_bbox:
+                bbox = name_bbox if bbox is None else _union_bbox(bbox, name_bbox)
+        return bbox
+
+    def _object_bbox(self, name, visiting):
+        if name in self.primitives:
+            return primitive_bbox(*self.primitives[name])
+        if name not in self.combinations or name in visiting:
+            return None
+        visiting.add(name)
+        bbox = None
+        term = None
+        # union of the terms, where every term is intersected with its '+' members ('-' can only shrink it)
+        for op, member in self.combinations[name][1] + [('u', None)]:
+            member_bbox = self._object_bbox(member, visiting) if member else None
+            if op == 'u':
+                if term:
+                    bbox = term if bbox is None else _union_bbox(bbox, term)
+                term = member_bbox
+            elif op == '+' and term and member_bbox:
+                term = _intersect_bbox(term, member_bbox)
+        visiting.discard(name)
+        if bbox and any(bbox[0][i] > bbox[1][i] for i in range(3)):
+            return None
+        return bbox
+
+
+def get_database_arg(argv):
+    for arg in argv:
+        if arg.endswith('.g'):
+            return arg
+    return None
+
+
+def get_objects_after_database(argv):
+    database = get_database_arg(argv)
+    return argv[argv.index(database) + 1:] if database else []
+
+
+def write_png(path, width, height, pixel_function):
+    """
+    write an 8-bit greyscale PNG, pixel_function(x, y) -> 0..255 with y=0 at the top
+    """
+    raw = b''.join(b'\x00' + bytes(bytearray(pixel_function(x, y) for x in range(width)))
+                   for y in range(height))
+
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data +
+                struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw)))
+        f.write(chunk(b'IEND', b''))
+
+
+def write_pix(path, width, height, pixel_function):
+    """
+    write a .pix file (RGB bytes, from the bottom row up), pixel_function(x, y) -> (r, g, b) with y=0 at the bottom
+    """
+    with open(path, 'wb') as f:
+        for y in range(height):
+            f.write(bytes(bytearray(c for x in range(width) for c in pixel_function(x, y))))
+
+
+def in_footprint(bbox, x, y):
+    """
+    the stand-ins pretend every object is the ellipse inscribed in its X/Y bounding-box
+    """
+    (x1, y1, z1), (x2, y2, z2) = bbox
+    rx = (x2 - x1) / 2.
+    ry = (y2 - y1) / 2.
+    if rx <= 0 or ry <= 0:
+        return False
+    return ((x - x1 - rx) / rx) ** 2 + ((y - y1 - ry) / ry) ** 2 <= 1.
@@ -0,0 +1,143 @@
+"""
+An on-disk, content-addressed cache for the files the BRL-CAD tools produce (.g, STL, images, slices),
+keyed by a hash of everything that determines them: the emitted script, the tool, its arguments and version.
+The least recently used entries are evicted when the cache grows over its size limit.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+
+def make_key(*parts):
+    """
+    hash any JSON-able parts (strings, numbers, lists, dicts) into a cache key
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def hash_script(script_string_list):
+    h = hashlib.sha256()
+    for entry in script_string_list:
+        # (on Python 2 the entries are mostly byte strings already, which may not be ASCII)
+        h.update(entry.encode('utf-8') if isinstance(entry, text_type) else entry)
+    return h.hexdigest()
+
+
+def get_tool_version(tool_path):
+    """
+    Identifies the installed version of a tool by its executable's path, size and modification time,
+    which is much cheaper than running it, and changes whenever BRL-CAD is upgraded.
+    """
+    if not tool_path or not os.path.isfile(tool_path):
+        return None
+    stat = os.stat(tool_path)
+    return [os.path.realpath(tool_path), stat.st_size, int(stat.st_mtime)]
+
+
+class ArtifactCache(object):
+    MANIFEST_NAME = 'manifest.json'
+
+    def __init__(self, cache_dir, max_bytes=2 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """
+        :return: the list of cached file paths stored under key (in the order they were put), or None
+        """
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, self.MANIFEST_NAME)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        cached_paths = [os.path.join(entry_dir, str(i)) for i in range(manifest['num_files'])]
+        if not all(os.path.isfile(p) for p in cached_paths):
+            return None
+        # the manifest's modification time is what the LRU eviction goes by
+        os.utime(manifest_path, None)
+        return cached_paths
+
+    def fetch(self, key, output_paths):
+        """
+        copy the cached files of key to output_paths
+        :return: True on a cache hit
+        """
+        cached_paths = self.get(key)
+        if cached_paths is None or len(cached_paths) != len(output_paths):
+            return False
+        for cached_path, output_path in zip(cached_paths, output_paths):
+            shutil.copyfile(cached_path, output_path)
+        print('restored from cache: {}'.format(', '.join(output_paths)))
+        return True
+
+    def put(self, key, paths):
+        """
+        store copies of the files at paths under key, then evict old entries if the cache is too big
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+        parent_dir = os.path.dirname(entry_dir)
+        if not os.path.isdir(parent_dir):
+            try:
+                os.makedirs(parent_dir)
+            except OSError:
+                # another process just made it
+                pass
+        # fill a temporary directory, then rename it into place, so readers never see half an entry
+        temp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.tmp_')
+        try:
+            for i, path in enumerate(paths):
+                shutil.copyfile(path, os.path.join(temp_dir, str(i)))
+            with open(os.path.join(temp_dir, self.MANIFEST_NAME), 'w') as f:
+                json.dump({'num_files': len(paths),
+                           'original_paths': [os.path.abspath(p) for p in paths],
+                           'created': time.time()}, f)
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # the same entry was put by someone else in the meantime
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                raise
+        self.evict()
+
+    def _get_entries(self):
+        """
+        :return: list of (last used time, size in bytes, entry dir)
+        """
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                manifest_path = os.path.join(entry_dir, self.MANIFEST_NAME)
+                if key.startswith('.tmp_') or not os.path.isfile(manifest_path):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(manifest_path), size, entry_dir))
+        return entries
+
+    def evict(self):
+        entries = sorted(self._get_entries())
+        total_bytes = sum(size for last_used, size, entry_dir in entries)
+        while entries and total_bytes > self.max_bytes:
+            last_used, size, entry_dir = entries.pop(0)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
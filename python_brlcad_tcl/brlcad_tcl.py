@@ -4,10 +4,17 @@ import re
 import sys
 import math
 import inspect
+import threading
+import shutil
 import numbers
 import datetime
+import uuid
+import json
+import tempfile
 import subprocess
-from itertools import chain
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from itertools import chain, islice
 from abc import ABCMeta
 from abc import abstractmethod
 from collections import OrderedDict, deque
@@ -18,7 +25,19 @@ from PIL import Image
 
 # internal
 from . import vmath
+from . import nirt
+from . import stl_tools
 from .brlcad_name_tracker import BrlcadNameTracker
+from .tool_tracer import ToolTracer, run_tool
+from .artifact_cache import ArtifactCache
+from .checkpoint import JobManifest
+from .progress import ExportProgress
+from .raster_buffer import RasterBuffer
+from . import raster_buffer
+from . import slice_writers
+from . import csg
+from . import cross_section
+from . import artifact_cache
 
 
 def check_cmdline_args(file_path):
@@ -85,8 +104,82 @@ def intersect(*args):
     return ' u {}'.format(' + '.join(args))
 
 
+# mged is told to print this after every script entry, so its output can be tied back to the entry
+MGED_ENTRY_MARKER = '@@brlcad_tcl_entry@@'
+# mged output lines that mean a command failed
+MGED_ERROR_RE = re.compile(r'invalid command name|wrong # args|^\s*usage:|error|already exists|does not exist|not found',
+                           re.IGNORECASE)
+
+
+class ScriptStringList(list):
+    """
+    The list of tcl script entries, which also remembers the brlcad_tcl method (and the line of the
+    calling code) that appended every entry, so that mged errors can be reported against them.
+    """
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.origins = [None] * len(self)
+
+    def append(self, item):
+        list.append(self, item)
+        self.origins.append(_get_caller_origin())
+
+    def extend(self, items):
+        items = list(items)
+        list.extend(self, items)
+        self.origins.extend([_get_caller_origin()] * len(items))
+
+    def get_origin(self, index):
+        origin = self.origins[index] if index < len(self.origins) else None
+        if origin is None:
+            return 'unknown origin'
+        return '{}() called from {}, line {}'.format(*origin)
+
+
+def _get_caller_origin():
+    # walk out of this file: the last frame in it is the brlcad_tcl method, the next one its caller
+    frame = sys._getframe(2)
+    method_name = frame.f_code.co_name
+    while frame is not None and frame.f_code.co_filename == _get_caller_origin.__code__.co_filename:
+        method_name = frame.f_code.co_name
+        frame = frame.f_back
+    if frame is None:
+        return (method_name, '?', 0)
+    return (method_name, frame.f_code.co_filename, frame.f_lineno)
+
+
+class MgedError(object):
+    def __init__(self, entry_index, entry, origin, message):
+        self.entry_index = entry_index
+        self.entry = entry
+        self.origin = origin
+        self.message = message
+
+    def __str__(self):
+        return 'mged error on script entry {} ({}): {}\n    {}'.format(self.entry_index, self.origin,
+                                                                      self.message.strip(), self.entry.strip())
+    __repr__ = __str__
+
+
+def _run_command(cmd, database=None):
+    # module-level, so that it can also be handed to a multiprocessing pool
+    print('running: {}'.format(cmd))
+    return run_tool(cmd, database=database, stderr_to_stdout=True)[2]
+
+
+def _run_command_args(args):
+    return _run_command(*args)
+
+
 class brlcad_tcl():
-    def __init__(self, tcl_filepath, title, make_g=False, make_stl=False, stl_quality=None, units='mm', verbose=False):
+    RASTER_ENGINES = ('nirt', 'voxel', 'rt', 'numpy')
+    # the output_option_kwargs that the 'numpy' and 'rt' raster engines take
+    CSG_RASTER_OPTIONS = ('bmp_output_name', 'slice_index', 'num_pix_x', 'num_pix_y', 'output_greyscale',
+                          'output_depth', 'memmap_dir')
+    RT_RASTER_OPTIONS = CSG_RASTER_OPTIONS + ('num_cpus',)
+
+    def __init__(self, tcl_filepath, title, make_g=False, make_stl=False, stl_quality=None, units='mm', verbose=False,
+                 tracer=None, cache=None):
         #if not os.path.isfile(self.output_filepath):
         #    abs_path = os.path.abspath(self.output_filepath)
         #    if not
@@ -97,10 +190,21 @@ class brlcad_tcl():
         self.stl_quality = stl_quality
         self._input_file_path_no_ext = self._remove_file_extension(self.tcl_filepath)
 
-        self.script_string_list = ['title {}\nunits {}\n'.format(title, units)]
+        self.script_string_list = ScriptStringList(['title {}\nunits {}\n'.format(title, units)])
         self.units = units
         self.name_tracker = BrlcadNameTracker()
         self.verbose = verbose
+        self.last_stl_summary = None
+        # the MgedErrors of the last save_g
+        self.mged_errors = []
+        # every mged, g-stl, rt and nirt run is recorded in self.tracer.events
+        self.tracer = tracer if tracer is not None else ToolTracer()
+        # an ArtifactCache (or the directory for one) that the tools' outputs are looked up in first
+        self.cache = ArtifactCache(cache) if isinstance(cache, str) else cache
+        # (path, number of script entries, their hash) of what the database file was last built from
+        self._built_g = None
+        # held while the database file is (re)built, and while slice regions are added to or killed from it
+        self._g_lock = threading.RLock()
 
     def _remove_file_extension(self, file_path):
         return os.path.splitext(file_path)[0]
@@ -143,28 +247,159 @@ class brlcad_tcl():
                 if is_exe(exe_file):
                     return exe_file
 
-    def save_g(self):
-        self.g_path = self._input_file_path_no_ext + '.g'
-        # try to remove a database file of the same name if it exists
-        try:
-            os.remove(self.g_path)
-            print('removed {}?: {}'.format(self.g_path, os.path.isfile(self.g_path)))
-        except Exception as e:
-            if not e.errno == 2:
-                print('WARNING: could not remove: {}\nuse different file name, or delete the file manually first!'.format(self.g_path))
-                raise (e)
-        
-        cmd = 'mged {} < {}'.format(self.g_path, self.tcl_filepath)
-        cmd = [self._which('mged'), self.g_path]
-        print('running mged with command: {}'.format(cmd))
-        #proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    def _run_tool(self, cmd, input_data=None, capture_output=True, stderr_to_stdout=False):
+        """
+        run an external tool against this database, recording it in self.tracer
+        :return: (stdoutdata, stderrdata, invocation)
+        """
+        return run_tool(cmd, input_data, database=self.g_path, tracer=self.tracer,
+                        capture_output=capture_output, stderr_to_stdout=stderr_to_stdout)
 
-        if self.verbose:
-            proc = subprocess.Popen(cmd, shell=False, stdin=subprocess.PIPE)
-        else:
-            proc = subprocess.Popen(cmd, shell=False, stdin=subprocess.PIPE,
+    def _get_cache_key(self, tools, *parts):
+        """
+        the artifact cache key for running the tools (with the given other inputs) on the current script
+        """
+        return artifact_cache.make_key([(tool, artifact_cache.get_tool_version(self._which(tool))) for tool in tools],
+                                       artifact_cache.hash_script(self.script_string_list),
+                                       parts)
+
+    def _fetch_from_cache(self, key, output_paths):
+        return self.cache is not None and self.cache.fetch(key, output_paths)
+
+    def _put_in_cache(self, key, output_paths):
+        if self.cache is not None and all(os.path.isfile(p) for p in output_paths):
+            self.cache.put(key, output_paths)
+
+    def save_g(self, abort_on_error=False):
+        """
+        Feed the tcl script to mged, to create the geometry database (.g) file.
+
+        mged's output is watched while the script is fed, every error found is tied back to the script
+        entry (and the brlcad_tcl call) that caused it, and kept in self.mged_errors.
+        The database is only rebuilt when the script changed since it was last built: entries appended since
+        are fed to mged on their own, into the existing database, anything else is rebuilt from scratch.
+        :param abort_on_error:   stop mged at the first error and raise, instead of printing a warning
+        """
+        # (one at a time: the exports running at once share the database file, see create_slice_regions)
+        with self._g_lock:
+            self.g_path = self._input_file_path_no_ext + '.g'
+            num_built = self._get_num_entries_built()
+            if num_built == len(self.script_string_list):
+                if self.verbose:
+                    print('{} is up to date'.format(self.g_path))
+                return
+            cache_key = self._get_cache_key(['mged']) if self.cache is not None else None
+            if self._fetch_from_cache(cache_key, [self.g_path]):
+                self.mged_errors = []
+                self._set_built()
+                return
+            cmd = [self._which('mged'), self.g_path]
+            if num_built:
+                print('running mged with command: {} (on the {} new script entries)'.format(
+                    cmd, len(self.script_string_list) - num_built))
+            else:
+                # try to remove a database file of the same name if it exists
+                try:
+                    os.remove(self.g_path)
+                    print('removed {}?: {}'.format(self.g_path, os.path.isfile(self.g_path)))
+                except Exception as e:
+                    if not e.errno == 2:
+                        print('WARNING: could not remove: {}\nuse different file name, or delete the file manually first!'.format(self.g_path))
+                        raise (e)
+                print('running mged with command: {}'.format(cmd))
+
+            self._built_g = None
+            self.mged_errors = self._run_mged_script(cmd, self.script_string_list, first_entry=num_built,
+                                                     abort_on_error=abort_on_error)
+            if self.mged_errors:
+                if abort_on_error:
+                    raise Exception('aborted mged after the first error:\n{}'.format(self.mged_errors[0]))
+                for error in self.mged_errors:
+                    print('WARNING: {}'.format(error))
+            else:
+                self._put_in_cache(cache_key, [self.g_path])
+            self._set_built()
+
+    def _get_script_hash(self, num_entries):
+        return artifact_cache.hash_script(islice(self.script_string_list, num_entries))
+
+    def _is_script_prefix(self, num_entries, script_hash):
+        """
+        :return: whether the first num_entries of the script are still the ones that hashed to script_hash
+        """
+        return num_entries <= len(self.script_string_list) and self._get_script_hash(num_entries) == script_hash
+
+    def _set_built(self):
+        num_entries = len(self.script_string_list)
+        self._built_g = (self.g_path, num_entries, self._get_script_hash(num_entries))
+
+    def _get_num_entries_built(self):
+        """
+        :return: how many of the script's first entries the database file was built from,
+                 0 when it has to be built from scratch
+        """
+        if self._built_g is None or not os.path.isfile(self.g_path):
+            return 0
+        g_path, num_entries, script_hash = self._built_g
+        if g_path != self.g_path or not self._is_script_prefix(num_entries, script_hash):
+            return 0
+        return num_entries
+
+    def _run_mged_script(self, cmd, script, first_entry=0, abort_on_error=False):
+        """
+        Stream the script entries (from first_entry on) into mged, while reading its output.
+        :return: the list of MgedErrors found
+        """
+        errors = []
+        aborted = threading.Event()
+        # the index of the entry mged is working on, moved along by the markers printed after each one
+        current_entry = [first_entry]
+
+        with self.tracer.span('mged', cmd, self.g_path) as invocation:
+            proc = subprocess.Popen(cmd, shell=False, universal_newlines=True, stdin=subprocess.PIPE,
                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        proc.communicate(''.join(self.script_string_list))
+
+            def feed():
+                try:
+                    for i in range(first_entry, len(script)):
+                        if aborted.is_set():
+                            break
+                        entry = script[i] if script[i].endswith('\n') else script[i] + '\n'
+                        # the marker goes to stderr, like mged's error messages, so they stay in order
+                        data = '{}puts stderr "{} {}"\n'.format(entry, MGED_ENTRY_MARKER, i)
+                        proc.stdin.write(data)
+                        invocation.bytes_in += len(data)
+                    proc.stdin.close()
+                except (IOError, OSError):
+                    # mged went away, i.e. it was killed after an error
+                    pass
+
+            def watch(stream):
+                for line in iter(stream.readline, ''):
+                    invocation.bytes_out += len(line)
+                    if line.startswith(MGED_ENTRY_MARKER):
+                        current_entry[0] = int(line.split()[1]) + 1
+                        continue
+                    if self.verbose:
+                        sys.stdout.write(line)
+                    if MGED_ERROR_RE.search(line):
+                        i = min(current_entry[0], len(script) - 1)
+                        origin = script.get_origin(i) if isinstance(script, ScriptStringList) else 'unknown origin'
+                        errors.append(MgedError(i, script[i], origin, line))
+                        if abort_on_error and not aborted.is_set():
+                            aborted.set()
+                            proc.kill()
+
+            threads = [threading.Thread(target=feed),
+                       threading.Thread(target=watch, args=(proc.stdout,)),
+                       threading.Thread(target=watch, args=(proc.stderr,))]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+            invocation.exit_status = proc.wait()
+        return errors
         #proc.communicate(['opendb {}\n'.format(self.g_path)] + self.script_string_list)
         #proc.communicate()
         
@@ -174,11 +409,43 @@ class brlcad_tcl():
         self.save_g()
         self.save_stl(objects_to_render)
 
-    def save_stl(self, objects_to_render, output_path=None):
+    def save_stl(self, objects_to_render, output_path=None, triangle_budget=None, max_retries=5,
+                 binary=False, weld_tolerance=None):
+        """
+        :param objects_to_render:  list of region names to tessellate
+        :param output_path:        the STL path, defaults to the tcl path with the .stl extension
+        :param triangle_budget:    if set, tolerances are chosen per region from its bounding-box
+                                   and this total number of triangles, instead of stl_quality
+        :param max_retries:        how many times a region is re-tessellated coarser when over budget
+        :param binary:             convert g-stl's ASCII output into a (much smaller) binary STL
+        :param weld_tolerance:     with binary, weld the vertices within this distance (model units) of each other
+                                   and drop the facets that collapse (see stl_tools.ascii_stl_to_binary)
+        :return:                   the STL path
+        """
         if output_path is None:
             stl_path = self._input_file_path_no_ext + '.stl'
         else:
             stl_path = output_path if output_path.endswith('.stl') else '{}.stl'.format(output_path)
+        cache_key = self._get_cache_key(['g-stl'], objects_to_render, self.stl_quality, triangle_budget, max_retries,
+                                        binary, weld_tolerance) if self.cache is not None else None
+        if self._fetch_from_cache(cache_key, [stl_path]):
+            self.last_stl_summary = None
+            return stl_path
+        if triangle_budget:
+            self._save_stl_adaptive(objects_to_render, stl_path, triangle_budget, max_retries)
+        else:
+            self._save_stl(objects_to_render, stl_path)
+        if binary:
+            self.last_stl_summary = stl_tools.ascii_stl_to_binary(stl_path, weld_tolerance=weld_tolerance)
+            print('binary STL {}: {} triangles, bounds {} to {} ({} degenerate removed, {} vertices welded)'
+                  .format(*self.last_stl_summary))
+        self._put_in_cache(cache_key, [stl_path])
+        return stl_path
+
+    def _save_stl(self, objects_to_render, stl_path):
+        self.tracer.record(_run_command(self._get_stl_cmd(objects_to_render, stl_path), self.g_path))
+
+    def _get_stl_cmd(self, objects_to_render, stl_path):
         obj_str = ' '.join(objects_to_render)
         cmd = 'g-stl -o {}'.format(stl_path)
 
@@ -209,10 +476,61 @@ class brlcad_tcl():
 
         # Add the paths
         cmd = '{} {} {}'.format(cmd, self.g_path, obj_str)
+        return cmd
 
-        print('running: {}'.format(cmd))
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        proc.communicate()
+    def _save_stl_adaptive(self, objects_to_render, stl_path, triangle_budget, max_retries):
+        """
+        Tessellate each region on its own, with tolerances derived from the region's size and its share of the
+        triangle budget (in proportion to the surface area of its bounding-box), retrying coarser until it fits,
+        then concatenate the per-region solids into stl_path.
+        The smallest regions are tessellated first, and what they leave of their share goes to the rest.
+        """
+        bounding_boxes = [self.get_opposing_corners_bounding_box(self.get_bounding_box_coords(obj_name))
+                          for obj_name in objects_to_render]
+        areas = [stl_tools.get_bounding_box_area(xyz1, xyz2) for xyz1, xyz2 in bounding_boxes]
+        remaining_budget = triangle_budget
+        remaining_area = sum(areas)
+        temp_dir = tempfile.mkdtemp(prefix='brlcad_tcl_stl_')
+        try:
+            region_stl_paths = [os.path.join(temp_dir, '{}.stl'.format(i)) for i in range(len(objects_to_render))]
+            for num_done, i in enumerate(sorted(range(len(objects_to_render)), key=lambda j: areas[j])):
+                obj_name = objects_to_render[i]
+                if remaining_area > 0:
+                    share = areas[i] / remaining_area
+                else:
+                    # only flat or empty bounding-boxes left, shared out evenly
+                    share = 1. / (len(objects_to_render) - num_done)
+                region_budget = max(int(remaining_budget * share), 1)
+                tolerances = stl_tools.get_tolerances_for_budget(stl_tools.get_bounding_box_size(*bounding_boxes[i]),
+                                                                 region_budget, self.units)
+                region_stl_path = region_stl_paths[i]
+                for attempt in range(max_retries + 1):
+                    cmd = 'g-stl -o {} {} {} {}'.format(region_stl_path, tolerances.as_args(), self.g_path, obj_name)
+                    print('running: {}'.format(cmd))
+                    output, _, invocation = self._run_tool(cmd, stderr_to_stdout=True)
+                    if invocation.exit_status != 0 or not os.path.isfile(region_stl_path):
+                        raise Exception('g-stl failed on {} with the tolerances {} (exit status {}{}):\n{}'.format(
+                            obj_name, tolerances.as_args(), invocation.exit_status,
+                            '' if os.path.isfile(region_stl_path) else ', no STL written',
+                            '\n'.join((output or '').strip().splitlines()[-20:])))
+                    num_triangles = stl_tools.count_ascii_stl_triangles(region_stl_path)
+                    if num_triangles <= region_budget:
+                        break
+                    if attempt == max_retries:
+                        print('WARNING: {} still has {} triangles (budget {}) after {} retries'
+                              .format(obj_name, num_triangles, region_budget, max_retries))
+                        break
+                    # overshoot a little, so we don't land just above the budget again
+                    tolerances = tolerances.coarsened(1.2 * num_triangles / float(region_budget))
+                remaining_budget = max(remaining_budget - num_triangles, 0)
+                remaining_area -= areas[i]
+
+            with open(stl_path, 'w') as out_f:
+                for region_stl_path in region_stl_paths:
+                    with open(region_stl_path, 'r') as in_f:
+                        shutil.copyfileobj(in_f, out_f)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
     def export_image_from_Z(self, item_name, width, height, output_path=None, azimuth=None, elevation=None):
         if output_path is None:
@@ -221,6 +539,10 @@ class brlcad_tcl():
             azimuth = -90
         if elevation is None:
             elevation = -90
+        cache_key = self._get_cache_key(['rt'], item_name, width, height, azimuth, elevation,
+                                        os.path.splitext(output_path)[1]) if self.cache is not None else None
+        if self._fetch_from_cache(cache_key, [output_path]):
+            return output_path
 
         try:
             os.remove(output_path)
@@ -231,44 +553,113 @@ class brlcad_tcl():
         cmd = 'rt -a {} -l3 -e {} -w {} -n {} -o {} {} {}'\
               .format(azimuth, elevation, width, height, output_path, self.g_path, item_name)
         print('\nrunning: {}'.format(cmd))
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        proc.communicate()
+        self._run_tool(cmd, stderr_to_stdout=True)
+        self._put_in_cache(cache_key, [output_path])
         return output_path
 
-    def create_slice_regions(self, slice_thickness, max_slice_x, max_slice_y, output_format=''):
-        tl_names = self.get_top_level_object_names()
-        xyz1, xyz2 = self.get_opposing_corners_bounding_box(self.get_bounding_box_coords_for_entire_db(tl_names))
-        #print 'bb of all items {} to {}'.format(xyz1, xyz2)
+    def export_cross_section(self, object_names, z, output_path, output_format=None, bounds=None,
+                             resolution=cross_section.DEFAULT_RESOLUTION, geometry=None):
+        """
+        Write the exact contours of where the plane at height z cuts the objects (all of them intersected,
+        like the slice regions), worked out from the script itself (see cross_section), without BRL-CAD.
+        :param output_format:  'svg' or 'dxf' (default: output_path's extension)
+        :param bounds:         (min_x, min_y, max_x, max_y) of the SVG drawing (default: the contours')
+        :param geometry:       the csg.Geometry of the script (default: read from this one's script)
+        :return:               the shapely geometry of the section
+        """
+        if geometry is None:
+            geometry = csg.Geometry.from_script(self.script_string_list)
+        if output_format is None:
+            output_format = os.path.splitext(output_path)[1].lstrip('.').lower()
+        names = [object_names] if isinstance(object_names, str) else list(object_names)
+        section_node = csg.Combination('r', [('u', names[0])] + [('+', name) for name in names[1:]])
+        section = cross_section.get_cross_section(geometry, section_node, z, resolution)
+        cross_section.write_section(section, output_path, output_format, bounds, geometry.units)
+        return section
 
+    @staticmethod
+    def check_buildable_bounds(xyz1, xyz2, max_slice_x, max_slice_y):
         if abs(xyz1[0] - xyz2[0]) > max_slice_x:
             raise Exception('x dimension exceeds buildable bounds {} {} {}'.format(xyz1[0], xyz2[0], max_slice_x))
         if abs(xyz1[1] - xyz2[1]) > max_slice_y:
             raise Exception('y dimension exceeds buildable bounds')
 
-        slice_coords = list(self.get_object_slice_coords(slice_thickness, xyz1, xyz2))
-        self.slice_coords = []
-        temps_to_kill = []
+    def create_slice_regions(self, slice_thickness, max_slice_x, max_slice_y, output_format='', tl_names=None,
+                             bounding_box=None, slice_coords=None):
+        """
+        Add a region per slice to the database file: its box intersected with the top level objects.
+        The regions only go into the database, not into the script, so they don't change what it hashes to
+        (see save_g, and the artifact cache): remove them again with remove_slice_regions(temps_to_kill).
+        Every call names its regions apart (slice<i>_<id>_num.r), so the exports running at once on the same
+        object don't touch each other's.
+        :param tl_names:      the top level objects to slice (default: the database's)
+        :param bounding_box:  their (xyz1, xyz2) (default: worked out with mged)
+        :param slice_coords:  the (min, max) corners of every slice (default: slice_thickness thick slices,
+                              see get_object_slice_coords)
+        :return:              ([(slice region name, slice's (min, max) corners)], temps_to_kill)
+        """
+        if tl_names is None:
+            tl_names = self.get_top_level_object_names()
+        if bounding_box is None:
+            bounding_box = self.get_opposing_corners_bounding_box(self.get_bounding_box_coords_for_entire_db(tl_names))
+        xyz1, xyz2 = bounding_box
+        #print 'bb of all items {} to {}'.format(xyz1, xyz2)
 
+        self.check_buildable_bounds(xyz1, xyz2, max_slice_x, max_slice_y)
+
+        if slice_coords is None:
+            slice_coords = list(self.get_object_slice_coords(slice_thickness, xyz1, xyz2))
+        slice_regions = []
+        temps_to_kill = []
+        # unique to this call
+        slice_id = uuid.uuid4().hex[:8]
+        slice_script = []
+        # the second word of an entry is the name of whatever it makes (or kills, or edits): keep clear of them all
+        names_in_use = set(entry.split()[1] for entry in self.script_string_list if len(entry.split()) > 1)
+
+        def get_free_name(name):
+            prefix, suffix = os.path.splitext(name)
+            i = 1
+            while name in names_in_use:
+                name = '{}_{}{}'.format(prefix, i, suffix)
+                i += 1
+            names_in_use.add(name)
+            return name
+
+        tl_name_plussed = ' + '.join(tl_names)
         for i, object_slice_bb_coords in enumerate(slice_coords):
-            # = self.name_tracker.get_next_name(self, 'slice_bb{}_num.s'.format(i))
-            slice_bb_temp = self.cuboid(object_slice_bb_coords[0], object_slice_bb_coords[1])
+            c1, c2 = object_slice_bb_coords
+            slice_bb_temp = get_free_name('slice{}_{}_bb.s'.format(i, slice_id))
+            slice_script.append('in {} rpp {} {} {} {} {} {}\n'.format(slice_bb_temp, c1[0], c2[0], c1[1], c2[1],
+                                                                       c1[2], c2[2]))
             temps_to_kill.append(slice_bb_temp)
             # finally create a region (a special combination that means it's going to be rendered)
-            # by unioning together the main combinations we just created
-            tl_name_plussed = ' + '.join(tl_names)
-            # slice_reg_name = self.name_tracker.get_next_name(self, 'slice{}_num.c'.format(i))
-            
-            slice_reg_name = self.region('slice{}_num.r'.format(i),
-                                              'u {} + {}'.format(slice_bb_temp, tl_name_plussed)
-                                              )
+            # by intersecting the slice's box with the top level objects
+            slice_reg_name = get_free_name('slice{}_{}_num.r'.format(i, slice_id))
+            slice_script.append('r {} u {} + {}\n'.format(slice_reg_name, slice_bb_temp, tl_name_plussed))
             temps_to_kill.append(slice_reg_name)
-            self.slice_coords.append((slice_reg_name, object_slice_bb_coords))
-        self.save_tcl()
-        self.save_g()
-        # [self.kill(temp_bb) for temp_bb in temps_to_kill]
-        # self.save_tcl()
-        # self.save_g()
-        return self.slice_coords, temps_to_kill
+            slice_regions.append((slice_reg_name, object_slice_bb_coords))
+        with self._g_lock:
+            self.save_g()
+            print('adding {} slice regions to {}'.format(len(slice_coords), self.g_path))
+            errors = self._run_mged_script([self._which('mged'), self.g_path], slice_script)
+            if errors:
+                self.remove_slice_regions(temps_to_kill)
+                raise Exception('could not create the slice regions:\n{}'.format(errors[0]))
+            self.slice_coords = slice_regions
+        return slice_regions, temps_to_kill
+
+    def remove_slice_regions(self, temps_to_kill):
+        """
+        Kill the objects that create_slice_regions added to the database file, the script isn't touched
+        :param temps_to_kill:  the names create_slice_regions returned
+        """
+        if not temps_to_kill:
+            return
+        # destroy the objects in the reverse order of how they were created, the regions before their boxes
+        with self._g_lock:
+            self._run_mged_script([self._which('mged'), self.g_path],
+                                  ['kill {}\n'.format(name) for name in reversed(temps_to_kill)])
 
     def get_object_raster_from_z_projection(self,
                                             slice_region_name,
@@ -280,234 +671,873 @@ class brlcad_tcl():
                                             num_pix_x=1024,
                                             num_pix_y=1024,
                                             output_greyscale=True,
-                                            threading_event=None):
-        num_pix_x = math.ceil(num_pix_x)
-        num_pix_y = math.ceil(num_pix_y)
+                                            threading_event=None,
+                                            g_path=None,
+                                            num_bands=1,
+                                            adaptive_cell_size=None,
+                                            job_manifest=None,
+                                            output_depth=False,
+                                            memmap_dir=None,
+                                            slice_writer=None,
+                                            slice_index=None,
+                                            progress=None):
+        """
+        :param g_path:              the database to shoot at (default: this one's), i.e. a private copy for a worker
+        :param num_bands:           split the raster into this many bands of rows, each shot by its own NIRT process
+                                    at the same time (for very high-resolution slices)
+        :param adaptive_cell_size:  only fire a ray every this many pixels, and at full resolution around the edges
+                                    found between them (the same image, for features bigger than this many pixels)
+        :param job_manifest:        a checkpoint.JobManifest, to save every band as soon as it's done,
+                                    and to reuse the bands a previous, interrupted run saved
+        :param output_depth:        write the depth of the hits as 16-bit (to .png or .tif), instead of greyscale
+        :param memmap_dir:          keep the raster in a file in this directory while it's shot, instead of RAM
+        :param slice_writer:        a slice_writers.BackgroundWriter to hand the raster to (as slice number
+                                    slice_index), instead of saving it to bmp_output_name
+        :param progress:            a progress.ExportProgress to count the rays fired and parsed in
+        """
         # each 'bit' can be -1, 0, or 1
         x_bit, y_bit, z_bit = [int(b) for b in ray_destination_dir_xyz]
         # only one non-zero value can be provided
         assert([x_bit!=0, y_bit!=0, z_bit!=0].count(True) == 1)
 
+        if threading_event:
+            threading_event.set()
+        xs, ys = self._get_raster_grid(model_min, model_max, num_pix_x, num_pix_y)
+        # uint8 greyscale, uint16 depth, or binary, packed 8 pixels per byte (unless the random access of
+        # adaptive sampling needs a byte per pixel)
+        raster = RasterBuffer(int(math.ceil(num_pix_x)), int(math.ceil(num_pix_y)),
+                              raster_buffer.get_kind(output_greyscale, output_depth), slice_thickness,
+                              packed=not adaptive_cell_size, memmap_dir=memmap_dir)
+        im = raster.array
+
+        def handle_hits(int_x, int_y, hits):
+            raster.set_hits(int_x, int_y, hits[:, nirt.LOS])
+
+        if adaptive_cell_size:
+            self._shoot_adaptive([slice_region_name], g_path, (x_bit, y_bit, z_bit), xs, ys, model_max[2], im,
+                                 handle_hits, adaptive_cell_size, num_bands, progress)
+        else:
+            on_band_done = None
+            bands_done = set()
+            if job_manifest is not None:
+                if slice_index is not None:
+                    band_name = 'slice{}.band{{}}'.format(slice_index)
+                else:
+                    band_name = os.path.basename(bmp_output_name) + '.band{}'
+                for i, band in enumerate(self._get_bands(len(xs), num_bands)):
+                    band_im = job_manifest.load_partial(band_name.format(i))
+                    if band_im is not None and band_im.shape == (len(band), im.shape[1]):
+                        im[band[0]:band[-1] + 1] = band_im
+                        bands_done.add(i)
+                        if progress is not None:
+                            progress.add_rays_skipped(len(band) * len(ys))
+
+                def on_band_done(i, band):
+                    job_manifest.save_partial(band_name.format(i), im[band[0]:band[-1] + 1])
+
+            self._shoot_grid([slice_region_name], g_path, (x_bit, y_bit, z_bit), xs, ys, model_max[2], handle_hits,
+                             num_bands, skip_bands=bands_done, on_band_done=on_band_done, progress=progress)
+        if slice_writer is not None:
+            # encoded and written from the writer's thread, while the next slice is shot
+            slice_writer.put(slice_index, raster)
+            return bmp_output_name
+        try:
+            raster.save(bmp_output_name)
+        finally:
+            raster.close()
+        return bmp_output_name
+
+    def get_object_voxels_from_z_projection(self,
+                                            object_names,
+                                            model_min,
+                                            model_max,
+                                            z_boundaries,
+                                            slice_thickness,
+                                            num_pix_x=1024,
+                                            num_pix_y=1024,
+                                            g_path=None,
+                                            num_bands=1,
+                                            progress=None):
+        """
+        Fire every ray of the raster once, straight down through the whole model, and keep every segment
+        it spends inside the objects, instead of one ray pass per slice region.
+        :param z_boundaries:     the Z coordinates of the slices' bottoms, then the top of the last slice
+        :param slice_thickness:  the slices' thickness, or an array of every slice's
+        :param progress:         a progress.ExportProgress to count the rays fired and parsed in
+        :return:              a numpy array of shape (num_pix_x, num_pix_y, number of slices), the fraction of
+                              slice_thickness that each voxel's column is filled for
+        """
+        xs, ys = self._get_raster_grid(model_min, model_max, num_pix_x, num_pix_y)
+        z_boundaries = numpy.asarray(z_boundaries, dtype=float)
+        volume = numpy.zeros((int(math.ceil(num_pix_x)), int(math.ceil(num_pix_y)), len(z_boundaries) - 1),
+                             dtype=numpy.float32)
+        # how many segments are spread over the slices at once (each one needs a row of len(z_boundaries))
+        segments_per_chunk = max(1, 2**22 // len(z_boundaries))
+
+        def handle_hits(int_x, int_y, hits):
+            for i in range(0, len(hits), segments_per_chunk):
+                chunk = hits[i:i + segments_per_chunk]
+                z_low = numpy.minimum(chunk[:, nirt.Z_IN], chunk[:, nirt.Z_OUT])[:, None]
+                z_high = numpy.maximum(chunk[:, nirt.Z_IN], chunk[:, nirt.Z_OUT])[:, None]
+                # how much of every segment is below every boundary, the differences are what's in every slice
+                filled_below = numpy.clip(z_boundaries[None, :] - z_low, 0, z_high - z_low)
+                coverage = numpy.diff(filled_below, axis=1) / slice_thickness
+                numpy.add.at(volume, (int_x[i:i + segments_per_chunk], int_y[i:i + segments_per_chunk]), coverage)
+
+        self._shoot_grid(object_names, g_path or self.g_path, (0, 0, -1), xs, ys, z_boundaries[-1], handle_hits,
+                         num_bands, first_only=False, progress=progress)
+        return volume
+
+    def get_object_raster_from_csg(self,
+                                   object_names,
+                                   model_min,
+                                   model_max,
+                                   slice_thickness,
+                                   bmp_output_name=None,
+                                   num_pix_x=1024,
+                                   num_pix_y=1024,
+                                   output_greyscale=True,
+                                   output_depth=False,
+                                   memmap_dir=None,
+                                   geometry=None,
+                                   slice_writer=None,
+                                   slice_index=None,
+                                   progress=None):
+        """
+        The raster that get_object_raster_from_z_projection makes of a slice region (the model_min to model_max box,
+        intersected with all of object_names), ray-traced by csg's NumPy ray-caster from the script itself:
+        no database, mged or NIRT needed (for the primitives and booleans that csg supports).
+        :param geometry:  the csg.Geometry of the script (default: read from this one's script)
+        :param progress:  a progress.ExportProgress to count the rays in
+        """
+        if geometry is None:
+            geometry = csg.Geometry.from_script(self.script_string_list)
+        xs, ys = self._get_raster_grid(model_min, model_max, num_pix_x, num_pix_y)
+        raster = RasterBuffer(int(math.ceil(num_pix_x)), int(math.ceil(num_pix_y)),
+                              raster_buffer.get_kind(output_greyscale, output_depth), slice_thickness,
+                              memmap_dir=memmap_dir)
+        slice_box = csg.Rpp([model_min[0], model_max[0], model_min[1], model_max[1], model_min[2], model_max[2]])
+        slice_region = csg.Combination('r', [('u', slice_box)] + [('+', name) for name in object_names])
+        # a band of X rows at a time, fired straight down from the top of the slice, like NIRT's raster
+        rows_per_band = max(1, csg.RAYS_PER_BLOCK // max(len(ys), 1))
+        for first_x in range(0, len(xs), rows_per_band):
+            int_x, int_y = numpy.meshgrid(numpy.arange(first_x, min(first_x + rows_per_band, len(xs))),
+                                          numpy.arange(len(ys)), indexing='ij')
+            int_x = int_x.ravel()
+            int_y = int_y.ravel()
+            origins = numpy.column_stack([xs[int_x], ys[int_y], numpy.full(len(int_x), model_max[2], dtype=float)])
+            rays, depths = geometry.shoot_first_hits(slice_region, origins, (0, 0, -1))
+            raster.set_hits(int_x[rays], int_y[rays], depths)
+            if progress is not None:
+                progress.add_rays(len(origins))
+        if slice_writer is not None:
+            slice_writer.put(slice_index, raster)
+            return bmp_output_name
+        try:
+            raster.save(bmp_output_name)
+        finally:
+            raster.close()
+        return bmp_output_name
+
+    def get_object_raster_from_rt(self,
+                                  slice_region_name,
+                                  model_min,
+                                  model_max,
+                                  slice_thickness,
+                                  bmp_output_name=None,
+                                  num_pix_x=1024,
+                                  num_pix_y=1024,
+                                  output_greyscale=True,
+                                  output_depth=False,
+                                  memmap_dir=None,
+                                  g_path=None,
+                                  num_cpus=None,
+                                  slice_writer=None,
+                                  slice_index=None,
+                                  progress=None):
+        """
+        Render the slice region with rt, orthographic and straight down, with a pixel on every ray of the NIRT raster
+        (see get_object_raster_from_z_projection), then threshold the image into the same raster.
+        rt doesn't give the depth of the hits, so every pixel rt didn't leave as the background is filled
+        for the full slice_thickness (the slice regions are at most slice_thickness deep anyway).
+        :param num_cpus:  how many CPUs rt renders with (its -P, default: all of them)
+        :param progress:  a progress.ExportProgress to count the rays in
+        """
+        g_path = g_path or self.g_path
+        xs, ys = self._get_raster_grid(model_min, model_max, num_pix_x, num_pix_y)
+        raster = RasterBuffer(int(math.ceil(num_pix_x)), int(math.ceil(num_pix_y)),
+                              raster_buffer.get_kind(output_greyscale, output_depth), slice_thickness,
+                              memmap_dir=memmap_dir)
+        filled = numpy.zeros((raster.num_pix_x, raster.num_pix_y), dtype=bool)
+        if len(xs) and len(ys):
+            filled[:len(xs), :len(ys)] = self._render_rt_mask(slice_region_name, g_path, xs[0], ys[0], len(xs),
+                                                              len(ys), self._get_raster_step(model_min, model_max,
+                                                                                             num_pix_x, num_pix_y),
+                                                              model_max[2] + slice_thickness, num_cpus)
+            if progress is not None:
+                progress.add_rays(len(xs) * len(ys))
+        raster.set_coverage(filled)
+        if slice_writer is not None:
+            slice_writer.put(slice_index, raster)
+            return bmp_output_name
+        try:
+            raster.save(bmp_output_name)
+        finally:
+            raster.close()
+        return bmp_output_name
+
+    def _render_rt_mask(self, object_name, g_path, x0, y0, num_x, num_y, step_size, eye_z, num_cpus=None):
+        """
+        :return: a boolean array of shape (num_x, num_y), True where the ray fired straight down
+                 from (x0 + ix * step_size, y0 + iy * step_size, eye_z) hit object_name
+        """
+        # rt's view is given in mm, whatever the database's units
+        mm = stl_tools.UNITS_TO_MM.get(self.units, 1.)
+        cell_size = step_size * mm
+        # rt fires the pixel (a, b) from the view's lower-left corner + (a, b) cells, the corner being
+        # half the view size left of (and half the view size / aspect below) the eye
+        eye = ((x0 + num_x * step_size / 2.) * mm, (y0 + num_y * step_size / 2.) * mm, eye_z * mm)
+        handle, pix_path = tempfile.mkstemp(suffix='.pix')
+        os.close(handle)
+        try:
+            # the background is black, and rt never leaves a pixel that hit something exactly the background color
+            args = [self._which('rt'), '-P{}'.format(num_cpus or multiprocessing.cpu_count()),
+                    '-w', str(num_x), '-n', str(num_y), '-V', repr(num_x / float(num_y)),
+                    '-g', repr(cell_size), '-G', repr(cell_size), '-C', '0/0/0', '-o', pix_path,
+                    '-c', 'viewsize {!r}'.format(num_x * cell_size),
+                    '-c', 'orientation 0 0 0 1',
+                    '-c', 'eye_pt {!r} {!r} {!r}'.format(*eye),
+                    g_path, object_name]
+            print('\nrunning: {}'.format(' '.join(args)))
+            output, _, invocation = run_tool(args, database=g_path, tracer=self.tracer, stderr_to_stdout=True)
+            # .pix files are RGB bytes, a row at a time from the bottom row up
+            pix = numpy.fromfile(pix_path, dtype=numpy.uint8)
+            if invocation.exit_status != 0 or pix.size != num_x * num_y * 3:
+                raise Exception('rt failed to render {}, exit status {}:\n{}'.format(object_name,
+                                                                                   invocation.exit_status, output))
+            return pix.reshape(num_y, num_x, 3).any(axis=2).T
+        finally:
+            os.remove(pix_path)
+
+    @staticmethod
+    def _get_raster_step(model_min, model_max, num_pix_x, num_pix_y):
         model_width = model_max[0] - model_min[0]
         model_length = model_max[1] - model_min[1]
-        x_offset = (0-model_min[0])
-        y_offset = (0-model_min[1])
 
-        x_scale = num_pix_x/model_width
-        y_scale = num_pix_y/model_length
+        # (as floats: the bounds and pixel counts can all be ints)
+        x_step = float(model_width)/int(math.ceil(num_pix_x))
+        y_step = float(model_length)/int(math.ceil(num_pix_y))
 
-        x_step = model_width/num_pix_x
-        y_step = model_length/num_pix_y
+        return max(x_step, y_step)
 
-        step_size = max(x_step, y_step)
-        
-        
-        if threading_event:
-            threading_event.set()
-        # create a list for the NIRT command lines to be queued
-        nirt_script_path = '{}.nirt'.format(self._input_file_path_no_ext)
-        nirt_script_file = open(nirt_script_path, 'w')
-
-        # set the direction to fire rays in
-        nirt_script_file.write('dir {} {} {}\n'.format(x_bit, y_bit, z_bit))
-        nirt_script_file.write('units {}\n'.format(self.units))
-        x = model_min[0]
-        z = model_max[2]
-
-        xstepcount = 0
-        # the raster loops, loop over each Y for each X location
-        while x < model_max[0]:
-            # start Y at the minimum for each Y loop
-            y = model_min[1]
-            ystepcount = 0
-            # loop while Y is less than the model's max Y
-            while y < model_max[1]:
-                # move around the model in X and Y axes, using the determined step-size
-                nirt_script_file.write('xyz {} {} {}\n'.format(x, y, z))
-                # fire a ray
-                nirt_script_file.write('s\n')
-                # step in Y
-                y += step_size
-                ystepcount += 1
-            # make sure we aren't going out-of-bounds
-            assert ystepcount <= num_pix_y, (ystepcount, num_pix_y)
-            # step in X
-            x += step_size
-            xstepcount += 1
-        # make sure we aren't going out-of-bounds
-        assert xstepcount <= num_pix_x, (xstepcount, num_pix_x)
-        nirt_script_file.close()
-        
-        # the -s command might speed things up???
-        #args = ['nirt', '-s', self.g_path, slice_region_name]
-        args = 'nirt -s {} {} < {}'.format(self.g_path, slice_region_name, nirt_script_path)
-        print('\nrunning: {}'.format(args))
-
-        # pass the commands to NIRT, get NIRT's response
-        p = subprocess.Popen(args,
-                             stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE, shell=True)
-        outp = p.communicate()
-
-        chunks = []
-        # break up NIRT's response by newline
-        out_lines = outp[0].split('\n')
-        err_lines = outp[1].split('\n')
-        
-        im = numpy.zeros((num_pix_x, num_pix_y))
-        # r = re.compile(r'\((\s*-?\d+\.?\d+)\s+(-?\d+\.?\d+)\s+(-?\d+\.?\d+)\)')
-        r = re.compile(r'\((\s*-?\d+\.?\d+)\s+(-?\d+\.?\d+)\s+(-?\d+\.?\d+)\)\s+(-?\d+\.?\d+)')
-        hit_description_header = '    Region Name               Entry (x y z)              LOS  Obliq_in Attrib'
-        missed_target = 'You missed the target'
-        state = 0
-
-        decade = len(out_lines)/10
-        for il, l in enumerate(out_lines):
-            # if il%decade==0:
-            #     print '{}% completed parsing NIRT output'.format(float(il)/len(out_lines)*100)
-
-            # check if we are starting a new section IF:
-            # we are just starting, or we got at least one coordinate
-            if (state == 0 or state == 3) and l.startswith('Origin'):
-                    # and out_lines[out_lines.index(l)+1].startswith('Direction'):
-                state = 1
-                chunks.append({'Origin': l, 'Coords': []})
-            elif state == 1:
-                state = 2
-                chunks[-1]['Direction'] = l
-            elif state == 2:
-                if l.startswith(hit_description_header) or (not l):
-                    continue
-                # we got a hit or miss
-                state = 3
-                if missed_target in l:
-                    continue
-                # store the line for later
-                chunks[-1]['Coords'].append(l)
-                m = r.search(l)
-                if not m:
-                    print('first 10 lines out:\n{}'.format(out_lines[:10]))
-                    print('first err:\n{}'.format(err_lines[:1]))
-                    raise Exception("regex didn't work to find coordinates! report this bug. on input line {}".format(l))
-                x, y, z, depth_of_hit = m.groups()
-
-                zeroed_x = (float(x) - model_min[0])
-                zeroed_y = (float(y) - model_min[1])
-                if zeroed_x:
-                    floated_x = zeroed_x/step_size
-                    int_x = int(round(floated_x))
-                    # enable this if you are paranoid about the math
-                    # numpy.testing.assert_approx_equal(floated_x, int_x, 4, 'these were not equal:\n{}\n{}'.format(floated_x, int_x))
-                else:
-                    int_x = 0
-                if zeroed_y:
-                    floated_y = zeroed_y/step_size
-                    int_y = int(round(floated_y))
-                    # enable this if you are paranoid about the math
-                    # numpy.testing.assert_approx_equal(floated_y, int_y, 4, 'these were not equal:\n{}\n{}'.format(floated_y, int_y))
-                else:
-                    int_y = 0
+    @classmethod
+    def _get_raster_grid(cls, model_min, model_max, num_pix_x, num_pix_y):
+        step_size = cls._get_raster_step(model_min, model_max, num_pix_x, num_pix_y)
+        return nirt.get_raster_grid(model_min, model_max, step_size, int(math.ceil(num_pix_x)),
+                                    int(math.ceil(num_pix_y)))
 
-                if output_greyscale:
-                    im[int_x, int_y] = (float(depth_of_hit)/slice_thickness)*255
-                else:
-                    im[int_x, int_y] = 1
+    @staticmethod
+    def _get_bands(num_x, num_bands):
+        # every band is a contiguous range of X indices
+        return [band for band in numpy.array_split(numpy.arange(num_x), max(1, num_bands)) if len(band)]
 
-            elif state==3:
-                # we already got a hit for this spot, so we don't need to check again
-                continue
+    def _shoot_grid(self, object_names, g_path, direction, xs, ys, z, handle_hits, num_bands=1, first_only=True,
+                    skip_bands=(), on_band_done=None, progress=None):
+        """
+        fire a ray from every (x, y, z) of the xs/ys grid, handle_hits(x indices, y indices, hits) is called
+        for every block of hits (see nirt.iter_hits)
+        :param num_bands:     split the grid into this many bands of rows, each shot by its own NIRT process
+                              at the same time (handle_hits is then called from several threads, for disjoint rows)
+        :param skip_bands:    the indices of the bands not to shoot
+        :param on_band_done:  called with (band index, band's X indices) when a band is done
+        :param progress:      a progress.ExportProgress to count the rays fired and parsed in
+        """
+        bands = [(i, band) for i, band in enumerate(self._get_bands(len(xs), num_bands)) if i not in skip_bands]
 
-        if output_greyscale:
-            result = Image.fromarray(im.astype(numpy.uint8))
-        else:
-            result = Image.fromarray((im * 255).astype(numpy.uint8))
-        result.save(bmp_output_name)
-        return bmp_output_name
+        def shoot_band(band_index_and_band):
+            band_index, band = band_index_and_band
+            first_x_index = band[0]
+
+            def handle_band_hits(ray_indices, hits):
+                # the rays were fired X outer, Y inner, so the shot's index is its pixel
+                handle_hits(first_x_index + ray_indices // len(ys), ray_indices % len(ys), hits)
+
+            commands = nirt.get_raster_commands(direction, self.units, xs[band[0]:band[-1] + 1], ys, z)
+            self._run_nirt(object_names, g_path, commands, len(band) * len(ys), handle_band_hits, first_only,
+                           progress)
+            if on_band_done is not None:
+                on_band_done(band_index, band)
+
+        self._run_in_bands(shoot_band, bands)
+
+    def _shoot_points(self, object_names, g_path, direction, int_x, int_y, xs, ys, z, handle_hits, num_bands=1,
+                      progress=None):
+        """
+        like _shoot_grid, for the pixels (int_x[i], int_y[i]) of the xs/ys grid only
+        """
+        bands = [band for band in numpy.array_split(numpy.arange(len(int_x)), max(1, num_bands)) if len(band)]
+
+        def shoot_band(band):
+            band_x = int_x[band[0]:band[-1] + 1]
+            band_y = int_y[band[0]:band[-1] + 1]
+
+            def handle_band_hits(ray_indices, hits):
+                handle_hits(band_x[ray_indices], band_y[ray_indices], hits)
+
+            commands = nirt.get_point_commands(direction, self.units, xs[band_x], ys[band_y], z)
+            self._run_nirt(object_names, g_path, commands, len(band), handle_band_hits, progress=progress)
+
+        self._run_in_bands(shoot_band, bands)
+
+    @staticmethod
+    def _run_in_bands(shoot_band, bands):
+        if len(bands) == 1:
+            shoot_band(bands[0])
+        elif bands:
+            pool = ThreadPool(len(bands))
+            try:
+                pool.map(shoot_band, bands)
+            finally:
+                pool.close()
+                pool.join()
+
+    def _shoot_adaptive(self, object_names, g_path, direction, xs, ys, z, im, handle_hits, cell_size, num_bands=1,
+                        progress=None):
+        """
+        Quadtree sampling of the xs/ys grid: fire a ray every cell_size pixels, then keep splitting the cells
+        whose corners (as written into im by handle_hits) disagree, along with their neighbours, until
+        every pixel is either shot or inside a cell with 4 equal corners, which is filled with their value.
+        Every feature bigger than a cell gets its edges shot at full resolution.
+        """
+        num_x, num_y = len(xs), len(ys)
+        # cells are halved down to single pixels, so their size needs to be a power of 2
+        cell_size = 2 ** int(math.ceil(math.log(max(cell_size, 1), 2)))
+        if num_x < 2 or num_y < 2 or cell_size < 2:
+            return self._shoot_grid(object_names, g_path, direction, xs, ys, z, handle_hits, num_bands,
+                                    progress=progress)
+
+        # (a view, the raster can be bigger than the grid of rays)
+        im = im[:num_x, :num_y]
+        shot = numpy.zeros((num_x, num_y), dtype=bool)
+
+        def get_cell_corners(size):
+            # the first and last pixel index of every cell, the last cell can be smaller
+            num_cells_x = -(-(num_x - 1) // size)
+            num_cells_y = -(-(num_y - 1) // size)
+            x0 = numpy.arange(num_cells_x) * size
+            y0 = numpy.arange(num_cells_y) * size
+            return x0, numpy.minimum(x0 + size, num_x - 1), y0, numpy.minimum(y0 + size, num_y - 1)
+
+        def shoot_corners(size, active):
+            need = numpy.zeros((num_x, num_y), dtype=bool)
+            x0, x1, y0, y1 = get_cell_corners(size)
+            for corner_x in (x0, x1):
+                for corner_y in (y0, y1):
+                    need[numpy.ix_(corner_x, corner_y)] |= active
+            need &= ~shot
+            int_x, int_y = numpy.nonzero(need)
+            self._shoot_points(object_names, g_path, direction, int_x, int_y, xs, ys, z, handle_hits, num_bands,
+                               progress)
+            shot[int_x, int_y] = True
+
+        size = cell_size
+        x0, x1, y0, y1 = get_cell_corners(size)
+        active = numpy.ones((len(x0), len(y0)), dtype=bool)
+        shoot_corners(size, active)
+        while size > 1:
+            x0, x1, y0, y1 = get_cell_corners(size)
+            corner = im[numpy.ix_(x0, y0)]
+            uniform = ((corner == im[numpy.ix_(x1, y0)]) & (corner == im[numpy.ix_(x0, y1)]) &
+                       (corner == im[numpy.ix_(x1, y1)]))
+            # split the cells with an edge through them, and their neighbours, in case the edge only grazes them
+            split = numpy.pad(active & ~uniform, 1, 'constant')
+            split = (split[:-2, :-2] | split[:-2, 1:-1] | split[:-2, 2:] | split[1:-1, :-2] | split[1:-1, 1:-1] |
+                     split[1:-1, 2:] | split[2:, :-2] | split[2:, 1:-1] | split[2:, 2:])
+            # fill the rest, every pixel belongs to the cell at its pixel index // size
+            fill = active & ~split
+            pixel_cell_x = numpy.minimum(numpy.arange(num_x) // size, len(x0) - 1)
+            pixel_cell_y = numpy.minimum(numpy.arange(num_y) // size, len(y0) - 1)
+            pixel_fill = fill[numpy.ix_(pixel_cell_x, pixel_cell_y)] & ~shot
+            im[pixel_fill] = corner[numpy.ix_(pixel_cell_x, pixel_cell_y)][pixel_fill]
+
+            size //= 2
+            x0, x1, y0, y1 = get_cell_corners(size)
+            active = split.repeat(2, axis=0).repeat(2, axis=1)[:len(x0), :len(y0)]
+            shoot_corners(size, active)
+
+    def _run_nirt(self, object_names, g_path, commands, num_rays, handle_hits, first_only=True, progress=None):
+        """
+        stream the commands through one NIRT process,
+        handle_hits(ray indices, hits) is called for every block of hits (see nirt.iter_hits)
+        :param progress:  a progress.ExportProgress to count the rays fired and parsed in
+        """
+        g_path = g_path or self.g_path
+        # the -s command might speed things up???
+        args = [self._which('nirt'), '-s', g_path] + list(object_names)
+        print('\nrunning: {}'.format(' '.join(args)))
+
+        with self.tracer.span('nirt', args, g_path) as invocation:
+            p = subprocess.Popen(args, universal_newlines=True,
+                                 stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+            if progress is not None:
+                commands = nirt.count_shots(commands, progress.add_rays_fired)
+            num_rays_parsed = [0]
+
+            def on_rays_parsed(num):
+                num_rays_parsed[0] += num
+                if progress is not None:
+                    progress.add_rays_parsed(num)
+
+            # the ray commands are streamed straight into NIRT's stdin, while its output is read
+            writer = nirt.start_stdin_writer(p, commands, invocation)
+            err_reader = nirt.start_stream_reader(p.stderr, invocation)
+            try:
+                # NIRT's output is parsed while it's still shooting, a block of hits at a time
+                for ray_indices, hits in nirt.iter_hits(p.stdout, invocation, first_only=first_only,
+                                                        on_rays_parsed=on_rays_parsed):
+                    if ray_indices.max() >= num_rays:
+                        print('first err:\n{}'.format(err_reader.lines[:1]))
+                        raise Exception("NIRT answered more shots than it was fired! report this bug.")
+                    handle_hits(ray_indices, hits)
+            except Exception:
+                # don't leave the writer blocked on a NIRT nobody is reading from anymore
+                p.kill()
+                raise
+            finally:
+                writer.join()
+                err_reader.join()
+                invocation.exit_status = p.wait()
+            # a NIRT that crashed part way leaves the rest of the shots blank, which must not pass for misses
+            if invocation.exit_status != 0 or num_rays_parsed[0] != num_rays:
+                raise Exception('NIRT failed on {} (exit status {}, answered {} of {} shots):\n{}'
+                                .format(g_path, invocation.exit_status, num_rays_parsed[0], num_rays,
+                                        ''.join(err_reader.lines[-20:])))
 
     def export_model_slices(self,
                             num_slices_desired,
                             max_slice_x, max_slice_y,
-                            output_format='stl', output_option_kwargs={}, output_path_format=None):
+                            output_format='stl', output_option_kwargs={}, output_path_format=None,
+                            processes=None, copy_database=False, raster_engine='nirt', checkpoint=None,
+                            slice_format='jpg', progress=None, adaptive_slicing=False, max_slice_thickness=None):
         """
 
         :param num_slices_desired:    the number of equal-sized slices you want to end up with
         :param max_slice_x:           the maximum X dimension you want to export (in model units)
         :param max_slice_y:           the maximum Y dimension you want to export (in model units)
-        :param output_format:         either 'raster' or 'stl' currently
-        :param output_option_kwargs:  i.e. 'raster' format supports 'greyscale_output':True/False
+        :param output_format:         'raster', 'stl', or 'svg' / 'dxf' for the exact contours of every slice
+                                      (cut through its middle, see cross_section, without BRL-CAD)
+        :param output_option_kwargs:  i.e. 'raster' format supports 'greyscale_output':True/False,
+                                      'svg' / 'dxf' support 'resolution' (segments per quarter of an ellipse)
         :param output_path_format:    a string with two {} that the g-database path and slice-num are inserted into
-        :return:                      nothing
+        :param processes:             how many g-stl / NIRT processes to run at once (default: all cores)
+        :param copy_database:         'raster' format: give every NIRT process its own copy of the database,
+                                      in its own scratch directory
+        :param raster_engine:         'raster' format: 'nirt' to shoot a region per slice,
+                                      'voxel' to shoot the whole model once, and cut every slice out of the segments,
+                                      'rt' to render a region per slice with rt (on all CPUs, so one slice at a time
+                                      by default), thresholded to the filled pixels,
+                                      'numpy' to ray-trace the script itself with csg's ray-caster, without
+                                      BRL-CAD (only for the primitives it supports, see csg)
+        :param checkpoint:            True (or the path of the manifest file) to record every finished slice
+                                      (and band of a slice), so rerunning an interrupted export resumes it
+                                      (not for the slice formats that write a single file)
+        :param slice_format:          'raster' format: 'jpg', 'png' or 'tiff' for a file per slice, or a single
+                                      'multipage_tiff', 'npy' volume or 'rle' file (see slice_writers)
+        :param progress:              True for a progress bar on the terminal, or a progress.ProgressObserver
+                                      (or a function, or a list of them) to report the rays fired and parsed,
+                                      the slices done, the throughput and the ETA to (see progress)
+        :param adaptive_slicing:      keep the num_slices_desired equal slices only where the model's
+                                      cross-section changes, and merge the ones where it doesn't
+                                      (see get_adaptive_slice_coords)
+        :param max_slice_thickness:   adaptive_slicing: the thickest a slice can be (default: no limit)
+        :return:                      the (z_min, z_max) of every slice, also written (with every slice's
+                                      thickness and output path) to a .slices.json next to the outputs,
+                                      i.e. the input file's name.slices.json (see read_slice_table)
         """
+        progress = ExportProgress.make(progress)
+        # the slice regions made along the way (see create_slice_regions), got rid of whatever happens
+        temps_to_kill = []
+        try:
+            return self._export_model_slices(num_slices_desired, max_slice_x, max_slice_y, output_format,
+                                      output_option_kwargs, output_path_format, processes, copy_database,
+                                      raster_engine, checkpoint, slice_format, adaptive_slicing,
+                                      max_slice_thickness, progress, temps_to_kill)
+        finally:
+            self.remove_slice_regions(temps_to_kill)
+            if progress is not None:
+                progress.finish()
+
+    def _export_model_slices(self, num_slices_desired, max_slice_x, max_slice_y, output_format, output_option_kwargs,
+                             output_path_format, processes, copy_database, raster_engine, checkpoint, slice_format,
+                             adaptive_slicing, max_slice_thickness, progress, temps_to_kill):
+        if output_format == 'raster' and raster_engine not in self.RASTER_ENGINES:
+            raise Exception('unknown raster engine: {}, not one of: {}'.format(raster_engine,
+                                                                              ', '.join(self.RASTER_ENGINES)))
         orig_path = self._input_file_path_no_ext
-        orig_tcl = self.script_string_list
+        if not output_path_format:
+            output_path_format = slice_writers.get_default_path_format(slice_format) if output_format == 'raster' \
+                else '{}{}'
+        single_file = output_format == 'raster' and slice_writers.writes_single_file(slice_format)
+
+        def get_output_path(i):
+            if output_format != 'raster':
+                return '{}.{}'.format(output_path_format.format(orig_path, i), output_format)
+            return slice_writers.get_output_path(slice_format, output_path_format.format(orig_path, '{}'), i)
+
+        # i.e. pump.slices.json for pump0.stl, pump1.stl, ... or pump_slices.rle
+        slice_table_path = '{}.slices.json'.format(os.path.splitext(output_path_format.format(orig_path, ''))[0])
+
+        def get_output_paths(num_slices):
+            # (the slice table included)
+            return [get_output_path(i) for i in range(1 if single_file else num_slices)] + [slice_table_path]
+
         self.save_tcl()
-        self.save_g()
+        cache_key = None
+        if self.cache is not None or checkpoint:
+            cache_key = self._get_cache_key(['mged', 'nirt', 'rt', 'g-stl'], num_slices_desired, max_slice_x, max_slice_y,
+                                            output_format, output_option_kwargs, raster_engine, slice_format,
+                                            os.path.splitext(output_path_format)[1],
+                                            *((max_slice_thickness,) if adaptive_slicing else ()))
+        manifest = None
+        if checkpoint and single_file:
+            print("not checkpointing, the '{}' slice format writes a single file".format(slice_format))
+        elif checkpoint:
+            manifest_path = checkpoint if isinstance(checkpoint, str) else '{}_slices.manifest.json'.format(orig_path)
+            manifest = JobManifest(manifest_path, cache_key)
+        if self.cache is not None:
+            cached_paths = self.cache.get(cache_key)
+            if cached_paths is not None and \
+                    self.cache.fetch(cache_key, [get_output_path(i) for i in range(len(cached_paths) - 1)] +
+                                     [slice_table_path]):
+                return self.read_slice_table(slice_table_path)
+        geometry = None
+        if output_format in cross_section.FORMATS or output_format == 'raster' and raster_engine == 'numpy':
+            # everything is worked out from the script itself, no database needed
+            geometry = csg.Geometry.from_script(self.script_string_list)
+            tl_names = geometry.tops()
+        else:
+            self.save_g()
+            tl_names = self.get_top_level_object_names()
         # calculate the slice thickness needed to get the number of slices requested
-        tl_names = self.get_top_level_object_names()
         print('top level names about to be exported: {}'.format(tl_names))
-        xyz1, xyz2 = self.get_opposing_corners_bounding_box(self.get_bounding_box_coords_for_entire_db(tl_names))
+        if geometry is not None:
+            xyz1, xyz2 = geometry.bbox(tl_names)
+        else:
+            xyz1, xyz2 = self.get_opposing_corners_bounding_box(self.get_bounding_box_coords_for_entire_db(tl_names))
         print('top level items bounding-box: {} to {}'.format(xyz1, xyz2))
 
         slice_thickness = abs(xyz2[2] - xyz1[2]) / float(num_slices_desired)
-
-        # now create the slice regions
-        slice_coords, temps_to_kill = self.create_slice_regions(slice_thickness, max_slice_x, max_slice_y)
-
-        import threading
-        threads = []
+        if adaptive_slicing:
+            z_extents = self._get_z_extents(tl_names, xyz1, xyz2, geometry)
+            all_slice_coords = list(self.get_adaptive_slice_coords(slice_thickness, xyz1, xyz2, z_extents,
+                                                                   max_slice_thickness))
+            print('adaptive slicing: {} slices, instead of {}'.format(len(all_slice_coords), num_slices_desired))
+            slice_thicknesses = [sc[1][2] - sc[0][2] for sc in all_slice_coords]
+        else:
+            all_slice_coords = list(self.get_object_slice_coords(slice_thickness, xyz1, xyz2))
+            slice_thicknesses = [slice_thickness] * len(all_slice_coords)
+        # the slices can be of different thicknesses, and the outputs don't say which: the table does
+        slice_zs = self._write_slice_table(slice_table_path, all_slice_coords, get_output_path)
+
+        if output_format == 'raster' and raster_engine == 'voxel':
+            # no slice regions needed
+            self.check_buildable_bounds(xyz1, xyz2, max_slice_x, max_slice_y)
+            slice_coords = all_slice_coords
+            writer = self._get_slice_writer(slice_format, output_path_format.format(orig_path, '{}'),
+                                            len(slice_coords), manifest, get_output_path, progress)
+            try:
+                self._export_voxel_slices(tl_names, slice_coords, numpy.array(slice_thicknesses), output_option_kwargs,
+                                          writer, manifest, progress)
+            except Exception:
+                writer.close(raise_errors=False)
+                raise
+            writer.close()
+            if self.cache is not None:
+                self._put_in_cache(cache_key, get_output_paths(len(slice_coords)))
+            return slice_zs
+
+        if output_format in cross_section.FORMATS:
+            self.check_buildable_bounds(xyz1, xyz2, max_slice_x, max_slice_y)
+            section_kwargs = dict((k, v) for k, v in output_option_kwargs.items() if k in ('resolution',))
+            slice_coords = all_slice_coords
+            slices_to_do = [i for i in range(len(slice_coords))
+                            if manifest is None or not manifest.is_done('slice{}'.format(i))]
+            if progress is not None:
+                progress.set_totals(len(slice_coords), num_slices_done=len(slice_coords) - len(slices_to_do))
+            for i in slices_to_do:
+                sc = slice_coords[i]
+                # every drawing the size of the whole model, so that the slices line up
+                self.export_cross_section(tl_names, (sc[0][2] + sc[1][2]) / 2., get_output_path(i), output_format,
+                                          bounds=(xyz1[0], xyz1[1], xyz2[0], xyz2[1]), geometry=geometry,
+                                          **section_kwargs)
+                if manifest is not None:
+                    manifest.mark_done('slice{}'.format(i), [get_output_path(i)])
+                if progress is not None:
+                    progress.add_slices_done()
+            if self.cache is not None:
+                self._put_in_cache(cache_key, get_output_paths(len(slice_coords)))
+            return slice_zs
+
+        if geometry is not None:
+            # no slice regions needed either, the ray-caster cuts every slice out of the top level objects
+            self.check_buildable_bounds(xyz1, xyz2, max_slice_x, max_slice_y)
+            slice_coords = [(tl_names, sc) for sc in all_slice_coords]
+        else:
+            # now create the slice regions, in the database only (export_model_slices kills them when it's done)
+            slice_coords, slice_temps = self.create_slice_regions(slice_thickness, max_slice_x, max_slice_y,
+                                                                  tl_names=tl_names, bounding_box=(xyz1, xyz2),
+                                                                  slice_coords=all_slice_coords)
+            temps_to_kill.extend(slice_temps)
+
+        raster_jobs = []
+        stl_cmds = []
         for i, (slice_obj_name, sc) in enumerate(slice_coords):
+            if manifest is not None and manifest.is_done('slice{}'.format(i)):
+                continue
             if output_format == 'raster':
-                if not output_path_format:
-                    output_path_format='{}{}.jpg'
-                e = threading.Event()
-                output_filename = output_path_format.format(self._input_file_path_no_ext, i)
-                default_raster_kwargs = {'bmp_output_name': output_filename,
-                                         'threading_event': e}
+                default_raster_kwargs = {'bmp_output_name': get_output_path(i),
+                                         'slice_index': i}
                 default_raster_kwargs.update(output_option_kwargs)
-                t = threading.Thread(target=self.get_object_raster_from_z_projection,
-                                     args=(slice_obj_name,
-                                           sc[0],
-                                           sc[1],
-                                           slice_thickness),
-                                     kwargs=default_raster_kwargs)
-                t.daemon = True
-                t.start()
-                # try waiting for NIRT to finish, before starting the next thread
-                e.wait()
-                # TODO: improve speed of NIRT jobs if possible
-                # calling multiple NIRT processes at once doesn't seem to work
-                # just wait for each thread to finish
-                t.join()
-                threads.append(t)
-                # allow a max of 4 NIRT process threads
-                while len(threads) >= 4:
-                    threads.pop(0).join()
+                if raster_engine == 'rt':
+                    default_raster_kwargs = dict((k, v) for k, v in default_raster_kwargs.items()
+                                                 if k in self.RT_RASTER_OPTIONS)
+                elif raster_engine == 'numpy':
+                    default_raster_kwargs = dict((k, v) for k, v in default_raster_kwargs.items()
+                                                 if k in self.CSG_RASTER_OPTIONS)
+                    default_raster_kwargs['geometry'] = geometry
+                elif manifest is not None:
+                    default_raster_kwargs['job_manifest'] = manifest
+                if progress is not None:
+                    default_raster_kwargs['progress'] = progress
+                raster_jobs.append(((slice_obj_name, sc[0], sc[1], slice_thicknesses[i]), default_raster_kwargs))
             elif output_format == 'stl':
-                if not output_path_format:
-                    output_path_format = '{}{}'
-
-                self._input_file_path_no_ext = output_path_format.format(orig_path, i)
+                # every slice gets its own path, so nothing shared is touched while the pool runs
+                stl_cmds.append((i, (self._get_stl_cmd([slice_obj_name], get_output_path(i)), self.g_path)))
 
-                if i == 0:
-                    self.run_and_save_stl([slice_obj_name])
+        if progress is not None:
+            # the slices a checkpoint resumes from are done already
+            if output_format == 'raster':
+                num_slices_done = len(slice_coords) - len(raster_jobs)
+                # (adaptive sampling doesn't know how many rays it fires beforehand)
+                rays_per_slice = None if output_option_kwargs.get('adaptive_cell_size') else \
+                    self._get_num_rays_per_slice(xyz1, xyz2, output_option_kwargs)
+                if rays_per_slice is None:
+                    progress.set_totals(len(slice_coords), num_slices_done=num_slices_done)
                 else:
-                    self.save_stl([slice_obj_name])
+                    progress.set_totals(len(slice_coords), len(slice_coords) * rays_per_slice, num_slices_done,
+                                        num_slices_done * rays_per_slice)
+            else:
+                progress.set_totals(len(slice_coords), num_slices_done=len(slice_coords) - len(stl_cmds))
 
         # post-loop output-format specific stuff
         if output_format == 'raster':
-            while threads:
-                threads.pop(0).join()
-            self.script_string_list = []
-            # get rid of the slices, so they don't show up as top-level objects if user exports slices again
-            # destroy the objects in the reverse order of how they were created
-            # [self.kill(temp_bb) for temp_bb in reversed(temps_to_kill)]
-            # self.save_tcl()
-            # self.save_g()
-            self.script_string_list = orig_tcl
-            self.save_tcl()
+            if raster_engine == 'rt':
+                # every rt renders on all the CPUs it's given, so share them out between the ones running at once
+                processes = processes or 1
+                for args, kwargs in raster_jobs:
+                    kwargs.setdefault('num_cpus', max(1, multiprocessing.cpu_count() // processes))
+            # the formats written in order hold on to the slices that are done early, as many as can be shot at once
+            # twice over (the slices after those wait for their turn before they're shot)
+            writer = self._get_slice_writer(slice_format, output_path_format.format(orig_path, '{}'),
+                                            len(slice_coords), manifest, get_output_path, progress,
+                                            max_waiting=2 * (processes or multiprocessing.cpu_count()))
+
+            def rasterize_job(job):
+                args, kwargs = job
+                try:
+                    writer.wait_for_turn(kwargs['slice_index'])
+                    return self._rasterize_slice(args, kwargs, copy_database, raster_engine)
+                except Exception:
+                    # the slices after this one would wait for their turn forever
+                    writer.abort()
+                    raise
+
+            # every job is a NIRT (or rt) process of its own, or NumPy (which lets go of the GIL while it works),
+            # so threads are enough to run them at once
+            pool = ThreadPool(processes)
+            try:
+                for args, kwargs in raster_jobs:
+                    kwargs['slice_writer'] = writer
+                # a job at a time, in order, so the slice whose turn it is always gets shot
+                pool.map(rasterize_job, raster_jobs, chunksize=1)
+            except Exception:
+                writer.close(raise_errors=False)
+                raise
+            finally:
+                pool.close()
+                pool.join()
+            writer.close()
         elif output_format == 'stl':
-            self._input_file_path_no_ext = orig_path
+            pool = multiprocessing.Pool(processes)
+            try:
+                # in order, as they finish
+                for (i, cmd), invocation in zip(stl_cmds, pool.imap(_run_command_args, [c for i, c in stl_cmds])):
+                    self.tracer.record(invocation)
+                    if manifest is not None and invocation.exit_status == 0 and os.path.isfile(get_output_path(i)):
+                        manifest.mark_done('slice{}'.format(i), [get_output_path(i)])
+                    if progress is not None:
+                        progress.add_slices_done()
+            finally:
+                pool.close()
+                pool.join()
+        if self.cache is not None:
+            self._put_in_cache(cache_key, get_output_paths(len(slice_coords)))
+        return slice_zs
+
+    def _write_slice_table(self, path, slice_coords, get_output_path):
+        """
+        :return: the (z_min, z_max) of every slice
+        """
+        slice_zs = [(float(c1[2]), float(c2[2])) for c1, c2 in slice_coords]
+        slices = [{'index': i, 'z_min': z_min, 'z_max': z_max, 'thickness': z_max - z_min, 'path': get_output_path(i)}
+                  for i, (z_min, z_max) in enumerate(slice_zs)]
+        with open(path, 'w') as f:
+            json.dump({'units': self.units, 'slices': slices}, f, indent=1, sort_keys=True)
+        return slice_zs
+
+    @staticmethod
+    def read_slice_table(path):
+        """
+        :return: the (z_min, z_max) of every slice in the slice table at path (see export_model_slices)
+        """
+        with open(path) as f:
+            return [(s['z_min'], s['z_max']) for s in json.load(f)['slices']]
+
+    @staticmethod
+    def _get_slice_writer(slice_format, path_format, num_slices, manifest, get_output_path, progress=None,
+                          max_waiting=None):
+        """
+        :param max_waiting:  the formats written in order: how many slices can be ahead of the next one to write
+        :return:             a started slice_writers.BackgroundWriter, that records the slices it wrote in the manifest
+                             (and counts them in progress, an ExportProgress)
+        """
+        def on_written(i):
+            if manifest is not None:
+                manifest.mark_done('slice{}'.format(i), [get_output_path(i)])
+                manifest.clear_partials('slice{}.'.format(i))
+            if progress is not None:
+                progress.add_slices_done()
+
+        writer = slice_writers.make_slice_writer(slice_format, path_format, num_slices, max_waiting)
+        return slice_writers.BackgroundWriter(writer, on_written=on_written)
+
+    def _get_num_rays_per_slice(self, xyz1, xyz2, output_option_kwargs):
+        # (the bounding box's corners can come in any order)
+        xs, ys = self._get_raster_grid(numpy.minimum(xyz1, xyz2), numpy.maximum(xyz1, xyz2),
+                                       output_option_kwargs.get('num_pix_x', 1024),
+                                       output_option_kwargs.get('num_pix_y', 1024))
+        return len(xs) * len(ys)
+
+    def _export_voxel_slices(self, object_names, slice_coords, slice_thickness, output_option_kwargs, writer,
+                             manifest=None, progress=None):
+        all_done = manifest is not None and all(manifest.is_done('slice{}'.format(i))
+                                                for i in range(len(slice_coords)))
+        if progress is not None:
+            # the rays are fired once, for all the slices (so they're all done, or none is)
+            num_rays = self._get_num_rays_per_slice(slice_coords[0][0], slice_coords[-1][1], output_option_kwargs)
+            progress.set_totals(len(slice_coords), num_rays, *((len(slice_coords), num_rays) if all_done else ()))
+        if all_done:
+            return
+        z_boundaries = [sc[0][2] for sc in slice_coords] + [slice_coords[-1][1][2]]
+        voxel_kwargs = dict((k, v) for k, v in output_option_kwargs.items()
+                            if k in ('num_pix_x', 'num_pix_y', 'num_bands'))
+        volume = self.get_object_voxels_from_z_projection(object_names, slice_coords[0][0], slice_coords[-1][1],
+                                                          z_boundaries, slice_thickness, progress=progress,
+                                                          **voxel_kwargs)
+        kind = raster_buffer.get_kind(output_option_kwargs.get('output_greyscale', True),
+                                      output_option_kwargs.get('output_depth', False))
+        for i in range(volume.shape[2]):
+            raster = RasterBuffer(volume.shape[0], volume.shape[1], kind)
+            raster.set_coverage(volume[:, :, i])
+            writer.put(i, raster)
+
+    def _rasterize_slice(self, args, kwargs, copy_database=False, raster_engine='nirt'):
+        rasterize = {'rt': self.get_object_raster_from_rt,
+                     'numpy': self.get_object_raster_from_csg}.get(raster_engine,
+                                                                   self.get_object_raster_from_z_projection)
+        # (the numpy engine doesn't read the database)
+        if not copy_database or raster_engine == 'numpy':
+            return rasterize(*args, **kwargs)
+        scratch_dir = tempfile.mkdtemp(prefix='{}_slice_'.format(raster_engine))
+        try:
+            g_path = os.path.join(scratch_dir, os.path.basename(self.g_path))
+            shutil.copyfile(self.g_path, g_path)
+            return rasterize(*args, g_path=g_path, **kwargs)
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    def _get_z_extents(self, object_names, xyz1, xyz2, geometry=None):
+        """
+        :return: the (z_low, z_high, varies) of the objects' primitives (see csg.Node.get_z_extents),
+                 from the script's geometry, or probed with NIRT when csg doesn't support it
+        """
+        if geometry is None:
+            try:
+                geometry = csg.Geometry.from_script(self.script_string_list)
+            except csg.UnsupportedGeometry as e:
+                print('probing the model with NIRT for adaptive slicing, since: {}'.format(e))
+                return self._probe_z_extents(object_names, xyz1, xyz2)
+        return geometry.get_z_extents(object_names)
+
+    def _probe_z_extents(self, object_names, xyz1, xyz2, num_probes=64):
+        """
+        Approximate the z_extents, with the segments that a num_probes x num_probes grid of rays, fired straight down,
+        spends inside the objects: every one is taken for a primitive that doesn't vary. Sloped faces end the
+        segments at many different Z coordinates, so the slices through them are all kept.
+        What's between the rays is missed.
+        :return: [(z_low, z_high, False)]
+        """
+        model_min = numpy.minimum(xyz1, xyz2)
+        model_max = numpy.maximum(xyz1, xyz2)
+        xs, ys = self._get_raster_grid(model_min, model_max, num_probes, num_probes)
+        segments = []
+
+        def handle_hits(int_x, int_y, hits):
+            segments.append(numpy.sort(hits[:, [nirt.Z_IN, nirt.Z_OUT]], axis=1))
+
+        self._shoot_grid(object_names, self.g_path, (0, 0, -1), xs, ys, model_max[2], handle_hits, first_only=False)
+        if not segments:
+            return []
+        return [(z_low, z_high, False) for z_low, z_high in numpy.unique(numpy.concatenate(segments), axis=0)]
+
+    @staticmethod
+    def get_adaptive_slice_coords(slice_thickness, xyz1, xyz2, z_extents, max_slice_thickness=None):
+        """
+        Like get_object_slice_coords, with the slices that are all the same merged: runs of consecutive slices
+        that no extent of z_extents starts or ends inside of, with the same extents through them, none of
+        which varies, become one slice (of at most max_slice_thickness). The Z coordinates where the model's
+        cross-section changes are rounded to the slices they fall in, which stay as they are,
+        so there are never more slices than get_object_slice_coords makes.
+        :param z_extents:  the (z_low, z_high, varies) of the model's primitives (see csg.Node.get_z_extents)
+        """
+        slice_coords = list(brlcad_tcl.get_object_slice_coords(slice_thickness, xyz1, xyz2))
+        if not slice_coords:
+            return
+        bottoms = numpy.array([sc[0][2] for sc in slice_coords], dtype=float)[:, None]
+        tops = numpy.array([sc[1][2] for sc in slice_coords], dtype=float)[:, None]
+        z_extents = numpy.array([(z_low, z_high, varies) for z_low, z_high, varies in z_extents],
+                                dtype=float).reshape(-1, 3)
+        z_low, z_high, varies = z_extents[:, 0], z_extents[:, 1], z_extents[:, 2] != 0
+        # (so an extent that ends on a slice's boundary, give or take the rounding of it, isn't inside that slice)
+        tolerance = 1e-9 * slice_thickness
+        # slices x extents
+        overlaps = (z_low < tops - tolerance) & (z_high > bottoms + tolerance)
+        covers = (z_low <= bottoms + tolerance) & (z_high >= tops - tolerance)
+        mergeable = ~(overlaps & (varies | ~covers)).any(axis=1)
+        same_as_below = numpy.zeros(len(slice_coords), dtype=bool)
+        same_as_below[1:] = mergeable[1:] & mergeable[:-1] & (overlaps[1:] == overlaps[:-1]).all(axis=1)
+
+        max_run = len(slice_coords)
+        if max_slice_thickness:
+            # (rounded, so that i.e. 3 slices that compute to 3.0000000000000004 thick fit in 3)
+            max_run = max(int(math.floor(round(max_slice_thickness / slice_thickness, 9))), 1)
+        first = 0
+        for i in range(1, len(slice_coords) + 1):
+            if i == len(slice_coords) or not same_as_below[i] or i - first == max_run:
+                yield (slice_coords[first][0], slice_coords[i - 1][1])
+                first = i
 
     @staticmethod
     def get_object_slice_coords(slice_thickness, xyz1, xyz2):
@@ -539,11 +1569,7 @@ class brlcad_tcl():
         (e.g., "/" and "/R") be shown at the end of each object name. 
         The -u option will not show hidden objects. See also the hide command.
         """
-        proc = subprocess.Popen('mged {} "tops"'.format(self.g_path),
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                shell=True)
-        (stdoutdata, stderrdata) = proc.communicate()
+        (stdoutdata, stderrdata, invocation) = self._run_tool('mged {} "tops"'.format(self.g_path))
         # print stdoutdata
         # print stderrdata
         flattened = [segment.strip().rstrip('/R') for segment in stderrdata.strip().split()]
@@ -573,19 +1599,14 @@ class brlcad_tcl():
         else:
             make_bb_cmd = 'bb -c'
         args = 'mged {} "{} temp_box {}; l temp_box"'.format(self.g_path, make_bb_cmd, obj_name)
-        proc = subprocess.Popen(args,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                shell=True)
-        
-        (stdoutdata, stderrdata) = proc.communicate()
+        (stdoutdata, stderrdata, invocation) = self._run_tool(args)
         if auto_retry and 'invalid command name "make_bb"' in stderrdata:
             if self.verbose:
                 print('retrying this command (obj_name: {}), as stderr returned: {}'.format(obj_name, stderrdata))
             return self.get_bounding_box_coords(obj_name, not mged_post_7_26, auto_retry=False)
         elif self.verbose:
             print (stdoutdata, stderrdata)
-        subprocess.Popen('mged {} "kill temp_box"'.format(self.g_path), shell=True).communicate()
+        self._run_tool('mged {} "kill temp_box"'.format(self.g_path), capture_output=False)
 
         bb_coords = []
         # print 'stderrdata.split {}'.format(stderrdata.split('\n')[1:])
@@ -1027,7 +2048,7 @@ class brlcad_tcl():
         
         x, y, z = vertex
         
-        self.script_string_list.append( 'in {} sph {} {} {} {}'.format(name, x, y, z, radius))
+        self.script_string_list.append( 'in {} sph {} {} {} {}\n'.format(name, x, y, z, radius))
         
         return name
 
@@ -0,0 +1,108 @@
+"""
+A job manifest for long exports (i.e. hundreds of raster slices), recording every finished output
+and partial result, so a rerun of the same job (same inputs) skips what's done instead of starting from zero.
+
+The manifest is a JSON file, rewritten atomically every time something finishes:
+    {"input_hash": "...",
+     "completed": {"<name>": {"paths": [...], "sizes": [...]}, ...},
+     "partials": {"<name>": "<path of a .npy file>", ...}}
+"""
+import os
+import json
+import shutil
+import threading
+
+# external libs
+import numpy
+
+
+class JobManifest(object):
+    def __init__(self, path, input_hash):
+        """
+        :param path:        where the manifest is kept, partial results go in the '<path>.parts' directory
+        :param input_hash:  identifies the job's inputs, a manifest left by a job with other inputs is started over
+        """
+        self.path = path
+        self.input_hash = input_hash
+        self.parts_dir = path + '.parts'
+        self._lock = threading.Lock()
+        self.completed = {}
+        self.partials = {}
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            manifest = None
+        if manifest and manifest.get('input_hash') == input_hash:
+            self.completed = manifest.get('completed', {})
+            self.partials = manifest.get('partials', {})
+            if self.completed or self.partials:
+                print('resuming job from {}: {} outputs already done'.format(path, len(self.completed)))
+        else:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def is_done(self, name):
+        """
+        :return: True if name was completed, and its outputs are still there, as they were written
+        """
+        record = self.completed.get(name)
+        if record is None:
+            return False
+        for path, size in zip(record['paths'], record['sizes']):
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def mark_done(self, name, paths):
+        with self._lock:
+            self.completed[name] = {'paths': list(paths), 'sizes': [os.path.getsize(p) for p in paths]}
+            self._save()
+
+    def save_partial(self, name, array):
+        """
+        keep a partial result of an unfinished output, i.e. one band of a slice's raster
+        """
+        if not os.path.isdir(self.parts_dir):
+            try:
+                os.makedirs(self.parts_dir)
+            except OSError:
+                # another thread just made it
+                pass
+        path = os.path.join(self.parts_dir, name + '.npy')
+        temp_path = path + '.tmp.npy'
+        numpy.save(temp_path, array)
+        os.rename(temp_path, path)
+        with self._lock:
+            self.partials[name] = path
+            self._save()
+
+    def load_partial(self, name):
+        """
+        :return: the array saved as name, or None
+        """
+        path = self.partials.get(name)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            return numpy.load(path)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def clear_partials(self, prefix):
+        """
+        forget (and delete) the partial results whose names start with prefix, once their output is done
+        """
+        with self._lock:
+            for name in [name for name in self.partials if name.startswith(prefix)]:
+                try:
+                    os.remove(self.partials.pop(name))
+                except OSError:
+                    pass
+            self._save()
+
+    def _save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'input_hash': self.input_hash, 'completed': self.completed, 'partials': self.partials}, f,
+                      indent=1, sort_keys=True)
+        os.rename(temp_path, self.path)
@@ -0,0 +1,204 @@
+"""
+Exact 2D cross-sections of the geometry IR (see csg.Geometry) with a Z plane, instead of a raster of rays:
+every primitive's section is a polygon or an ellipse, and the boolean tree is applied with polygon booleans.
+The sections are written as vector contours, to SVG or DXF, so they don't depend on a raster resolution.
+
+Exact for:
+    rpp, arb8, sph and ell                in any orientation
+    rcc, trc and tgc                      with a vertical height (A and B horizontal)
+    rcc (and tgc cylinders)               with a horizontal height
+anything else raises csg.UnsupportedGeometry. Ellipses become polygons of 4 * resolution sides.
+
+Needs shapely for the polygon booleans (an optional dependency, only needed once a section is worked out).
+"""
+# external libs
+import numpy
+try:
+    from shapely import affinity
+    from shapely.geometry import MultiPoint, Point, Polygon, box
+    from shapely.ops import unary_union
+except ImportError:
+    unary_union = None
+
+from . import csg
+from .stl_tools import UNITS_TO_MM
+
+
+# how many segments a quarter of an ellipse is made of
+DEFAULT_RESOLUTION = 64
+
+# the file formats the sections can be written to
+FORMATS = ('svg', 'dxf')
+
+
+def _check_shapely():
+    if unary_union is None:
+        raise Exception('cross-sections need the shapely package (pip install shapely)')
+
+
+def get_cross_section(geometry, name_or_node, z, resolution=DEFAULT_RESOLUTION):
+    """
+    :param geometry:      a csg.Geometry
+    :param name_or_node:  the object to cut, a name in geometry or a csg.Node
+    :return:              a shapely (multi-)polygon, the object's section with the plane at height z
+    """
+    _check_shapely()
+    node = geometry.get_node(name_or_node)
+    if node is None:
+        return Polygon()
+    if isinstance(node, csg.Combination):
+        terms = []
+        for term in node.get_terms():
+            section = get_cross_section(geometry, term[0], z, resolution)
+            for op, member in term[1:]:
+                if section.is_empty:
+                    break
+                member_section = get_cross_section(geometry, member, z, resolution)
+                section = section.intersection(member_section) if op == '+' else section.difference(member_section)
+            terms.append(section)
+        return unary_union(terms) if terms else Polygon()
+    return _get_primitive_section(node, z, resolution)
+
+
+def _get_primitive_section(primitive, z, resolution):
+    if isinstance(primitive, csg.Rpp):
+        if not primitive.box_min[2] <= z <= primitive.box_max[2]:
+            return Polygon()
+        return box(primitive.box_min[0], primitive.box_min[1], primitive.box_max[0], primitive.box_max[1])
+    if isinstance(primitive, csg.Arb8):
+        return _get_arb8_section(primitive, z)
+    if isinstance(primitive, csg.Ellipsoid):
+        return _get_ellipsoid_section(primitive, z, resolution)
+    if isinstance(primitive, csg.TruncatedCone):
+        return _get_tgc_section(primitive, z, resolution)
+    raise csg.UnsupportedGeometry('no cross-section for {}'.format(type(primitive).__name__))
+
+
+def _get_ellipse(center, axis_1, axis_2, resolution):
+    """
+    :return: the polygon of the ellipse with the (2D) semi-axes axis_1 and axis_2
+    """
+    circle = Point(0, 0).buffer(1, resolution)
+    return affinity.affine_transform(circle, [axis_1[0], axis_2[0], axis_1[1], axis_2[1], center[0], center[1]])
+
+
+def _get_arb8_section(arb, z):
+    # the solid is convex, so its section is the convex hull of where its edges cross the plane
+    points = []
+    for face in arb.FACES:
+        for i in range(len(face)):
+            p = arb.points[face[i]]
+            q = arb.points[face[(i + 1) % len(face)]]
+            if p[2] == z:
+                points.append(p[:2])
+            elif (p[2] - z) * (q[2] - z) < 0:
+                points.append(p[:2] + (q[:2] - p[:2]) * (z - p[2]) / (q[2] - p[2]))
+    hull = MultiPoint([tuple(p) for p in points]).convex_hull
+    return hull if isinstance(hull, Polygon) else Polygon()
+
+
+def _get_ellipsoid_section(ellipsoid, z, resolution):
+    # inside is (p - vertex)^T Q (p - vertex) <= 1, which for a fixed z is an ellipse in x, y
+    q = ellipsoid.to_unit.T.dot(ellipsoid.to_unit)
+    w = z - ellipsoid.vertex[2]
+    q_xy = q[:2, :2]
+    q_xy_inverse = numpy.linalg.inv(q_xy)
+    center = ellipsoid.vertex[:2] - w * q_xy_inverse.dot(q[:2, 2])
+    size = 1 - w * w * q[2, 2] + w * w * q[:2, 2].dot(q_xy_inverse).dot(q[:2, 2])
+    if size <= 0:
+        return Polygon()
+    eigenvalues, eigenvectors = numpy.linalg.eigh(q_xy)
+    semi_axes = numpy.sqrt(size / eigenvalues)
+    return _get_ellipse(center, eigenvectors[:, 0] * semi_axes[0], eigenvectors[:, 1] * semi_axes[1], resolution)
+
+
+def _get_tgc_section(tgc, z, resolution):
+    height_length = numpy.sqrt(tgc.height.dot(tgc.height))
+    tolerance = 1e-9 * height_length
+    if abs(tgc.height[0]) <= tolerance and abs(tgc.height[1]) <= tolerance and \
+            abs(tgc.a[2]) <= tolerance and abs(tgc.b[2]) <= tolerance:
+        # upright: an ellipse, scaled from the base's to the top's
+        h = (z - tgc.vertex[2]) / tgc.height[2]
+        if not 0 <= h <= 1:
+            return Polygon()
+        scale = 1 + tgc.slope * h
+        if scale <= 0:
+            return Polygon()
+        return _get_ellipse(tgc.vertex[:2] + h * tgc.height[:2], tgc.a[:2] * scale, tgc.b[:2] * scale, resolution)
+    if abs(tgc.height[2]) <= tolerance and abs(tgc.slope) <= 1e-9:
+        # a cylinder lying down: the chord of its base at this height, swept along the height
+        normal = numpy.array([tgc.a[2], tgc.b[2]])
+        normal_length = numpy.sqrt(normal.dot(normal))
+        offset = (z - tgc.vertex[2]) / normal_length
+        if abs(offset) >= 1:
+            return Polygon()
+        foot = normal / normal_length * offset
+        along = numpy.array([-normal[1], normal[0]]) / normal_length * numpy.sqrt(1 - offset * offset)
+        ends = [(foot - along).dot([tgc.a, tgc.b]), (foot + along).dot([tgc.a, tgc.b])]
+        base = tgc.vertex[:2]
+        top = (tgc.vertex + tgc.height)[:2]
+        return Polygon([tuple(base + ends[0][:2]), tuple(base + ends[1][:2]),
+                        tuple(top + ends[1][:2]), tuple(top + ends[0][:2])]).buffer(0)
+    raise csg.UnsupportedGeometry('no exact cross-section for a tgc at an angle to the slice plane '
+                                  '(height {})'.format(list(tgc.height)))
+
+
+def _get_rings(section):
+    """
+    :return: [(exterior or not, [(x, y), ...]), ...] of every polygon in section
+    """
+    polygons = getattr(section, 'geoms', [section])
+    rings = []
+    for polygon in polygons:
+        if polygon.is_empty or not isinstance(polygon, Polygon):
+            continue
+        rings.append((True, list(polygon.exterior.coords)))
+        rings.extend((False, list(interior.coords)) for interior in polygon.interiors)
+    return rings
+
+
+def write_svg(section, path, bounds=None, units='mm'):
+    """
+    :param bounds:  (min_x, min_y, max_x, max_y) of the drawing, in model units (default: the section's)
+    :param units:   the model's units, to give the drawing its real size
+    """
+    if bounds is None:
+        bounds = section.bounds if not section.is_empty else (0, 0, 1, 1)
+    min_x, min_y, max_x, max_y = bounds
+    width = max_x - min_x
+    height = max_y - min_y
+    mm = UNITS_TO_MM.get(units, 1.)
+    # SVG's Y axis points down
+    path_data = ' '.join('M ' + ' L '.join('{!r},{!r}'.format(x, min_y + max_y - y) for x, y in ring[:-1]) + ' Z'
+                         for is_exterior, ring in _get_rings(section))
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" width="{!r}mm" height="{!r}mm" '
+                'viewBox="{!r} {!r} {!r} {!r}">\n'.format(width * mm, height * mm, min_x, min_y, width, height))
+        if path_data:
+            f.write('<path d="{}" fill="black" fill-rule="evenodd" stroke="none"/>\n'.format(path_data))
+        f.write('</svg>\n')
+
+
+def write_dxf(section, path):
+    """
+    write the contours as closed R12 POLYLINEs, in model units: the outlines on layer OUTLINE, the holes on HOLE
+    """
+    with open(path, 'w') as f:
+        f.write('0\nSECTION\n2\nENTITIES\n')
+        for is_exterior, ring in _get_rings(section):
+            layer = 'OUTLINE' if is_exterior else 'HOLE'
+            f.write('0\nPOLYLINE\n8\n{}\n66\n1\n70\n1\n10\n0.0\n20\n0.0\n30\n0.0\n'.format(layer))
+            for x, y in ring[:-1]:
+                f.write('0\nVERTEX\n8\n{}\n10\n{!r}\n20\n{!r}\n30\n0.0\n'.format(layer, x, y))
+            f.write('0\nSEQEND\n8\n{}\n'.format(layer))
+        f.write('0\nENDSEC\n0\nEOF\n')
+
+
+def write_section(section, path, output_format, bounds=None, units='mm'):
+    if output_format == 'svg':
+        write_svg(section, path, bounds, units)
+    elif output_format == 'dxf':
+        write_dxf(section, path)
+    else:
+        raise Exception('unknown cross-section format: {}, not one of: {}'.format(output_format, ', '.join(FORMATS)))
@@ -0,0 +1,612 @@
+"""
+A NumPy ray-caster for the CSG models that brlcad_tcl writes, without BRL-CAD or any subprocess.
+
+The tcl script is read back into a small geometry IR (Geometry: its primitives and combinations),
+then whole grids of rays are shot at once: every primitive gives every ray its [t_in, t_out] interval,
+and the boolean tree is applied to the rays' lists of intervals, like librt does for a single ray.
+
+Supported are the rpp, rcc, trc, tgc (with top radii in proportion to the base's), sph, ell and arb8 primitives,
+combined (comb, r or g) with u, - and +, and the kill and rm commands.
+Anything else (other primitives, or the matrix edits of oed/sed) raises UnsupportedGeometry.
+
+Intervals are a pair of arrays (starts, ends) of shape (number of rays, k): every ray's intervals sorted,
+and padded with empty (inf, inf) intervals to the k of the ray with the most of them.
+"""
+from abc import ABCMeta
+from abc import abstractmethod
+
+# external libs
+import numpy
+
+
+# how many rays are shot at once, which bounds the memory the boolean evaluation uses
+RAYS_PER_BLOCK = 65536
+
+# the commands that only change what mged shows or prints, not the geometry
+_DISPLAY_COMMANDS = ('title', 'units', 'Z', 'draw', 'comb_color')
+
+
+class UnsupportedGeometry(Exception):
+    pass
+
+
+def _empty_intervals(num_rays, k=0):
+    return numpy.full((num_rays, k), numpy.inf), numpy.full((num_rays, k), numpy.inf)
+
+
+def _single_intervals(t_in, t_out):
+    """
+    :return: the intervals of one interval per ray, (inf, inf) where t_in > t_out (a miss)
+    """
+    with numpy.errstate(invalid='ignore'):
+        miss = ~(t_in <= t_out)
+    t_in = numpy.where(miss, numpy.inf, t_in)
+    t_out = numpy.where(miss, numpy.inf, t_out)
+    return t_in[:, None], t_out[:, None]
+
+
+def _contains(intervals, ts):
+    """
+    :return: a boolean array of the shape of ts (number of rays, m), True where ts[i, j] is in one of ray i's intervals
+    """
+    starts, ends = intervals
+    return ((starts[:, None, :] <= ts[:, :, None]) & (ts[:, :, None] <= ends[:, None, :])).any(axis=2)
+
+
+def combine(a, b, op):
+    """
+    :param op:  'u' (union), '+' (intersect) or '-' (subtract b from a)
+    :return:    the intervals of a op b
+    """
+    num_rays = len(a[0])
+    bounds = numpy.sort(numpy.concatenate(a + b, axis=1), axis=1)
+    if not bounds.shape[1]:
+        return _empty_intervals(num_rays)
+    # every distinct boundary once, so that intervals that touch are merged into one
+    duplicate = numpy.zeros(bounds.shape, dtype=bool)
+    duplicate[:, 1:] = bounds[:, 1:] == bounds[:, :-1]
+    bounds[duplicate] = numpy.inf
+    bounds.sort(axis=1)
+    lows = bounds[:, :-1]
+    highs = bounds[:, 1:]
+    # every span between two boundaries is all in, or all out of, every interval: test its middle
+    with numpy.errstate(invalid='ignore'):
+        middles = (lows + highs) / 2.
+    in_a = _contains(a, middles)
+    in_b = _contains(b, middles)
+    if op == 'u':
+        inside = in_a | in_b
+    elif op == '+':
+        inside = in_a & in_b
+    elif op == '-':
+        inside = in_a & ~in_b
+    else:
+        raise UnsupportedGeometry('unknown boolean operation: {}'.format(op))
+    inside &= numpy.isfinite(highs)
+    return _get_runs(lows, highs, inside)
+
+
+def _get_runs(lows, highs, inside):
+    """
+    :return: the intervals of the runs of consecutive spans (lows[i, j], highs[i, j]) that are inside
+    """
+    num_rays = len(lows)
+    before = numpy.zeros(inside.shape, dtype=bool)
+    before[:, 1:] = inside[:, :-1]
+    after = numpy.zeros(inside.shape, dtype=bool)
+    after[:, :-1] = inside[:, 1:]
+    run_starts = inside & ~before
+    run_ends = inside & ~after
+    counts = run_starts.sum(axis=1)
+    starts, ends = _empty_intervals(num_rays, int(counts.max()) if num_rays else 0)
+    rays, columns = numpy.nonzero(run_starts)
+    starts[rays, numpy.cumsum(run_starts, axis=1)[rays, columns] - 1] = lows[rays, columns]
+    rays, columns = numpy.nonzero(run_ends)
+    ends[rays, numpy.cumsum(run_ends, axis=1)[rays, columns] - 1] = highs[rays, columns]
+    return starts, ends
+
+
+def _get_box_mask(origins, direction, bbox):
+    """
+    :return: a boolean array, True for every ray that passes through the (min, max) box bbox
+    """
+    t_in, t_out = _intersect_box(origins, direction, bbox[0], bbox[1])
+    return t_in <= t_out
+
+
+def _intersect_box(origins, direction, box_min, box_max):
+    t_in = numpy.full(len(origins), -numpy.inf)
+    t_out = numpy.full(len(origins), numpy.inf)
+    for axis in range(3):
+        o = origins[:, axis]
+        if direction[axis] == 0:
+            # parallel to the slabs of this axis: all in, or all out
+            outside = (o < box_min[axis]) | (o > box_max[axis])
+            t_in[outside] = numpy.inf
+            t_out[outside] = -numpy.inf
+            continue
+        t1 = (box_min[axis] - o) / direction[axis]
+        t2 = (box_max[axis] - o) / direction[axis]
+        t_in = numpy.maximum(t_in, numpy.minimum(t1, t2))
+        t_out = numpy.minimum(t_out, numpy.maximum(t1, t2))
+    return t_in, t_out
+
+
+class Node(object):
+    __metaclass__ = ABCMeta
+
+    def shoot(self, geometry, origins, direction):
+        """
+        :param origins:    an array of shape (number of rays, 3)
+        :param direction:  the direction every ray is fired in, a unit vector
+        :return:           the intervals of every ray in this node, in distances along the ray from its origin
+        """
+        bbox = self.bbox(geometry)
+        if bbox is None:
+            return _empty_intervals(len(origins))
+        # only the rays that pass through the bounding-box are worth working out
+        mask = _get_box_mask(origins, direction, bbox)
+        if mask.all():
+            return self._shoot(geometry, origins, direction)
+        starts, ends = self._shoot(geometry, origins[mask], direction)
+        all_starts, all_ends = _empty_intervals(len(origins), starts.shape[1])
+        all_starts[mask] = starts
+        all_ends[mask] = ends
+        return all_starts, all_ends
+
+    @abstractmethod
+    def bbox(self, geometry):
+        """
+        :return: (min, max) of the bounding-box (as BRL-CAD's bb works it out), or None if it's empty
+        """
+        pass
+
+    @abstractmethod
+    def _shoot(self, geometry, origins, direction):
+        pass
+
+    @abstractmethod
+    def get_z_extents(self, geometry):
+        """
+        :return: a (z_low, z_high, varies) for every primitive of the node: its cross-sections (with Z planes)
+                 are all the same from z_low to z_high, unless varies
+        """
+        pass
+
+
+class Primitive(Node):
+    def _shoot(self, geometry, origins, direction):
+        return _single_intervals(*self.intersect(origins, direction))
+
+    def get_z_extents(self, geometry):
+        # the same cross-section all the way up only for the prisms standing upright, see the overrides
+        bbox_min, bbox_max = self.bbox(geometry)
+        return [(bbox_min[2], bbox_max[2], True)]
+
+    @abstractmethod
+    def intersect(self, origins, direction):
+        """
+        :return: (t_in, t_out) arrays, t_in > t_out for the rays that miss
+        """
+        pass
+
+
+class Rpp(Primitive):
+    def __init__(self, args):
+        min_x, max_x, min_y, max_y, min_z, max_z = args
+        self.box_min = numpy.array([min_x, min_y, min_z], dtype=float)
+        self.box_max = numpy.array([max_x, max_y, max_z], dtype=float)
+
+    def bbox(self, geometry):
+        return self.box_min, self.box_max
+
+    def intersect(self, origins, direction):
+        return _intersect_box(origins, direction, self.box_min, self.box_max)
+
+    def get_z_extents(self, geometry):
+        return [(self.box_min[2], self.box_max[2], False)]
+
+
+class Arb8(Primitive):
+    # the vertices of every face, BRL-CAD's 1234, 5678, 1485, 2376, 1265, 4378
+    FACES = ((0, 1, 2, 3), (4, 5, 6, 7), (0, 3, 7, 4), (1, 2, 6, 5), (0, 1, 5, 4), (3, 2, 6, 7))
+
+    def __init__(self, args):
+        self.points = numpy.array(args, dtype=float).reshape(8, 3)
+        center = self.points.mean(axis=0)
+        normals = []
+        distances = []
+        for face in self.FACES:
+            face_points = self.points[list(face)]
+            # Newell's method, for faces that are a bit out of plane or have repeated points
+            following = numpy.roll(face_points, -1, axis=0)
+            normal = numpy.cross(face_points, following).sum(axis=0)
+            length = numpy.sqrt(normal.dot(normal))
+            if length == 0:
+                # a degenerate face, the others bound the solid
+                continue
+            normal /= length
+            distance = normal.dot(face_points.mean(axis=0))
+            # facing out, away from the center
+            if normal.dot(center) > distance:
+                normal, distance = -normal, -distance
+            normals.append(normal)
+            distances.append(distance)
+        self.normals = numpy.array(normals)
+        self.distances = numpy.array(distances)
+
+    def bbox(self, geometry):
+        return self.points.min(axis=0), self.points.max(axis=0)
+
+    def get_z_extents(self, geometry):
+        # with only upright sides (and level top and bottom), it's a prism standing on its bottom
+        if len(self.normals) and (numpy.isclose(self.normals[:, 2], 0, atol=1e-9) |
+                                  numpy.isclose(abs(self.normals[:, 2]), 1, atol=1e-9)).all():
+            return [(self.points[:, 2].min(), self.points[:, 2].max(), False)]
+        return super(Arb8, self).get_z_extents(geometry)
+
+    def intersect(self, origins, direction):
+        t_in = numpy.full(len(origins), -numpy.inf)
+        t_out = numpy.full(len(origins), numpy.inf)
+        # the solid is the intersection of the faces' half-spaces: normal . p <= distance
+        for normal, distance in zip(self.normals, self.distances):
+            approach = normal.dot(direction)
+            gap = distance - origins.dot(normal)
+            if approach == 0:
+                outside = gap < 0
+                t_in[outside] = numpy.inf
+                t_out[outside] = -numpy.inf
+            elif approach < 0:
+                t_in = numpy.maximum(t_in, gap / approach)
+            else:
+                t_out = numpy.minimum(t_out, gap / approach)
+        return t_in, t_out
+
+
+class Ellipsoid(Primitive):
+    def __init__(self, vertex, a, b, c):
+        self.vertex = numpy.array(vertex, dtype=float)
+        axes = numpy.array([a, b, c], dtype=float)
+        # from model coordinates to the unit sphere's
+        self.to_unit = numpy.linalg.inv(axes.T)
+        self.half_size = numpy.sqrt((axes ** 2).sum(axis=0))
+
+    @classmethod
+    def from_sph(cls, args):
+        x, y, z, radius = args
+        return cls((x, y, z), (radius, 0, 0), (0, radius, 0), (0, 0, radius))
+
+    @classmethod
+    def from_ell(cls, args):
+        return cls(args[0:3], args[3:6], args[6:9], args[9:12])
+
+    def bbox(self, geometry):
+        return self.vertex - self.half_size, self.vertex + self.half_size
+
+    def intersect(self, origins, direction):
+        o = (origins - self.vertex).dot(self.to_unit.T)
+        d = self.to_unit.dot(direction)
+        a = d.dot(d)
+        b = 2 * o.dot(d)
+        c = (o * o).sum(axis=1) - 1
+        discriminant = b * b - 4 * a * c
+        with numpy.errstate(invalid='ignore'):
+            root = numpy.sqrt(discriminant)
+        # NaN for the misses, which compare as a miss
+        return (-b - root) / (2 * a), (-b + root) / (2 * a)
+
+
+class TruncatedCone(Primitive):
+    """
+    The tgc (and rcc, trc): the base ellipse (semi-axes a, b) at vertex, the top ellipse at vertex + height,
+    with semi-axes along a and b, of lengths c and d. Only if c/|a| == d/|b|, so that the sides are a cone
+    (or cylinder), which a ray goes through in a single interval.
+    """
+    def __init__(self, vertex, height, a, b, c, d):
+        vertex, height, a, b = [numpy.array(v, dtype=float) for v in (vertex, height, a, b)]
+        length_a = numpy.sqrt(a.dot(a))
+        length_b = numpy.sqrt(b.dot(b))
+        if length_a == 0 or length_b == 0:
+            raise UnsupportedGeometry('tgc with an empty base')
+        ratio = c / length_a
+        if not numpy.isclose(ratio, d / length_b):
+            raise UnsupportedGeometry('tgc whose top isn\'t in proportion to its base: {} {} {} {}'.format(
+                length_a, length_b, c, d))
+        self.vertex = vertex
+        self.height = height
+        self.a = a
+        self.b = b
+        self.top_a = a * ratio
+        self.top_b = b * ratio
+        # radii grow by (ratio - 1) per height
+        self.slope = ratio - 1
+        # from model coordinates to (x, y, h) of vertex + x * a + y * b + h * height
+        self.to_local = numpy.linalg.inv(numpy.array([a, b, height]).T)
+
+    @classmethod
+    def from_rcc(cls, args):
+        vertex, height, radius = args[0:3], args[3:6], args[6]
+        return cls.from_trc(list(vertex) + list(height) + [radius, radius])
+
+    @classmethod
+    def from_trc(cls, args):
+        vertex, height, base_radius, top_radius = args[0:3], args[3:6], args[6], args[7]
+        if base_radius == 0:
+            # the apex at the base: the same cone, from its top
+            vertex = [vertex[i] + height[i] for i in range(3)]
+            height = [-h for h in height]
+            base_radius, top_radius = top_radius, base_radius
+        a, b = _get_perpendicular_axes(height)
+        return cls(vertex, height, a * base_radius, b * base_radius, top_radius, top_radius)
+
+    @classmethod
+    def from_tgc(cls, args):
+        return cls(args[0:3], args[3:6], args[6:9], args[9:12], args[12], args[13])
+
+    def get_z_extents(self, geometry):
+        tolerance = 1e-9 * numpy.sqrt(self.height.dot(self.height))
+        # an upright cylinder (of any elliptical base)
+        if abs(self.height[0]) <= tolerance and abs(self.height[1]) <= tolerance and \
+                abs(self.a[2]) <= tolerance and abs(self.b[2]) <= tolerance and abs(self.slope) <= 1e-9:
+            z_low, z_high = sorted([self.vertex[2], self.vertex[2] + self.height[2]])
+            return [(z_low, z_high, False)]
+        return super(TruncatedCone, self).get_z_extents(geometry)
+
+    def bbox(self, geometry):
+        base = numpy.sqrt(self.a ** 2 + self.b ** 2)
+        top = numpy.sqrt(self.top_a ** 2 + self.top_b ** 2)
+        top_center = self.vertex + self.height
+        return (numpy.minimum(self.vertex - base, top_center - top),
+                numpy.maximum(self.vertex + base, top_center + top))
+
+    def intersect(self, origins, direction):
+        o = (origins - self.vertex).dot(self.to_local.T)
+        d = self.to_local.dot(direction)
+        num_rays = len(origins)
+        # between the base and the top: 0 <= h <= 1
+        if d[2] == 0:
+            between = (o[:, 2] >= 0) & (o[:, 2] <= 1)
+            t_low = numpy.where(between, -numpy.inf, numpy.inf)
+            t_high = numpy.where(between, numpy.inf, -numpy.inf)
+        else:
+            t_0 = -o[:, 2] / d[2]
+            t_1 = (1 - o[:, 2]) / d[2]
+            t_low = numpy.minimum(t_0, t_1)
+            t_high = numpy.maximum(t_0, t_1)
+        # inside the sides: x^2 + y^2 <= s^2, with the radius scale s = 1 + slope * h,
+        # or q(t) = alpha t^2 + beta t + gamma <= 0 along the ray
+        s_0 = 1 + self.slope * o[:, 2]
+        s_1 = self.slope * d[2]
+        alpha = d[0] ** 2 + d[1] ** 2 - s_1 ** 2
+        beta = 2 * (o[:, 0] * d[0] + o[:, 1] * d[1] - s_0 * s_1)
+        gamma = o[:, 0] ** 2 + o[:, 1] ** 2 - s_0 ** 2
+        q_low = numpy.full(num_rays, -numpy.inf)
+        q_high = numpy.full(num_rays, numpy.inf)
+        if abs(alpha) <= 1e-12 * (d[0] ** 2 + d[1] ** 2 + s_1 ** 2):
+            # parallel to the axis (of a cylinder) or a side (of a cone): q is linear
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                root = -gamma / beta
+            flat = beta == 0
+            q_low[flat & (gamma > 0)] = numpy.inf
+            q_high[flat & (gamma > 0)] = -numpy.inf
+            q_high[beta > 0] = root[beta > 0]
+            q_low[beta < 0] = root[beta < 0]
+        else:
+            discriminant = beta ** 2 - 4 * alpha * gamma
+            real = discriminant >= 0
+            root = numpy.sqrt(numpy.where(real, discriminant, 0))
+            r_1 = numpy.minimum((-beta - root) / (2 * alpha), (-beta + root) / (2 * alpha))
+            r_2 = numpy.maximum((-beta - root) / (2 * alpha), (-beta + root) / (2 * alpha))
+            if alpha > 0:
+                # inside between the roots
+                q_low = numpy.where(real, r_1, numpy.inf)
+                q_high = numpy.where(real, r_2, -numpy.inf)
+            else:
+                # inside outside the roots, only one side of which (the cone's, not its mirror image's)
+                # is between the base and the top
+                first_side = real & (t_low <= r_1)
+                second_side = real & ~first_side
+                q_high = numpy.where(first_side, r_1, q_high)
+                q_low = numpy.where(second_side, r_2, q_low)
+        return numpy.maximum(t_low, q_low), numpy.minimum(t_high, q_high)
+
+
+def _get_perpendicular_axes(vector):
+    """
+    :return: two unit vectors, perpendicular to vector and to each other
+    """
+    vector = numpy.array(vector, dtype=float)
+    vector /= numpy.sqrt(vector.dot(vector))
+    other = numpy.eye(3)[numpy.argmin(numpy.abs(vector))]
+    a = numpy.cross(vector, other)
+    a /= numpy.sqrt(a.dot(a))
+    return a, numpy.cross(vector, a)
+
+
+class Combination(Node):
+    def __init__(self, kind, operations):
+        """
+        :param kind:        'comb', 'r' or 'g'
+        :param operations:  [(op, member), ...], member is a name or a Node
+        """
+        self.kind = kind
+        self.operations = list(operations)
+
+    def get_terms(self):
+        """
+        :return: the boolean tree as BRL-CAD reads it: a union of terms, every term a member
+                 that the following + and - members are applied to, left to right
+        """
+        terms = []
+        for op, member in self.operations:
+            if op == 'u' or not terms:
+                terms.append([member])
+            else:
+                terms[-1].append((op, member))
+        return terms
+
+    def bbox(self, geometry):
+        bbox = None
+        for term in self.get_terms():
+            term_bbox = geometry.bbox_of(term[0])
+            for op, member in term[1:]:
+                if op == '+' and term_bbox is not None:
+                    member_bbox = geometry.bbox_of(member)
+                    term_bbox = None if member_bbox is None else \
+                        (numpy.maximum(term_bbox[0], member_bbox[0]), numpy.minimum(term_bbox[1], member_bbox[1]))
+                    if term_bbox is not None and (term_bbox[0] > term_bbox[1]).any():
+                        term_bbox = None
+            if term_bbox is not None:
+                bbox = term_bbox if bbox is None else \
+                    (numpy.minimum(bbox[0], term_bbox[0]), numpy.maximum(bbox[1], term_bbox[1]))
+        return bbox
+
+    def get_z_extents(self, geometry):
+        # the booleans of members that don't change between two Z coordinates don't either
+        z_extents = []
+        for op, member in self.operations:
+            member_node = geometry.get_node(member)
+            if member_node is not None and member_node.bbox(geometry) is not None:
+                z_extents.extend(member_node.get_z_extents(geometry))
+        return z_extents
+
+    def _shoot(self, geometry, origins, direction):
+        intervals = _empty_intervals(len(origins))
+        for term in self.get_terms():
+            term_intervals = geometry.shoot(term[0], origins, direction)
+            for op, member in term[1:]:
+                term_intervals = combine(term_intervals, geometry.shoot(member, origins, direction), op)
+            intervals = combine(intervals, term_intervals, 'u')
+        return intervals
+
+
+PRIMITIVES = {'rpp': Rpp,
+              'arb8': Arb8,
+              'sph': Ellipsoid.from_sph,
+              'ell': Ellipsoid.from_ell,
+              'rcc': TruncatedCone.from_rcc,
+              'trc': TruncatedCone.from_trc,
+              'tgc': TruncatedCone.from_tgc}
+
+
+class Geometry(object):
+    """
+    The primitives and combinations of a tcl script, as mged would build them into a database
+    """
+    def __init__(self):
+        self.objects = {}
+        self.units = 'mm'
+
+    @classmethod
+    def from_script(cls, script_string_list):
+        geometry = cls()
+        for entry in script_string_list:
+            for line in entry.split('\n'):
+                geometry.apply(line)
+        return geometry
+
+    def apply(self, line):
+        tokens = line.split()
+        if not tokens or tokens[0] in _DISPLAY_COMMANDS:
+            if tokens[:1] == ['units'] and len(tokens) == 2:
+                self.units = tokens[1]
+            return
+        command = tokens[0]
+        if command == 'in' and len(tokens) > 3:
+            name, primitive_type = tokens[1], tokens[2]
+            if primitive_type not in PRIMITIVES:
+                raise UnsupportedGeometry('unsupported primitive: {} ({})'.format(primitive_type, name))
+            # like mged, an existing object isn't replaced
+            if name not in self.objects:
+                self.objects[name] = PRIMITIVES[primitive_type]([float(t) for t in tokens[3:]])
+        elif command in ('comb', 'r') and len(tokens) > 2:
+            ops = tokens[2:]
+            self._add_to_combination(command, tokens[1], list(zip(ops[0::2], ops[1::2])))
+        elif command == 'g' and len(tokens) > 2:
+            self._add_to_combination(command, tokens[1], [('u', member) for member in tokens[2:]])
+        elif command == 'kill':
+            for name in tokens[1:]:
+                self.objects.pop(name, None)
+        elif command == 'rm' and len(tokens) > 2:
+            combination = self.objects.get(tokens[1])
+            if isinstance(combination, Combination):
+                combination.operations = [(op, member) for op, member in combination.operations
+                                          if member not in tokens[2:]]
+        else:
+            raise UnsupportedGeometry('unsupported command: {}'.format(line.strip()))
+
+    def _add_to_combination(self, kind, name, operations):
+        # like mged, more members for an existing combination are added to it
+        combination = self.objects.get(name)
+        if isinstance(combination, Combination):
+            combination.operations.extend(operations)
+        elif combination is None:
+            self.objects[name] = Combination(kind, operations)
+
+    def tops(self):
+        """
+        :return: the names of the objects no combination refers to, like mged's tops
+        """
+        referenced = set(member for node in self.objects.values() if isinstance(node, Combination)
+                         for op, member in node.operations)
+        return sorted(name for name in self.objects if name not in referenced)
+
+    def get_node(self, name_or_node):
+        if isinstance(name_or_node, Node):
+            return name_or_node
+        # a missing member is left out, like librt does
+        return self.objects.get(name_or_node)
+
+    def bbox_of(self, name_or_node):
+        node = self.get_node(name_or_node)
+        return None if node is None else node.bbox(self)
+
+    def bbox(self, names):
+        """
+        :return: (min, max) of the union of the objects' bounding-boxes (as BRL-CAD's bb works them out)
+        """
+        bbox = Combination('g', [('u', name) for name in names]).bbox(self)
+        if bbox is None:
+            raise Exception('nothing to get the bounding-box of, in: {}'.format(names))
+        return [list(bbox[0]), list(bbox[1])]
+
+    def get_z_extents(self, names):
+        """
+        :return: the (z_low, z_high, varies) of the objects' primitives (see Node.get_z_extents), sorted,
+                 each one once
+        """
+        z_extents = Combination('g', [('u', name) for name in names]).get_z_extents(self)
+        return sorted(set((float(z_low), float(z_high), bool(varies)) for z_low, z_high, varies in z_extents))
+
+    def shoot(self, name_or_node, origins, direction):
+        """
+        :return: the intervals (see the module's docstring) of every ray in the object, sorted by distance
+        """
+        node = self.get_node(name_or_node)
+        if node is None:
+            return _empty_intervals(len(origins))
+        return node.shoot(self, numpy.asarray(origins, dtype=float), numpy.asarray(direction, dtype=float))
+
+    def shoot_first_hits(self, name_or_node, origins, direction, rays_per_block=RAYS_PER_BLOCK):
+        """
+        like NIRT's first partition of every ray: only what's in front of the origins
+        :return: (ray indices, depths) of the rays that hit, the depth (line-of-sight) of their first interval
+        """
+        all_indices = []
+        all_depths = []
+        for first in range(0, len(origins), rays_per_block):
+            starts, ends = self.shoot(name_or_node, origins[first:first + rays_per_block], direction)
+            # only what's in front of the origins
+            in_front = ends >= 0
+            starts = numpy.where(in_front, numpy.maximum(starts, 0), numpy.inf)
+            if not starts.shape[1]:
+                continue
+            first_hit = numpy.argmin(starts, axis=1)
+            rays = numpy.arange(len(starts))
+            start = starts[rays, first_hit]
+            hit = numpy.isfinite(start)
+            all_indices.append(first + rays[hit])
+            all_depths.append(ends[rays, first_hit][hit] - start[hit])
+        if not all_indices:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0)
+        return numpy.concatenate(all_indices), numpy.concatenate(all_depths)
@@ -0,0 +1,201 @@
+"""
+Helpers for driving NIRT (BRL-CAD's interactive ray-tracer) over pipes, without temporary script files.
+"""
+import math
+import threading
+
+# external libs
+import numpy
+
+
+def get_raster_grid(model_min, model_max, step_size, num_pix_x, num_pix_y):
+    """
+    The ray origins of the raster, computed from integer pixel indices (so nothing drifts):
+    pixel (ix, iy) is fired from (model_min[0] + ix * step_size, model_min[1] + iy * step_size).
+    :return: (xs, ys), the X coordinate of every raster column and the Y coordinate of every raster row
+    """
+    num_x = min(num_pix_x, _get_num_steps(model_max[0] - model_min[0], step_size))
+    num_y = min(num_pix_y, _get_num_steps(model_max[1] - model_min[1], step_size))
+    xs = model_min[0] + numpy.arange(num_x) * step_size
+    ys = model_min[1] + numpy.arange(num_y) * step_size
+    return xs, ys
+
+
+def _get_num_steps(length, step_size):
+    # how many steps from 0 stay below length (rounded, so that i.e. 0.30000000000000004/0.1 is 3 steps)
+    return max(int(math.ceil(round(length / step_size, 9))), 0)
+
+
+def get_raster_commands(ray_destination_dir_xyz, units, xs, ys, z, block_bytes=2**20):
+    """
+    yields the NIRT commands that fire one ray per raster pixel (X outer, Y inner), in blocks of about block_bytes,
+    with the output set to RAY_FORMAT_COMMANDS
+    """
+    x_bit, y_bit, z_bit = ray_destination_dir_xyz
+    # set the direction to fire rays in
+    yield 'dir {} {} {}\nunits {}\n'.format(x_bit, y_bit, z_bit, units)
+    yield RAY_FORMAT_COMMANDS
+    # the Y (and Z) part of the commands is the same for every X, so it's only formatted once,
+    # then every X's commands are a single join: 'xyz x' + y_part[0] + 'xyz x' + y_part[1] ...
+    y_parts = [' {!r} {!r}\ns\n'.format(float(y), float(z)) for y in ys]
+    if not y_parts:
+        return
+    block = []
+    block_size = 0
+    for x in xs:
+        prefix = 'xyz {!r}'.format(float(x))
+        row = prefix + prefix.join(y_parts)
+        block.append(row)
+        block_size += len(row)
+        if block_size >= block_bytes:
+            yield ''.join(block)
+            block = []
+            block_size = 0
+    if block:
+        yield ''.join(block)
+
+
+def get_point_commands(ray_destination_dir_xyz, units, xs, ys, z, block_size=65536):
+    """
+    yields the NIRT commands that fire one ray from every (xs[i], ys[i], z), in blocks of block_size rays,
+    with the output set to RAY_FORMAT_COMMANDS
+    """
+    x_bit, y_bit, z_bit = ray_destination_dir_xyz
+    yield 'dir {} {} {}\nunits {}\n'.format(x_bit, y_bit, z_bit, units)
+    yield RAY_FORMAT_COMMANDS
+    z_part = ' {!r}\ns\n'.format(float(z))
+    for i in range(0, len(xs), block_size):
+        yield ''.join('xyz {!r} {!r}{}'.format(x, y, z_part)
+                      for x, y in zip(xs[i:i + block_size].tolist(), ys[i:i + block_size].tolist()))
+
+
+def count_shots(commands, on_shots):
+    """
+    pass the commands through, calling on_shots(number of rays) for every command once it's been taken,
+    i.e. written into NIRT by start_stdin_writer
+    """
+    for command in commands:
+        yield command
+        num_shots = command.count(SHOOT_COMMAND)
+        if num_shots:
+            on_shots(num_shots)
+
+
+def start_stdin_writer(proc, commands, invocation=None):
+    """
+    Write the commands (strings, each holding any number of lines) into proc's stdin from a new thread,
+    closing stdin when done, so the caller can read proc's output at the same time.
+    :param invocation:  a ToolInvocation, whose bytes_in is counted up
+    :return:            the (started) thread
+    """
+    errors = []
+
+    def write():
+        try:
+            for command in commands:
+                proc.stdin.write(command)
+                if invocation is not None:
+                    invocation.bytes_in += len(command)
+        except (IOError, OSError) as e:
+            # NIRT went away early, its exit status tells the rest
+            errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    t = threading.Thread(target=write)
+    t.daemon = True
+    t.errors = errors
+    t.start()
+    return t
+
+
+def start_stream_reader(stream, invocation=None):
+    """
+    read all of stream from a new thread, the text ends up in the thread's 'lines' list
+    """
+    lines = []
+
+    def read():
+        for line in iter(stream.readline, ''):
+            lines.append(line)
+            if invocation is not None:
+                invocation.bytes_out += len(line)
+
+    t = threading.Thread(target=read)
+    t.daemon = True
+    t.lines = lines
+    t.start()
+    return t
+
+
+# the command that fires a ray, every ray's 'xyz x y z' is followed by one
+SHOOT_COMMAND = '\ns\n'
+RAY_RECORD = 'R\n'
+PARTITION_RECORD = 'P '
+# NIRT's output, configured to be a bare 'R' line per shot, followed by a 'P' line per region the ray went through:
+#   R
+#   P <x_in> <y_in> <z_in> <x_out> <y_out> <z_out> <los> <region name>
+# (nothing for the table header, the footer, misses, overlaps or gaps)
+RAY_FORMAT_COMMANDS = ('fmt r "R\\n"\n'
+                       'fmt h ""\n'
+                       'fmt p "P %.17g %.17g %.17g %.17g %.17g %.17g %.17g %s\\n" '
+                       'x_in y_in z_in x_out y_out z_out los reg_name\n'
+                       'fmt f ""\n'
+                       'fmt m ""\n'
+                       'fmt o ""\n'
+                       'fmt g ""\n')
+# the columns of the hits iter_hits yields
+X_IN, Y_IN, Z_IN, X_OUT, Y_OUT, Z_OUT, LOS = range(7)
+
+
+def iter_hits(stream, invocation=None, block_lines=65536, first_only=True, on_rays_parsed=None,
+              rays_per_report=4096):
+    """
+    Parse NIRT's output (as configured by RAY_FORMAT_COMMANDS) incrementally, as it comes out of the pipe.
+    :param invocation:       a ToolInvocation, whose bytes_out is counted up
+    :param block_lines:      how many hits are parsed at once (this bounds the memory used, whatever the raster size)
+    :param first_only:       only keep the first hit of every shot, else every segment the ray spent inside the objects
+    :param on_rays_parsed:   called with the number of shots parsed since it last was, every rays_per_report shots
+                             (hit or not), and at the end
+    :return:             yields (ray indices, hits), numpy arrays of shape (<= block_lines,) and (<= block_lines, 7):
+                         the index of the shot (in the order they were fired) and its
+                         (x_in, y_in, z_in, x_out, y_out, z_out, LOS) per hit
+    """
+    ray_indices = []
+    values = []
+    ray_index = -1
+    want_hit = False
+    # the index of the shot that the shots parsed are next reported at (never, without on_rays_parsed)
+    next_report = rays_per_report if on_rays_parsed is not None else -2
+    for line in iter(stream.readline, ''):
+        if invocation is not None:
+            invocation.bytes_out += len(line)
+        if line == RAY_RECORD:
+            ray_index += 1
+            want_hit = True
+            if ray_index == next_report:
+                on_rays_parsed(rays_per_report)
+                next_report += rays_per_report
+        elif want_hit and line.startswith(PARTITION_RECORD):
+            ray_indices.append(ray_index)
+            values.extend(line.split(None, 8)[1:8])
+            want_hit = not first_only
+            if len(ray_indices) >= block_lines:
+                yield _get_hit_block(ray_indices, values)
+                ray_indices = []
+                values = []
+    if ray_indices:
+        yield _get_hit_block(ray_indices, values)
+    if on_rays_parsed is not None and ray_index + 1 > next_report - rays_per_report:
+        on_rays_parsed(ray_index + 1 - (next_report - rays_per_report))
+
+
+def _get_hit_block(ray_indices, values):
+    try:
+        hits = numpy.array(values, dtype=float).reshape(len(ray_indices), 7)
+    except ValueError:
+        raise Exception("couldn't parse the coordinates of NIRT's hits! report this bug. in: {}".format(values[:14]))
+    return numpy.array(ray_indices, dtype=int), hits
@@ -0,0 +1,229 @@
+"""
+Progress of long exports (see brlcad_tcl.export_model_slices(..., progress=...)): rays fired and parsed,
+slices done, throughput and ETA, reported to observers at most every min_interval seconds.
+
+An observer is a ProgressObserver, or any function taking the ExportProgress, i.e. from a script:
+
+    def report(progress):
+        print('{} of {} slices, ETA {}'.format(progress.slices_done, progress.total_slices, progress.eta))
+    brl_db.export_model_slices(..., progress=report)
+
+or progress=True for a ProgressBar on the terminal.
+"""
+import sys
+import time
+import threading
+
+
+class ProgressObserver(object):
+    """
+    called from whichever thread made the progress (never from two at once)
+    """
+    def update(self, progress):
+        """
+        :param progress:  the ExportProgress, read its counters and rates
+        """
+        pass
+
+    def finish(self, progress):
+        """
+        called once, when the export is over (done or not)
+        """
+        pass
+
+
+class _FunctionObserver(ProgressObserver):
+    def __init__(self, function):
+        self.function = function
+
+    def update(self, progress):
+        self.function(progress)
+
+    def finish(self, progress):
+        self.function(progress)
+
+
+class ProgressBar(ProgressObserver):
+    """
+    a single line, redrawn in place:  [#########-----------]  45%  9/20 slices  1.2M rays/s  ETA 0:01:23
+    """
+    def __init__(self, stream=None, width=30):
+        self.stream = stream or sys.stderr
+        self.width = width
+
+    def update(self, progress):
+        fraction = progress.fraction_done or 0.
+        filled = int(round(fraction * self.width))
+        line = '[{}{}] {:>4.0%}  {}/{} slices'.format('#' * filled, '-' * (self.width - filled), fraction,
+                                                       progress.slices_done, progress.total_slices or '?')
+        if progress.rays_parsed:
+            line += '  {} rays/s'.format(format_count(progress.rays_per_second))
+        eta = progress.eta
+        line += '  ETA {}'.format(format_duration(eta) if eta is not None else '?')
+        self.stream.write('\r' + line.ljust(79))
+        self.stream.flush()
+
+    def finish(self, progress):
+        self.update(progress)
+        self.stream.write('\n{} slices in {}\n'.format(progress.slices_done, format_duration(progress.elapsed)))
+        self.stream.flush()
+
+
+def format_count(count):
+    for factor, suffix in ((1e9, 'G'), (1e6, 'M'), (1e3, 'k')):
+        if count >= factor:
+            return '{:.1f}{}'.format(count / factor, suffix)
+    return '{:.0f}'.format(count)
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class ExportProgress(object):
+    """
+    Counters of one export, added to from any thread. Cheap enough to be added to from the ray loops:
+    the observers are only called when min_interval has passed since they last were.
+    """
+    def __init__(self, observers=(), min_interval=0.5):
+        """
+        :param observers:     ProgressObservers or functions (see the module's docstring)
+        :param min_interval:  the least number of seconds between two updates of the observers
+        """
+        self.observers = [o if isinstance(o, ProgressObserver) else _FunctionObserver(o) for o in observers]
+        self.min_interval = min_interval
+        self.total_slices = None
+        # None when it isn't known beforehand, i.e. for STLs or adaptive sampling
+        self.total_rays = None
+        self.rays_fired = 0
+        self.rays_parsed = 0
+        # (counting the slices a checkpoint resumes from)
+        self.slices_done = 0
+        # the work a checkpoint resumes from: done, but not by this run, so not in its throughput
+        self.slices_skipped = 0
+        self.rays_skipped = 0
+        self.start_time = time.time()
+        self._last_update = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def make(cls, progress):
+        """
+        :param progress:  True for a ProgressBar, an observer, a list of them, or an ExportProgress
+        :return:          an ExportProgress, or None for a false progress
+        """
+        if not progress:
+            return None
+        if isinstance(progress, cls):
+            return progress
+        if progress is True:
+            return cls([ProgressBar()])
+        if isinstance(progress, (list, tuple)):
+            return cls(progress)
+        return cls([progress])
+
+    def set_totals(self, num_slices, num_rays=None, num_slices_done=0, num_rays_done=0):
+        """
+        all the work of the export, restarts the clock
+        :param num_slices_done:  how many of num_slices a checkpoint resumes from (counted as done)
+        :param num_rays_done:    how many of num_rays those slices are
+        """
+        with self._lock:
+            self.total_slices = num_slices
+            self.total_rays = num_rays
+            self.slices_done = self.slices_skipped = num_slices_done
+            self.rays_skipped = num_rays_done
+            self.start_time = time.time()
+        self._update(force=True)
+
+    def add_rays_fired(self, num_rays):
+        with self._lock:
+            self.rays_fired += num_rays
+        self._update()
+
+    def add_rays_parsed(self, num_rays):
+        with self._lock:
+            self.rays_parsed += num_rays
+        self._update()
+
+    def add_rays(self, num_rays):
+        """
+        for the rays that are fired and parsed at once (rt, or csg's ray-caster)
+        """
+        with self._lock:
+            self.rays_fired += num_rays
+            self.rays_parsed += num_rays
+        self._update()
+
+    def add_rays_skipped(self, num_rays):
+        """
+        for the rays of the parts of slices (i.e. NIRT's bands) that a checkpoint resumes from
+        """
+        with self._lock:
+            self.rays_skipped += num_rays
+        self._update()
+
+    def add_slices_done(self, num_slices=1):
+        with self._lock:
+            self.slices_done += num_slices
+            is_last = self.slices_done == self.total_slices
+        self._update(force=is_last)
+
+    def finish(self):
+        for observer in self.observers:
+            observer.finish(self)
+
+    def _update(self, force=False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_update < self.min_interval:
+                return
+            self._last_update = now
+            for observer in self.observers:
+                observer.update(self)
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    @property
+    def rays_per_second(self):
+        elapsed = self.elapsed
+        return self.rays_parsed / elapsed if elapsed > 0 else 0.
+
+    @property
+    def slices_per_second(self):
+        elapsed = self.elapsed
+        return (self.slices_done - self.slices_skipped) / elapsed if elapsed > 0 else 0.
+
+    @property
+    def fraction_done(self):
+        """
+        :return: from the rays parsed if their total is known, else from the slices done (None if neither is),
+                 the work a checkpoint resumes from included
+        """
+        return self._get_fraction(include_skipped=True)
+
+    @property
+    def eta(self):
+        """
+        :return: the seconds left at the throughput so far, None until something is done
+        """
+        fraction = self._get_fraction(include_skipped=True)
+        if fraction == 1.:
+            return 0.
+        # (only what this run did tells how fast it goes)
+        fraction_run = self._get_fraction(include_skipped=False)
+        if not fraction_run:
+            return None
+        return self.elapsed * (1 - fraction) / fraction_run
+
+    def _get_fraction(self, include_skipped):
+        if self.total_rays:
+            rays = self.rays_parsed + (self.rays_skipped if include_skipped else 0)
+            return min(1., rays / float(self.total_rays))
+        if self.total_slices:
+            slices = self.slices_done - (0 if include_skipped else self.slices_skipped)
+            return min(1., slices / float(self.total_slices))
+        return None
@@ -0,0 +1,115 @@
+"""
+Compact buffers for the rasters NIRT is shot into, instead of 8 bytes (float64) per pixel:
+    'greyscale'  uint8, the depth of the hit as 0..255 of the full depth
+    'binary'     1 bit per pixel (packed along Y, so any range of X rows is still a plain slice of the array)
+    'depth'      uint16, the depth of the hit as 0..65535 of the full depth
+optionally backed by a numpy.memmap file, so rasters bigger than RAM can be made.
+"""
+import os
+import tempfile
+
+# external libs
+import numpy
+from PIL import Image
+
+
+# the formats PIL writes 1-bit and 16-bit images to
+ONE_BIT_EXTENSIONS = ('.png', '.tif', '.tiff', '.bmp', '.gif')
+SIXTEEN_BIT_EXTENSIONS = ('.png', '.tif', '.tiff')
+
+
+def get_kind(output_greyscale=True, output_depth=False):
+    return 'depth' if output_depth else 'greyscale' if output_greyscale else 'binary'
+
+
+class RasterBuffer(object):
+    KINDS = {'greyscale': (numpy.uint8, 255),
+             'binary': (numpy.uint8, 1),
+             'depth': (numpy.uint16, 65535)}
+
+    def __init__(self, num_pix_x, num_pix_y, kind='greyscale', full_depth=None, packed=True, memmap_dir=None):
+        """
+        :param full_depth:  the depth of hit that's the brightest value, for 'greyscale' and 'depth'
+        :param packed:      'binary' only: pack 8 pixels per byte, else a byte per pixel (for random access)
+        :param memmap_dir:  back the buffer with a file in this directory, instead of RAM
+        """
+        if kind not in self.KINDS:
+            raise Exception('unknown raster buffer kind: {}, not one of: {}'.format(kind, ', '.join(self.KINDS)))
+        self.kind = kind
+        self.num_pix_x = num_pix_x
+        self.num_pix_y = num_pix_y
+        self.full_depth = full_depth
+        self.packed = packed and kind == 'binary'
+        self.dtype, self.max_value = self.KINDS[kind]
+        shape = (num_pix_x, (num_pix_y + 7) // 8 if self.packed else num_pix_y)
+        self.memmap_path = None
+        if memmap_dir is not None:
+            handle, self.memmap_path = tempfile.mkstemp(suffix='.raster', dir=memmap_dir)
+            os.close(handle)
+            self.array = numpy.memmap(self.memmap_path, dtype=self.dtype, mode='w+', shape=shape)
+        else:
+            self.array = numpy.zeros(shape, dtype=self.dtype)
+
+    def set_hits(self, int_x, int_y, depths):
+        """
+        write the hits, of the given depths, at pixels (int_x[i], int_y[i])
+        """
+        if self.kind == 'binary':
+            if self.packed:
+                numpy.bitwise_or.at(self.array, (int_x, int_y // 8),
+                                    numpy.left_shift(1, 7 - int_y % 8).astype(numpy.uint8))
+            else:
+                self.array[int_x, int_y] = 1
+        else:
+            # clipped, so that a hit a hair deeper than the full depth doesn't wrap around to black
+            self.array[int_x, int_y] = numpy.clip((depths / self.full_depth) * self.max_value, 0, self.max_value)
+
+    def set_coverage(self, coverage):
+        """
+        write the whole raster from how much of the full depth every pixel is filled for, 0..1
+        """
+        if self.kind == 'binary':
+            filled = coverage > 0
+            self.array[:] = numpy.packbits(filled, axis=1) if self.packed else filled
+        else:
+            self.array[:] = numpy.clip(coverage * self.max_value, 0, self.max_value)
+
+    def to_array(self):
+        """
+        :return: the raster as a numpy array of shape (num_pix_x, num_pix_y), 0/1 for 'binary'
+        """
+        if self.packed:
+            return numpy.unpackbits(self.array, axis=1)[:, :self.num_pix_y]
+        return numpy.asarray(self.array)
+
+    def to_image(self, extension='.png'):
+        """
+        :return: a PIL image of the raster, as written to a file of the given extension
+        """
+        extension = extension.lower()
+        if self.kind == 'binary':
+            if self.packed:
+                image = Image.frombytes('1', (self.num_pix_y, self.num_pix_x), numpy.ascontiguousarray(self.array))
+            else:
+                image = Image.fromarray((self.array * 255).astype(numpy.uint8))
+            if extension in ONE_BIT_EXTENSIONS:
+                return image.convert('1')
+            return image.convert('L')
+        if self.kind == 'depth' and extension not in SIXTEEN_BIT_EXTENSIONS:
+            return Image.fromarray((self.array >> 8).astype(numpy.uint8))
+        return Image.fromarray(numpy.asarray(self.array))
+
+    def save(self, path):
+        self.to_image(os.path.splitext(path)[1]).save(path)
+
+    def close(self):
+        """
+        drop the buffer, and its memmap file
+        """
+        self.array = None
+        if self.memmap_path is not None:
+            try:
+                os.remove(self.memmap_path)
+            except OSError:
+                pass
+            self.memmap_path = None
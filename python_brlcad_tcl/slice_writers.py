@@ -0,0 +1,324 @@
+"""
+Writers for stacks of raster slices (see raster_buffer.RasterBuffer), one per output format:
+    'jpg', 'png', 'tiff'  an image file per slice
+    'multipage_tiff'      a single TIFF, a page per slice
+    'npy'                 a single NumPy volume, of shape (number of slices, num_pix_x, num_pix_y),
+                          written through a memmap (numpy.load(path, mmap_mode='r') reads it back the same way)
+    'rle'                 a single file of run-length encoded binary layers (see RleLayerWriter)
+Slices can be written in any order, from a BackgroundWriter thread, so encoding overlaps with ray-firing.
+The single-file formats write them in order, holding on to at most max_waiting slices that arrive early:
+the slices further ahead wait for their turn (see SliceWriter.wait_for_turn).
+"""
+import struct
+import threading
+from abc import ABCMeta
+from abc import abstractmethod
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+# external libs
+import numpy
+from PIL import TiffImagePlugin
+
+
+class SliceWriter(object):
+    __metaclass__ = ABCMeta
+
+    def __init__(self, path_format, num_slices, max_waiting=None):
+        """
+        :param path_format:  a string with a {} that the slice number is inserted into
+                             (single-file formats insert nothing)
+        :param max_waiting:  the formats written in order: how many slices can be ahead of the next one to write
+                             (default: 8)
+        """
+        self.path_format = path_format
+        self.num_slices = num_slices
+        self.max_waiting = max(max_waiting or 8, 1)
+
+    def get_output_paths(self):
+        """
+        :return: the paths of every file written
+        """
+        return [self.path_format.format('')]
+
+    @abstractmethod
+    def write(self, index, raster):
+        """
+        write the raster (a RasterBuffer) of slice number index
+        """
+        pass
+
+    def wait_for_turn(self, index):
+        """
+        block until slice number index can be written without more than max_waiting slices held in memory
+        """
+        pass
+
+    def abort(self):
+        """
+        raise in whatever waits for its turn (and from then on), when a slice isn't ever going to be written
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class ImageStackWriter(SliceWriter):
+    def get_output_paths(self):
+        return [self.path_format.format(i) for i in range(self.num_slices)]
+
+    def write(self, index, raster):
+        raster.save(self.path_format.format(index))
+
+
+class _OrderedSliceWriter(SliceWriter):
+    """
+    for formats whose slices have to be written in order: slices that arrive early wait for their turn,
+    at most max_waiting of them (the others wait in wait_for_turn)
+    """
+    def __init__(self, path_format, num_slices, max_waiting=None):
+        super(_OrderedSliceWriter, self).__init__(path_format, num_slices, max_waiting)
+        self._waiting = {}
+        self._next_index = 0
+        self._aborted = False
+        # notified whenever _next_index moves on, or the writing is aborted
+        self._turn = threading.Condition()
+
+    def wait_for_turn(self, index):
+        with self._turn:
+            while index - self._next_index >= self.max_waiting and not self._aborted:
+                self._turn.wait()
+            if self._aborted:
+                raise Exception('writing {} was aborted'.format(self.path_format.format('')))
+
+    def abort(self):
+        with self._turn:
+            self._aborted = True
+            self._turn.notify_all()
+
+    def write(self, index, raster):
+        self._waiting[index] = self._get_slice_data(raster)
+        while self._next_index in self._waiting:
+            self._write_in_order(self._waiting.pop(self._next_index))
+            with self._turn:
+                self._next_index += 1
+                self._turn.notify_all()
+
+    def close(self):
+        if self._waiting:
+            missing = sorted(set(range(self._next_index, self.num_slices)) - set(self._waiting))
+            raise Exception('slices missing from {}: {}'.format(self.path_format.format(''), missing[:10]))
+
+    @abstractmethod
+    def _get_slice_data(self, raster):
+        pass
+
+    @abstractmethod
+    def _write_in_order(self, data):
+        pass
+
+
+class MultiPageTiffWriter(_OrderedSliceWriter):
+    def __init__(self, path_format, num_slices, max_waiting=None):
+        super(MultiPageTiffWriter, self).__init__(path_format, num_slices, max_waiting)
+        self._tiff = TiffImagePlugin.AppendingTiffWriter(self.path_format.format(''), True)
+
+    def _get_slice_data(self, raster):
+        return raster.to_image('.tif')
+
+    def _write_in_order(self, image):
+        image.save(self._tiff, format='TIFF')
+        self._tiff.newFrame()
+
+    def close(self):
+        try:
+            super(MultiPageTiffWriter, self).close()
+        finally:
+            self._tiff.close()
+
+
+class NpyVolumeWriter(SliceWriter):
+    def __init__(self, path_format, num_slices, max_waiting=None):
+        super(NpyVolumeWriter, self).__init__(path_format, num_slices, max_waiting)
+        self.volume = None
+
+    def write(self, index, raster):
+        if self.volume is None:
+            # sized by the first slice, every slice has the same raster
+            self.volume = numpy.lib.format.open_memmap(self.path_format.format(''), mode='w+',
+                                                       dtype=raster.array.dtype,
+                                                       shape=(self.num_slices, raster.num_pix_x, raster.num_pix_y))
+        self.volume[index] = raster.to_array()
+
+    def close(self):
+        if self.volume is not None:
+            self.volume.flush()
+            self.volume = None
+
+
+class RleLayerWriter(_OrderedSliceWriter):
+    """
+    Run-length encoded binary layers (any non-zero pixel is filled), all little-endian:
+        header:     'BRLE', uint32 version (1), uint32 number of layers, uint32 num_pix_x, uint32 num_pix_y
+        per layer:  uint32 number of runs, then the runs' lengths as uint32, alternating empty and filled,
+                    starting with empty (which can be 0 long), over the pixels in row-major ([x, y]) order
+    """
+    MAGIC = b'BRLE'
+    VERSION = 1
+
+    def __init__(self, path_format, num_slices, max_waiting=None):
+        super(RleLayerWriter, self).__init__(path_format, num_slices, max_waiting)
+        self._file = open(self.path_format.format(''), 'wb')
+        self._wrote_header = False
+
+    def _get_slice_data(self, raster):
+        return raster.num_pix_x, raster.num_pix_y, self.encode(raster.to_array())
+
+    @staticmethod
+    def encode(layer):
+        """
+        :return: the run lengths of the flattened layer, as uint32, starting with an empty run
+        """
+        filled = numpy.concatenate(([False], layer.ravel() != 0, [False]))
+        # the indices where the pixels change between empty and filled
+        changes = numpy.flatnonzero(filled[1:] != filled[:-1])
+        boundaries = numpy.concatenate(([0], changes, [layer.size]))
+        runs = numpy.diff(boundaries)
+        # a trailing empty run of 0 pixels isn't needed
+        if len(runs) > 1 and runs[-1] == 0:
+            runs = runs[:-1]
+        return runs.astype('<u4')
+
+    @staticmethod
+    def decode(runs, num_pix_x, num_pix_y):
+        values = numpy.arange(len(runs)) % 2
+        return numpy.repeat(values, runs).astype(numpy.uint8).reshape(num_pix_x, num_pix_y)
+
+    def _write_in_order(self, data):
+        num_pix_x, num_pix_y, runs = data
+        if not self._wrote_header:
+            self._file.write(self.MAGIC + struct.pack('<IIII', self.VERSION, self.num_slices, num_pix_x, num_pix_y))
+            self._wrote_header = True
+        self._file.write(struct.pack('<I', len(runs)))
+        self._file.write(runs.tobytes())
+
+    def close(self):
+        try:
+            super(RleLayerWriter, self).close()
+        finally:
+            self._file.close()
+
+
+WRITERS = {'jpg': (ImageStackWriter, '{}{}.jpg'),
+           'png': (ImageStackWriter, '{}{}.png'),
+           'tiff': (ImageStackWriter, '{}{}.tif'),
+           'multipage_tiff': (MultiPageTiffWriter, '{}_slices{}.tif'),
+           'npy': (NpyVolumeWriter, '{}_slices{}.npy'),
+           'rle': (RleLayerWriter, '{}_slices{}.rle')}
+
+
+def get_default_path_format(slice_format):
+    """
+    :return: the default output path format of slice_format, with a {} for the input file path and one for the slice
+    """
+    if slice_format not in WRITERS:
+        raise Exception('unknown slice format: {}, not one of: {}'.format(slice_format, ', '.join(sorted(WRITERS))))
+    return WRITERS[slice_format][1]
+
+
+def writes_single_file(slice_format):
+    get_default_path_format(slice_format)
+    return not issubclass(WRITERS[slice_format][0], ImageStackWriter)
+
+
+def get_output_path(slice_format, path_format, index):
+    """
+    :return: the path that slice number index ends up in
+    """
+    return path_format.format('' if writes_single_file(slice_format) else index)
+
+
+def make_slice_writer(slice_format, path_format, num_slices, max_waiting=None):
+    get_default_path_format(slice_format)
+    return WRITERS[slice_format][0](path_format, num_slices, max_waiting)
+
+
+class BackgroundWriter(object):
+    """
+    writes slices from a thread, rasters wait in a queue of max_waiting
+    (which bounds the memory used, when the ray-firing is faster than the writing)
+    """
+    def __init__(self, writer, max_waiting=4, on_written=None):
+        """
+        :param on_written:  called with the slice number of every slice written (from the writing thread)
+        """
+        self.writer = writer
+        self.on_written = on_written
+        self._queue = Queue.Queue(max_waiting)
+        self._errors = []
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            index, raster = item
+            try:
+                if not self._errors:
+                    self.writer.write(index, raster)
+                    if self.on_written is not None:
+                        self.on_written(index)
+            except Exception as e:
+                self._errors.append(e)
+                # nothing more is written, so don't leave anything waiting for its turn
+                self.writer.abort()
+            finally:
+                raster.close()
+
+    def wait_for_turn(self, index):
+        """
+        block until slice number index can be handed over without too many slices piling up
+        (see SliceWriter.wait_for_turn), i.e. before making its raster
+        """
+        if self._errors:
+            raise self._errors[0]
+        self.writer.wait_for_turn(index)
+
+    def put(self, index, raster):
+        """
+        hand over the raster (a RasterBuffer) of slice number index, it's closed once written
+        """
+        try:
+            self.wait_for_turn(index)
+        except Exception:
+            raster.close()
+            raise
+        self._queue.put((index, raster))
+
+    def abort(self):
+        """
+        make whatever waits for its turn raise, when a slice isn't ever going to be handed over
+        """
+        self.writer.abort()
+
+    def close(self, raise_errors=True):
+        """
+        wait for everything to be written, raising the first error the writing ran into
+        :param raise_errors:  False when closing because of another error, that shouldn't be hidden
+        """
+        if not raise_errors:
+            self.abort()
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self.writer.close()
+        except Exception as e:
+            self._errors.append(e)
+        if self._errors and raise_errors:
+            raise self._errors[0]
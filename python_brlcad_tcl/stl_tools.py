@@ -0,0 +1,234 @@
+"""
+Helpers for choosing g-stl tessellation tolerances and inspecting the STL files it writes.
+"""
+import os
+import math
+import struct
+from collections import namedtuple
+
+# external libs
+import numpy
+
+
+# g-stl takes its absolute tolerance in mm, while the database may be in other units
+UNITS_TO_MM = {'um': 0.001,
+               'mm': 1.,
+               'cm': 10.,
+               'm': 1000.,
+               'in': 25.4,
+               'ft': 304.8}
+
+
+class StlTolerances(object):
+    """
+    The three g-stl tessellation tolerances:
+    absolute (-a, mm), relative (-r, fraction of the object "size") and normal (-n, radians).
+    """
+    def __init__(self, absolute, relative, normal):
+        self.absolute = absolute
+        self.relative = relative
+        self.normal = normal
+
+    def as_args(self):
+        return '-a {} -r {} -n {}'.format(self.absolute, self.relative, self.normal)
+
+    def coarsened(self, factor):
+        """
+        The number of facets on a curved surface grows roughly with 1/absolute
+        and with 1/normal^2, so scale the tolerances accordingly to shrink the count by 'factor'.
+        """
+        return StlTolerances(self.absolute * factor,
+                             min(self.relative * factor, 1.),
+                             min(self.normal * math.sqrt(factor), math.pi / 2))
+
+    def __repr__(self):
+        return 'StlTolerances({})'.format(self.as_args())
+
+
+def get_bounding_box_size(xyz1, xyz2):
+    return math.sqrt(sum([(a - b) ** 2 for a, b in zip(xyz1, xyz2)]))
+
+
+def get_bounding_box_area(xyz1, xyz2):
+    """
+    the surface area of the bounding-box, which the number of facets at a given edge length grows with
+    """
+    x, y, z = [abs(a - b) for a, b in zip(xyz1, xyz2)]
+    return 2. * (x * y + y * z + z * x)
+
+
+def get_tolerances_for_budget(size, triangle_budget, units='mm'):
+    """
+    Estimate tessellation tolerances that keep an object of the given
+    bounding-box diagonal 'size' (in model units) near 'triangle_budget' facets.
+
+    A surface of extent 'size' split into 'triangle_budget' facets has an edge length of about
+    size * sqrt(6 / triangle_budget). For a curvature radius of size/2, that edge
+    leaves a chord error of edge^2 / (4 * size), and subtends 2 * edge / size radians.
+    """
+    assert triangle_budget > 0, triangle_budget
+    size = max(size, 1e-9)
+    edge = size * math.sqrt(6. / triangle_budget)
+    absolute = edge ** 2 / (4. * size)
+    normal = min(2. * edge / size, math.pi / 2)
+    return StlTolerances(absolute * UNITS_TO_MM.get(units, 1.),
+                         min(absolute / size, 1.),
+                         normal)
+
+
+def count_ascii_stl_triangles(stl_path):
+    """
+    count the facets in an ASCII STL file, line by line so that big files aren't loaded at once
+    """
+    count = 0
+    with open(stl_path, 'r') as f:
+        for line in f:
+            if line.lstrip().startswith('facet'):
+                count += 1
+    return count
+
+
+# one binary STL facet: the normal, three vertices and the (unused) attribute byte count
+BINARY_STL_DTYPE = numpy.dtype([('normal', '<f4', (3,)),
+                                ('vertices', '<f4', (3, 3)),
+                                ('attribute', '<u2')])
+
+StlSummary = namedtuple('StlSummary', ['path', 'num_triangles', 'bounds_min', 'bounds_max', 'num_degenerate_removed',
+                                       'num_vertices_welded'])
+
+
+def _get_keyword_values(tokens, keyword):
+    # the three numbers following every occurrence of keyword
+    idx = numpy.flatnonzero(tokens == keyword)
+    return tokens[idx[:, None] + numpy.arange(1, 4)].astype(numpy.float64)
+
+
+class VertexWelder(object):
+    """
+    Merges near-duplicate vertices, across all the chunks of a file: a vertex within tolerance of one kept before
+    it becomes (exactly) the nearest such one, any other vertex is kept. The vertices kept are in a grid of cells
+    tolerance wide, so only the cells around a vertex are searched.
+    """
+    # the cell offsets around (and including) a vertex's cell
+    NEIGHBOURS = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+
+    def __init__(self, tolerance):
+        self.tolerance = float(tolerance)
+        # cell -> [vertex, ...]
+        self.cells = {}
+        self.num_welded = 0
+
+    def weld(self, vertices):
+        """
+        :param vertices:  an (n, 3) array
+        :return:          the vertices, welded (in the order they come in)
+        """
+        # (a vertex is usually shared by several facets, so only look every one up once)
+        unique, first_index, inverse = numpy.unique(vertices, axis=0, return_index=True, return_inverse=True)
+        # (plain floats: this loop is where the time goes)
+        unique_vertices = [tuple(v) for v in unique.tolist()]
+        cells = [tuple(c) for c in numpy.floor(unique / self.tolerance).astype(numpy.int64).tolist()]
+        welded = numpy.empty_like(unique)
+        max_distance_squared = self.tolerance ** 2
+        # in the order they come in
+        for i in numpy.argsort(first_index).tolist():
+            x, y, z = vertex = unique_vertices[i]
+            cell_x, cell_y, cell_z = cells[i]
+            nearest = None
+            nearest_distance_squared = max_distance_squared
+            for i_offset, j_offset, k_offset in self.NEIGHBOURS:
+                for other in self.cells.get((cell_x + i_offset, cell_y + j_offset, cell_z + k_offset), ()):
+                    distance_squared = (other[0] - x) ** 2 + (other[1] - y) ** 2 + (other[2] - z) ** 2
+                    if distance_squared <= nearest_distance_squared:
+                        nearest, nearest_distance_squared = other, distance_squared
+            if nearest is None:
+                self.cells.setdefault(cells[i], []).append(vertex)
+                nearest = vertex
+            elif nearest != vertex:
+                self.num_welded += 1
+            welded[i] = nearest
+        return welded[inverse.ravel()]
+
+
+def ascii_stl_to_binary(ascii_path, binary_path=None, weld_tolerance=None, chunk_bytes=8 * 2**20):
+    """
+    Convert an ASCII STL (as written by g-stl) into a binary STL.
+
+    The ASCII file is memory-mapped and parsed in chunks that end on an 'endfacet' line,
+    so the memory used is bounded by chunk_bytes, not by the size of the file
+    (welding also keeps every distinct vertex, to weld the later ones into).
+
+    :param ascii_path:      the ASCII STL to read
+    :param binary_path:     where to write the binary STL, defaults to replacing ascii_path
+    :param weld_tolerance:  if set, the vertices within this distance (model units) of each other are welded
+                            into one (see VertexWelder), and the facets that collapse (two corners the same)
+                            are dropped
+    :param chunk_bytes:     approximate number of ASCII bytes parsed at a time
+    :return:                a StlSummary
+    """
+    in_place = binary_path is None or os.path.abspath(binary_path) == os.path.abspath(ascii_path)
+    out_path = '{}.binary_tmp'.format(ascii_path) if in_place else binary_path
+
+    num_triangles = 0
+    num_degenerate_removed = 0
+    bounds_min = numpy.full(3, numpy.inf)
+    bounds_max = numpy.full(3, -numpy.inf)
+    welder = VertexWelder(weld_tolerance) if weld_tolerance else None
+
+    data = numpy.memmap(ascii_path, dtype=numpy.uint8, mode='r') if os.path.getsize(ascii_path) else []
+    with open(out_path, 'wb') as out_f:
+        out_f.write(struct.pack('<80sI', b'binary STL converted by python_brlcad_tcl', 0))
+        start = 0
+        while start < len(data):
+            end = min(start + chunk_bytes, len(data))
+            chunk = data[start:end].tobytes()
+            if end < len(data):
+                # only parse whole facets, the rest is picked up by the next chunk
+                last_facet_end = chunk.rfind(b'endfacet')
+                if last_facet_end < 0:
+                    # a facet bigger than the chunk?! grow the chunk and try again
+                    chunk_bytes *= 2
+                    continue
+                end = start + last_facet_end + len(b'endfacet')
+                chunk = chunk[:last_facet_end + len(b'endfacet')]
+            start = end
+
+            tokens = numpy.array(chunk.split())
+            if not len(tokens):
+                continue
+            normals = _get_keyword_values(tokens, b'normal')
+            vertices = _get_keyword_values(tokens, b'vertex').reshape(-1, 3, 3)
+            assert len(normals) == len(vertices), 'malformed STL facets in {}'.format(ascii_path)
+
+            if welder is not None:
+                vertices = welder.weld(vertices.reshape(-1, 3)).reshape(-1, 3, 3)
+                degenerate = (numpy.all(vertices[:, 0] == vertices[:, 1], axis=1) |
+                              numpy.all(vertices[:, 1] == vertices[:, 2], axis=1) |
+                              numpy.all(vertices[:, 2] == vertices[:, 0], axis=1))
+                num_degenerate_removed += int(degenerate.sum())
+                normals = normals[~degenerate]
+                vertices = vertices[~degenerate]
+            if not len(vertices):
+                continue
+
+            bounds_min = numpy.minimum(bounds_min, vertices.reshape(-1, 3).min(axis=0))
+            bounds_max = numpy.maximum(bounds_max, vertices.reshape(-1, 3).max(axis=0))
+
+            facets = numpy.zeros(len(vertices), dtype=BINARY_STL_DTYPE)
+            facets['normal'] = normals
+            facets['vertices'] = vertices
+            out_f.write(facets.tobytes())
+            num_triangles += len(facets)
+
+        # now that the count is known, fill it in after the header
+        out_f.seek(80)
+        out_f.write(struct.pack('<I', num_triangles))
+    del data
+
+    if in_place:
+        os.remove(ascii_path)
+        os.rename(out_path, ascii_path)
+        out_path = ascii_path
+    return StlSummary(out_path, num_triangles,
+                      tuple(float(c) for c in bounds_min), tuple(float(c) for c in bounds_max),
+                      num_degenerate_removed, welder.num_welded if welder is not None else 0)
@@ -0,0 +1,175 @@
+"""
+Records a span for every external BRL-CAD tool (mged, g-stl, rt, nirt) invocation:
+what was run, against which database, how long it took and how much data went through it.
+"""
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+
+
+class ToolInvocation(object):
+    def __init__(self, tool, args, database=None):
+        self.tool = tool
+        self.args = args
+        self.database = database
+        self.start_time = None
+        self.wall_time = None
+        # NOTE: measured from the children's rusage of this process, so it also includes any
+        # other child process that finished while this one was running
+        self.child_cpu_time = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.exit_status = None
+        self.pid = os.getpid()
+        self.thread_id = threading.current_thread().ident
+        self._start_child_cpu = None
+
+    @staticmethod
+    def _get_child_cpu_time():
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def start(self):
+        self.start_time = time.time()
+        self._start_child_cpu = self._get_child_cpu_time()
+
+    def finish(self, exit_status):
+        self.wall_time = time.time() - self.start_time
+        self.child_cpu_time = self._get_child_cpu_time() - self._start_child_cpu
+        self.exit_status = exit_status
+
+    def to_dict(self):
+        return {'tool': self.tool,
+                'args': self.args,
+                'database': self.database,
+                'start_time': self.start_time,
+                'wall_time': self.wall_time,
+                'child_cpu_time': self.child_cpu_time,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'exit_status': self.exit_status,
+                'pid': self.pid,
+                'thread_id': self.thread_id}
+
+    def __repr__(self):
+        return 'ToolInvocation({tool}, {wall_time:.3f}s wall, exit {exit_status})'.format(**self.to_dict())
+
+
+class ToolTracer(object):
+    """
+    Collects ToolInvocations in memory (self.events),
+    optionally appending each one as a JSON line to jsonl_path as soon as it finishes.
+    """
+    def __init__(self, jsonl_path=None):
+        self.events = []
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+
+    def record(self, invocation):
+        with self._lock:
+            self.events.append(invocation)
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(invocation.to_dict()) + '\n')
+
+    def span(self, tool, args, database=None):
+        """
+        for tool runs that don't go through run_tool, i.e. when stdin/stdout are streamed:
+
+            with tracer.span('nirt', args, g_path) as invocation:
+                ...
+                invocation.bytes_in += len(data)
+                invocation.exit_status = proc.wait()
+        """
+        return _ToolSpan(self, ToolInvocation(tool, args, database))
+
+    def write_json_lines(self, path):
+        with open(path, 'w') as f:
+            for invocation in list(self.events):
+                f.write(json.dumps(invocation.to_dict()) + '\n')
+
+    def write_chrome_trace(self, path):
+        """
+        write the events in the Chrome trace event format, which can be opened with chrome://tracing
+        """
+        trace_events = []
+        for invocation in list(self.events):
+            args = invocation.to_dict()
+            trace_events.append({'name': invocation.tool,
+                                 'cat': 'brlcad',
+                                 'ph': 'X',
+                                 'ts': invocation.start_time * 1e6,
+                                 'dur': invocation.wall_time * 1e6,
+                                 'pid': invocation.pid,
+                                 'tid': invocation.thread_id,
+                                 'args': args})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self):
+        """
+        :return: {tool: {'count':, 'wall_time':, 'child_cpu_time':, 'bytes_in':, 'bytes_out':}}
+        """
+        totals = {}
+        for invocation in list(self.events):
+            tool_totals = totals.setdefault(invocation.tool, {'count': 0,
+                                                              'wall_time': 0.,
+                                                              'child_cpu_time': 0.,
+                                                              'bytes_in': 0,
+                                                              'bytes_out': 0})
+            tool_totals['count'] += 1
+            tool_totals['wall_time'] += invocation.wall_time or 0.
+            tool_totals['child_cpu_time'] += invocation.child_cpu_time or 0.
+            tool_totals['bytes_in'] += invocation.bytes_in
+            tool_totals['bytes_out'] += invocation.bytes_out
+        return totals
+
+
+class _ToolSpan(object):
+    def __init__(self, tracer, invocation):
+        self.tracer = tracer
+        self.invocation = invocation
+
+    def __enter__(self):
+        self.invocation.start()
+        return self.invocation
+
+    def __exit__(self, type, value, traceback):
+        self.invocation.finish(self.invocation.exit_status)
+        self.tracer.record(self.invocation)
+
+
+def get_tool_name(cmd):
+    first = cmd[0] if isinstance(cmd, (list, tuple)) else cmd.split()[0]
+    return os.path.basename(first or '')
+
+
+def run_tool(cmd, input_data=None, database=None, tracer=None, capture_output=True, stderr_to_stdout=False):
+    """
+    Run an external tool to completion, recording its ToolInvocation.
+    A string cmd is run through the shell, a list is run directly.
+    This is module-level, so that it can also be run by a multiprocessing pool
+    (in which case pass no tracer, and record the returned invocation in the parent process).
+
+    :return: (stdoutdata, stderrdata, invocation)
+    """
+    invocation = ToolInvocation(get_tool_name(cmd), cmd, database)
+    invocation.start()
+    if capture_output:
+        stdout = subprocess.PIPE
+        stderr = subprocess.STDOUT if stderr_to_stdout else subprocess.PIPE
+    else:
+        stdout = stderr = None
+    proc = subprocess.Popen(cmd, shell=not isinstance(cmd, (list, tuple)),
+                            stdin=subprocess.PIPE if input_data is not None else None,
+                            stdout=stdout, stderr=stderr)
+    (stdoutdata, stderrdata) = proc.communicate(input_data)
+    invocation.bytes_in = len(input_data or '')
+    invocation.bytes_out = len(stdoutdata or '') + len(stderrdata or '')
+    invocation.finish(proc.returncode)
+    if tracer is not None:
+        tracer.record(invocation)
+    return stdoutdata, stderrdata, invocation
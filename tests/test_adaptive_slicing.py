@@ -0,0 +1,89 @@
+import unittest
+
+# external libs
+import numpy
+
+from python_brlcad_tcl import csg
+from python_brlcad_tcl.brlcad_tcl import brlcad_tcl
+
+XYZ1, XYZ2 = [0, 0, 0], [100, 100, 110]
+
+
+def z_ranges(slice_coords):
+    return [(c1[2], c2[2]) for c1, c2 in slice_coords]
+
+
+def adaptive(slice_thickness, z_extents, max_slice_thickness=None, xyz1=XYZ1, xyz2=XYZ2):
+    return z_ranges(brlcad_tcl.get_adaptive_slice_coords(slice_thickness, xyz1, xyz2, z_extents,
+                                                         max_slice_thickness))
+
+
+def uniform(slice_thickness, xyz1=XYZ1, xyz2=XYZ2):
+    return z_ranges(brlcad_tcl.get_object_slice_coords(slice_thickness, xyz1, xyz2))
+
+
+class AdaptiveSliceCoordsTest(unittest.TestCase):
+    SCRIPT = ['title test\nunits mm\n',
+              'in base.s rpp 0 100 0 100 0 40\n',
+              'in hole.s rpp 40 60 40 60 10 30\n',
+              'in post.s rcc 50 50 40 0 0 50 20\n',
+              'in ball.s sph 50 50 90 20\n',
+              'r model.r u base.s - hole.s u post.s u ball.s\n']
+
+    def setUp(self):
+        self.z_extents = csg.Geometry.from_script(self.SCRIPT).get_z_extents(['model.r'])
+
+    def assertCoversTheBoundingBox(self, ranges):
+        self.assertEqual(ranges[0][0], XYZ1[2])
+        self.assertEqual(ranges[-1][1], XYZ2[2])
+        for (_, top), (bottom, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(top, bottom)
+
+    def test_z_extents(self):
+        self.assertEqual(self.z_extents, [(0, 40, False), (10, 30, False), (40, 90, False), (70, 110, True)])
+
+    def test_merges_where_the_cross_section_is_the_same(self):
+        # the base below, in and above the hole, the post up to the ball (in runs of at most 25),
+        # and the ball slice by slice
+        self.assertEqual(adaptive(5, self.z_extents, 25),
+                         [(0, 10), (10, 30), (30, 40), (40, 65), (65, 70), (70, 75), (75, 80), (80, 85),
+                          (85, 90), (90, 95), (95, 100), (100, 105), (105, 110)])
+
+    def test_never_more_than_uniform(self):
+        random = numpy.random.RandomState(0)
+        random_extents = [(z, z + h, v) for z, h, v in zip(random.uniform(0, 110, 20), random.uniform(0, 30, 20),
+                                                            random.uniform(size=20) < .2)]
+        for z_extents in (self.z_extents, random_extents):
+            for num_slices in range(1, 60):
+                slice_thickness = 110. / num_slices
+                for max_slice_thickness in (None, 3 * slice_thickness, 20):
+                    ranges = adaptive(slice_thickness, z_extents, max_slice_thickness)
+                    self.assertLessEqual(len(ranges), len(uniform(slice_thickness)),
+                                         (num_slices, max_slice_thickness))
+                    self.assertCoversTheBoundingBox(ranges)
+
+    def test_thinnest_max_is_uniform(self):
+        for slice_thickness in (5, 7, 110. / 13):
+            self.assertEqual(adaptive(slice_thickness, self.z_extents, 1e-9), uniform(slice_thickness))
+
+    def test_no_extents_is_one_slice(self):
+        self.assertEqual(adaptive(5, []), [(0, 110)])
+        self.assertEqual(len(adaptive(5, [], 20)), 6)
+        self.assertEqual(adaptive(5, [], xyz2=[100, 100, 0]), [])
+
+
+class ZExtentsTest(unittest.TestCase):
+    def test_varies(self):
+        geometry = csg.Geometry.from_script(['in box.s rpp 0 1 0 1 0 2\n',
+                                             'in upright.s rcc 0 0 0 0 0 5 1\n',
+                                             'in tilted.s rcc 0 0 0 1 0 5 1\n',
+                                             'in cone.s trc 0 0 0 0 0 5 2 1\n',
+                                             'in ball.s sph 0 0 0 1\n'])
+        varies = dict((name, [v for _, _, v in geometry.get_z_extents([name])])
+                      for name in ('box.s', 'upright.s', 'tilted.s', 'cone.s', 'ball.s'))
+        self.assertEqual(varies, {'box.s': [False], 'upright.s': [False], 'tilted.s': [True], 'cone.s': [True],
+                                  'ball.s': [True]})
+
+
+if __name__ == '__main__':
+    unittest.main()
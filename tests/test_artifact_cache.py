@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from python_brlcad_tcl import artifact_cache
+from python_brlcad_tcl.artifact_cache import ArtifactCache
+
+
+class HashScriptTest(unittest.TestCase):
+    SCRIPT = ['title test\nunits mm\n', 'in box.s rpp 0 1 0 1 0 1\n', 'r box.r u box.s\n']
+
+    def test_same_script_same_hash(self):
+        self.assertEqual(artifact_cache.hash_script(self.SCRIPT), artifact_cache.hash_script(list(self.SCRIPT)))
+
+    def test_any_change_changes_the_hash(self):
+        script_hash = artifact_cache.hash_script(self.SCRIPT)
+        self.assertNotEqual(script_hash, artifact_cache.hash_script(self.SCRIPT[:-1]))
+        self.assertNotEqual(script_hash, artifact_cache.hash_script(list(reversed(self.SCRIPT))))
+        self.assertNotEqual(script_hash, artifact_cache.hash_script(self.SCRIPT + ['kill box.r\n']))
+
+    def test_non_ascii_entries(self):
+        text = u'title caf\xe9 — 中\n'
+        # a byte string (the str of Python 2) and its text hash the same
+        self.assertEqual(artifact_cache.hash_script([text]), artifact_cache.hash_script([text.encode('utf-8')]))
+        self.assertNotEqual(artifact_cache.hash_script([text]), artifact_cache.hash_script([u'title cafe\n']))
+
+    def test_iterators(self):
+        self.assertEqual(artifact_cache.hash_script(iter(self.SCRIPT)), artifact_cache.hash_script(self.SCRIPT))
+
+
+class MakeKeyTest(unittest.TestCase):
+    def test_keys(self):
+        self.assertEqual(artifact_cache.make_key('mged', [1, 2], {'a': 1, 'b': 2}),
+                         artifact_cache.make_key('mged', [1, 2], {'b': 2, 'a': 1}))
+        self.assertNotEqual(artifact_cache.make_key('mged', [1, 2]), artifact_cache.make_key('mged', [2, 1]))
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = ArtifactCache(os.path.join(self.temp_dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_put_and_fetch(self):
+        key = artifact_cache.make_key('test')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, [self.write('a', 'first'), self.write('b', 'second')])
+        outputs = [os.path.join(self.temp_dir, 'out_a'), os.path.join(self.temp_dir, 'out_b')]
+        self.assertTrue(self.cache.fetch(key, outputs))
+        self.assertEqual([self.read(p) for p in outputs], ['first', 'second'])
+        # a different number of outputs is a miss
+        self.assertFalse(self.cache.fetch(key, outputs[:1]))
+
+    def test_eviction(self):
+        self.cache.max_bytes = 1000
+        keys = [artifact_cache.make_key('test', i) for i in range(4)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, [self.write(str(i), 'x' * 400)])
+            # last used in the order they were put, whatever the resolution of the file times
+            manifest_path = os.path.join(self.cache._entry_dir(key), ArtifactCache.MANIFEST_NAME)
+            if os.path.isfile(manifest_path):
+                os.utime(manifest_path, (1000000 + i, 1000000 + i))
+        # the oldest ones went, to get under max_bytes
+        self.assertIsNone(self.cache.get(keys[0]))
+        self.assertIsNotNone(self.cache.get(keys[-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
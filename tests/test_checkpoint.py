@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+# external libs
+import numpy
+
+from python_brlcad_tcl.checkpoint import JobManifest
+
+
+class JobManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.temp_dir, 'job.manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_output(self, name, data='done'):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def test_resume(self):
+        manifest = JobManifest(self.manifest_path, 'inputs')
+        manifest.mark_done('slice0', [self.write_output('slice0.png')])
+        manifest.mark_done('slice1', [self.write_output('slice1.png')])
+
+        resumed = JobManifest(self.manifest_path, 'inputs')
+        self.assertTrue(resumed.is_done('slice0'))
+        self.assertTrue(resumed.is_done('slice1'))
+        self.assertFalse(resumed.is_done('slice2'))
+
+    def test_other_inputs_start_over(self):
+        manifest = JobManifest(self.manifest_path, 'inputs')
+        manifest.mark_done('slice0', [self.write_output('slice0.png')])
+        manifest.save_partial('slice1.band0', numpy.ones((2, 3)))
+
+        other = JobManifest(self.manifest_path, 'other inputs')
+        self.assertFalse(other.is_done('slice0'))
+        self.assertIsNone(other.load_partial('slice1.band0'))
+        self.assertFalse(os.path.isdir(other.parts_dir))
+
+    def test_changed_or_missing_outputs_are_not_done(self):
+        manifest = JobManifest(self.manifest_path, 'inputs')
+        changed = self.write_output('slice0.png')
+        missing = self.write_output('slice1.png')
+        manifest.mark_done('slice0', [changed])
+        manifest.mark_done('slice1', [missing])
+        self.write_output('slice0.png', 'a different size')
+        os.remove(missing)
+
+        resumed = JobManifest(self.manifest_path, 'inputs')
+        self.assertFalse(resumed.is_done('slice0'))
+        self.assertFalse(resumed.is_done('slice1'))
+
+    def test_partials(self):
+        manifest = JobManifest(self.manifest_path, 'inputs')
+        band = numpy.arange(6, dtype=numpy.uint8).reshape(2, 3)
+        manifest.save_partial('slice0.band0', band)
+        manifest.save_partial('slice0.band1', band + 1)
+        manifest.save_partial('slice1.band0', band + 2)
+
+        resumed = JobManifest(self.manifest_path, 'inputs')
+        numpy.testing.assert_array_equal(resumed.load_partial('slice0.band1'), band + 1)
+        resumed.clear_partials('slice0.')
+        self.assertIsNone(resumed.load_partial('slice0.band0'))
+        numpy.testing.assert_array_equal(resumed.load_partial('slice1.band0'), band + 2)
+        self.assertEqual(sorted(os.listdir(resumed.parts_dir)), ['slice1.band0.npy'])
+
+    def test_corrupt_manifest_starts_over(self):
+        with open(self.manifest_path, 'w') as f:
+            f.write('{"input_hash": "inp')
+        manifest = JobManifest(self.manifest_path, 'inputs')
+        self.assertEqual(manifest.completed, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+# external libs
+import numpy
+
+from python_brlcad_tcl import csg
+
+DOWN = (0, 0, -1)
+
+
+def intervals(starts, ends):
+    """
+    :return: every ray's finite intervals, as lists of (start, end)
+    """
+    return [[(s, e) for s, e in zip(ray_starts, ray_ends) if numpy.isfinite(s)]
+            for ray_starts, ray_ends in zip(starts, ends)]
+
+
+def make_intervals(*rays):
+    k = max(len(ray) for ray in rays)
+    starts, ends = numpy.full((len(rays), k), numpy.inf), numpy.full((len(rays), k), numpy.inf)
+    for i, ray in enumerate(rays):
+        for j, (s, e) in enumerate(ray):
+            starts[i, j], ends[i, j] = s, e
+    return starts, ends
+
+
+class CombineTest(unittest.TestCase):
+    def setUp(self):
+        self.a = make_intervals([(0, 10)], [(0, 2), (4, 6)], [], [(1, 3)])
+        self.b = make_intervals([(5, 15)], [(1, 5)], [(2, 3)], [(3, 4)])
+
+    def test_union(self):
+        self.assertEqual(intervals(*csg.combine(self.a, self.b, 'u')),
+                         [[(0, 15)], [(0, 6)], [(2, 3)], [(1, 4)]])
+
+    def test_intersection(self):
+        self.assertEqual(intervals(*csg.combine(self.a, self.b, '+')),
+                         [[(5, 10)], [(1, 2), (4, 5)], [], []])
+
+    def test_subtraction(self):
+        self.assertEqual(intervals(*csg.combine(self.a, self.b, '-')),
+                         [[(0, 5)], [(0, 1), (5, 6)], [], [(1, 3)]])
+
+    def test_unknown_operation(self):
+        self.assertRaises(csg.UnsupportedGeometry, csg.combine, self.a, self.b, 'x')
+
+
+class GeometryTest(unittest.TestCase):
+    SCRIPT = ['title test\nunits mm\n',
+              'in base.s rpp 0 100 0 100 0 40\n',
+              'in hole.s rpp 40 60 40 60 10 30\n',
+              'in post.s rcc 50 50 40 0 0 50 20\n',
+              'in ball.s sph 50 50 90 20\n',
+              'r model.r u base.s - hole.s u post.s u ball.s\n']
+
+    def setUp(self):
+        self.geometry = csg.Geometry.from_script(self.SCRIPT)
+
+    def shoot_down(self, name, xys, z=200):
+        origins = numpy.array([(x, y, z) for x, y in xys], dtype=float)
+        return intervals(*self.geometry.shoot(name, origins, DOWN))
+
+    def assertIntervalsEqual(self, rays, expected):
+        self.assertEqual([len(ray) for ray in rays], [len(ray) for ray in expected])
+        for ray, expected_ray in zip(rays, expected):
+            numpy.testing.assert_allclose(numpy.reshape(ray, (-1, 2)), numpy.reshape(expected_ray, (-1, 2)))
+
+    def test_tops(self):
+        self.assertEqual(self.geometry.tops(), ['model.r'])
+
+    def test_bbox(self):
+        numpy.testing.assert_allclose(self.geometry.bbox(['model.r']), [[0, 0, 0], [100, 100, 110]])
+
+    def test_primitives(self):
+        self.assertIntervalsEqual(self.shoot_down('base.s', [(10, 10), (150, 10)]), [[(160, 200)], []])
+        # through the middle of the ball, and through the post off its middle
+        self.assertIntervalsEqual(self.shoot_down('ball.s', [(50, 50)]), [[(90, 130)]])
+        self.assertIntervalsEqual(self.shoot_down('post.s', [(60, 50), (71, 50)]), [[(110, 160)], []])
+
+    def test_booleans(self):
+        # the ball and the post overlap, and the post stands on the base: one interval down to the hole,
+        # then the base below the hole. Off the middle, the ball is entered lower down
+        self.assertIntervalsEqual(self.shoot_down('model.r', [(50, 50), (45, 45), (10, 10)]),
+                                  [[(90, 170), (190, 200)],
+                                   [(110 - numpy.sqrt(20 ** 2 - 2 * 5 ** 2), 170), (190, 200)],
+                                   [(160, 200)]])
+
+    def test_kill(self):
+        geometry = csg.Geometry.from_script(self.SCRIPT + ['kill hole.s\n'])
+        origins = numpy.array([(50, 50, 35)], dtype=float)
+        # the hole is gone, so the base is solid below the ray's origin
+        self.assertIntervalsEqual(intervals(*geometry.shoot('base.s', origins, DOWN)), [[(-5, 35)]])
+        self.assertIntervalsEqual(intervals(*geometry.shoot('hole.s', origins, DOWN)), [[]])
+
+    def test_first_hits(self):
+        origins = numpy.array([(50, 50, 120), (45, 45, 35), (150, 50, 120)], dtype=float)
+        rays, depths = self.geometry.shoot_first_hits('model.r', origins, DOWN)
+        # from above the ball down to the hole, and from inside the base (only what's in front of the origin)
+        self.assertEqual(list(rays), [0, 1])
+        numpy.testing.assert_allclose(depths, [80, 5])
+
+    def test_unsupported(self):
+        self.assertRaises(csg.UnsupportedGeometry, csg.Geometry.from_script, ['in t.s tor 0 0 0 0 0 1 5 1\n'])
+        self.assertRaises(csg.UnsupportedGeometry, csg.Geometry.from_script, ['oed / a.r/b.s\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from python_brlcad_tcl import progress as progress_module
+from python_brlcad_tcl.progress import ExportProgress, ProgressBar, ProgressObserver
+
+
+class RecordingObserver(ProgressObserver):
+    def __init__(self):
+        self.updates = []
+        self.finished = 0
+
+    def update(self, progress):
+        self.updates.append((progress.slices_done, progress.fraction_done))
+
+    def finish(self, progress):
+        self.finished += 1
+
+
+class ExportProgressTest(unittest.TestCase):
+    def setUp(self):
+        self.observer = RecordingObserver()
+        # (only the forced updates reach the observer)
+        self.progress = ExportProgress([self.observer], min_interval=1000)
+
+    def test_fraction_from_rays(self):
+        self.progress.set_totals(4, 100)
+        self.progress.add_rays_fired(50)
+        self.assertEqual(self.progress.fraction_done, 0.)
+        self.progress.add_rays_parsed(25)
+        self.progress.add_rays(25)
+        self.assertEqual(self.progress.fraction_done, .5)
+        self.assertEqual(self.progress.rays_fired, 75)
+
+    def test_fraction_from_slices(self):
+        self.assertIsNone(self.progress.fraction_done)
+        self.assertIsNone(self.progress.eta)
+        self.progress.set_totals(4)
+        self.progress.add_slices_done()
+        self.assertEqual(self.progress.fraction_done, .25)
+        self.assertIsNotNone(self.progress.eta)
+
+    def test_last_slice_forces_an_update(self):
+        self.progress.set_totals(3)
+        self.progress.add_slices_done()
+        self.progress.add_slices_done()
+        self.assertEqual(self.observer.updates, [(0, 0.)])
+        self.progress.add_slices_done()
+        self.assertEqual(self.observer.updates, [(0, 0.), (3, 1.)])
+        self.progress.finish()
+        self.assertEqual(self.observer.finished, 1)
+
+    def test_resuming_everything(self):
+        self.progress.set_totals(3, 300, num_slices_done=3, num_rays_done=300)
+        self.assertEqual(self.progress.slices_done, 3)
+        self.assertEqual(self.progress.fraction_done, 1.)
+        self.assertEqual(self.progress.eta, 0.)
+        self.assertEqual(self.progress.slices_per_second, 0.)
+
+    def test_resumed_work_is_not_in_the_throughput(self):
+        self.progress.set_totals(4, 400, num_slices_done=2, num_rays_done=100)
+        self.progress.add_rays_skipped(100)
+        self.assertEqual(self.progress.fraction_done, .5)
+        # nothing done by this run yet: no telling how long the rest takes
+        self.assertIsNone(self.progress.eta)
+        self.progress.add_rays(100)
+        self.assertEqual(self.progress.fraction_done, .75)
+        self.assertIsNotNone(self.progress.eta)
+        self.assertEqual((self.progress.rays_parsed, self.progress.rays_skipped), (100, 200))
+
+    def test_make(self):
+        self.assertIsNone(ExportProgress.make(None))
+        self.assertIsNone(ExportProgress.make(False))
+        self.assertIs(ExportProgress.make(self.progress), self.progress)
+        self.assertIsInstance(ExportProgress.make(True).observers[0], ProgressBar)
+        calls = []
+        made = ExportProgress.make([self.observer, calls.append])
+        self.assertIs(made.observers[0], self.observer)
+        made.set_totals(1)
+        self.assertEqual(calls, [made])
+
+
+class ProgressBarTest(unittest.TestCase):
+    def test_output(self):
+        stream = StringIO()
+        progress = ExportProgress([ProgressBar(stream, width=10)])
+        progress.set_totals(2, num_slices_done=2)
+        progress.finish()
+        lines = stream.getvalue().split('\n')
+        self.assertTrue(lines[0].startswith('\r[##########] 100%  2/2 slices  ETA 0:00:00'))
+        self.assertTrue(lines[1].startswith('2 slices in 0:00:0'))
+
+    def test_unknown_total(self):
+        stream = StringIO()
+        ProgressBar(stream, width=4).update(ExportProgress())
+        self.assertTrue(stream.getvalue().startswith('\r[----]   0%  0/? slices  ETA ?'))
+
+    def test_formats(self):
+        self.assertEqual(progress_module.format_count(999), '999')
+        self.assertEqual(progress_module.format_count(1.5e6), '1.5M')
+        self.assertEqual(progress_module.format_duration(3723.4), '1:02:03')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+# external libs
+import numpy
+
+from python_brlcad_tcl.brlcad_tcl import brlcad_tcl
+
+
+class RasterGridTest(unittest.TestCase):
+    def test_integer_bounds(self):
+        self.assertEqual(brlcad_tcl._get_raster_step([0, 0, 0], [100, 100, 10], 64, 64), 1.5625)
+        xs, ys = brlcad_tcl._get_raster_grid([0, 0, 0], [100, 100, 10], 64, 64)
+        # the whole of the model, not just 0..63
+        numpy.testing.assert_allclose(xs, numpy.arange(64) * 1.5625)
+        numpy.testing.assert_allclose(ys, numpy.arange(64) * 1.5625)
+
+    def test_small_integer_bounds(self):
+        # (smaller than the pixel counts: an integer step would be 0)
+        xs, ys = brlcad_tcl._get_raster_grid([0, 0, 0], [10, 5, 1], 64, 64)
+        self.assertEqual(len(xs), 64)
+        self.assertEqual(len(ys), 32)
+        self.assertAlmostEqual(xs[-1], 63 * 10 / 64.)
+
+    def test_float_pixel_counts(self):
+        self.assertEqual(brlcad_tcl._get_raster_step([0, 0, 0], [100, 50, 10], 63.5, 10.), 5.)
+        xs, ys = brlcad_tcl._get_raster_grid([0, 0, 0], [100, 50, 10], 63.5, 10.)
+        self.assertEqual((len(xs), len(ys)), (20, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
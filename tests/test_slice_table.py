@@ -0,0 +1,67 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from python_brlcad_tcl.brlcad_tcl import brlcad_tcl
+
+
+class SliceTableTest(unittest.TestCase):
+    """
+    the slice tables of the exports that don't need BRL-CAD
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.brl_db = brlcad_tcl(os.path.join(self.temp_dir, 'model.tcl'), 'test', units='mm',
+                                 cache=os.path.join(self.temp_dir, 'cache'))
+        self.brl_db.add_script_string('in base.s rpp 0 100 0 100 0 40')
+        self.brl_db.add_script_string('in ball.s sph 50 50 90 20')
+        self.brl_db.add_script_string('r model.r u base.s u ball.s')
+
+    def export(self, num_slices, **kwargs):
+        return self.brl_db.export_model_slices(num_slices, 1000, 1000, output_format='raster', raster_engine='numpy',
+                                               output_option_kwargs={'num_pix_x': 8, 'num_pix_y': 8}, **kwargs)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_table(self, name):
+        with open(os.path.join(self.temp_dir, name)) as f:
+            return json.load(f)
+
+    def test_adaptive_slices(self):
+        slice_zs = self.export(11, adaptive_slicing=True)
+        # the base in one slice, the gap in another, and the ball slice by slice
+        self.assertEqual(slice_zs, [(0, 40), (40, 70)] + [(z, z + 10) for z in range(70, 110, 10)])
+        table = self.read_table('model.slices.json')
+        self.assertEqual(table['units'], 'mm')
+        self.assertEqual([(s['z_min'], s['z_max']) for s in table['slices']], slice_zs)
+        self.assertEqual([s['thickness'] for s in table['slices']], [40, 30, 10, 10, 10, 10])
+        self.assertEqual([os.path.basename(s['path']) for s in table['slices']],
+                         ['model{}.jpg'.format(i) for i in range(6)])
+        self.assertEqual(brlcad_tcl.read_slice_table(os.path.join(self.temp_dir, 'model.slices.json')), slice_zs)
+
+    def test_single_file(self):
+        slice_zs = self.export(4, slice_format='npy')
+        self.assertEqual(len(slice_zs), 4)
+        self.assertAlmostEqual(slice_zs[-1][1], 110)
+        # a single file of slices
+        table = self.read_table('model_slices.slices.json')
+        self.assertEqual(set(os.path.basename(s['path']) for s in table['slices']), set(['model_slices.npy']))
+
+    def test_cached_export(self):
+        first = self.export(5)
+        os.remove(os.path.join(self.temp_dir, 'model.slices.json'))
+
+        def not_sliced_again(*args):
+            raise AssertionError('not restored from the cache')
+
+        self.brl_db._write_slice_table = not_sliced_again
+        # the table comes out of the cache, with the slices
+        self.assertEqual(self.export(5), first)
+        self.assertEqual(len(self.read_table('model.slices.json')['slices']), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
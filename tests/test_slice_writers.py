@@ -0,0 +1,163 @@
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+# external libs
+import numpy
+
+from python_brlcad_tcl import slice_writers
+from python_brlcad_tcl.raster_buffer import RasterBuffer
+
+
+def make_raster(index, num_pix_x=4, num_pix_y=5):
+    raster = RasterBuffer(num_pix_x, num_pix_y, 'binary')
+    coverage = numpy.zeros((num_pix_x, num_pix_y))
+    # a different layer for every slice
+    coverage.flat[:index % coverage.size + 1] = 1
+    raster.set_coverage(coverage)
+    return raster
+
+
+def read_rle(path):
+    with open(path, 'rb') as f:
+        magic, version, num_layers, num_pix_x, num_pix_y = struct.unpack('<4sIIII', f.read(20))
+        layers = []
+        for _ in range(num_layers):
+            num_runs, = struct.unpack('<I', f.read(4))
+            runs = numpy.frombuffer(f.read(4 * num_runs), dtype='<u4')
+            layers.append(slice_writers.RleLayerWriter.decode(runs, num_pix_x, num_pix_y))
+    return layers
+
+
+class RleLayerWriterTest(unittest.TestCase):
+    def test_encode_decode(self):
+        for layer in (numpy.zeros((3, 4)), numpy.ones((3, 4)), numpy.eye(4), numpy.arange(12).reshape(3, 4) % 3):
+            runs = slice_writers.RleLayerWriter.encode(layer)
+            numpy.testing.assert_array_equal(slice_writers.RleLayerWriter.decode(runs, *layer.shape), layer != 0)
+
+
+class OrderedWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path_format = os.path.join(self.temp_dir, 'slices{}.rle')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_written_in_order_whatever_order_they_come_in(self):
+        num_slices = 12
+        writer = slice_writers.BackgroundWriter(slice_writers.make_slice_writer('rle', self.path_format, num_slices,
+                                                                                max_waiting=num_slices))
+        for i in [5, 0, 11, 2, 1, 3, 4, 10, 6, 8, 7, 9]:
+            writer.put(i, make_raster(i))
+        writer.close()
+        layers = read_rle(self.path_format.format(''))
+        for i, layer in enumerate(layers):
+            numpy.testing.assert_array_equal(layer, make_raster(i).to_array())
+
+    def test_missing_slices_raise(self):
+        writer = slice_writers.BackgroundWriter(slice_writers.make_slice_writer('rle', self.path_format, 3))
+        writer.put(0, make_raster(0))
+        writer.put(2, make_raster(2))
+        self.assertRaises(Exception, writer.close)
+
+    def test_slices_ahead_wait_for_their_turn(self):
+        writer = slice_writers.make_slice_writer('rle', self.path_format, 10, max_waiting=2)
+        # within max_waiting of the next slice to write: no waiting
+        writer.wait_for_turn(0)
+        writer.wait_for_turn(1)
+        turns = []
+        waiter = threading.Thread(target=lambda: turns.append(writer.wait_for_turn(3)))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertEqual(turns, [])
+        writer.write(1, make_raster(1))
+        time.sleep(0.1)
+        # slice 1 is held on to, until slice 0 is written
+        self.assertEqual(turns, [])
+        writer.write(0, make_raster(0))
+        waiter.join(5)
+        self.assertEqual(turns, [None])
+        writer.close()
+
+    def test_abort_wakes_the_waiting(self):
+        writer = slice_writers.BackgroundWriter(slice_writers.make_slice_writer('rle', self.path_format, 10,
+                                                                                max_waiting=2))
+        errors = []
+
+        def wait(i):
+            try:
+                writer.wait_for_turn(i)
+            except Exception as e:
+                errors.append(e)
+
+        waiters = [threading.Thread(target=wait, args=(i,)) for i in (4, 7)]
+        for waiter in waiters:
+            waiter.start()
+        time.sleep(0.1)
+        writer.abort()
+        for waiter in waiters:
+            waiter.join(5)
+        self.assertEqual(len(errors), 2)
+        self.assertRaises(Exception, writer.put, 5, make_raster(5))
+        writer.close(raise_errors=False)
+
+    def test_bounded_with_many_threads(self):
+        num_slices = 40
+        writer = slice_writers.make_slice_writer('rle', self.path_format, num_slices, max_waiting=3)
+        background_writer = slice_writers.BackgroundWriter(writer)
+        most_waiting = [0]
+        get_slice_data = writer._get_slice_data
+
+        def count_waiting(raster):
+            most_waiting[0] = max(most_waiting[0], len(writer._waiting) + 1)
+            return get_slice_data(raster)
+
+        writer._get_slice_data = count_waiting
+        to_do = list(range(num_slices))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    if not to_do:
+                        return
+                    i = to_do.pop(0)
+                background_writer.wait_for_turn(i)
+                # the slices are done out of order
+                time.sleep(0.001 * ((i * 7) % 5))
+                background_writer.put(i, make_raster(i))
+
+        workers = [threading.Thread(target=work) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        background_writer.close()
+        self.assertLessEqual(most_waiting[0], 3)
+        self.assertEqual(len(read_rle(self.path_format.format(''))), num_slices)
+
+
+class ImageStackWriterTest(unittest.TestCase):
+    def test_paths(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path_format = os.path.join(temp_dir, 'slice{}.png')
+            writer = slice_writers.BackgroundWriter(slice_writers.make_slice_writer('png', path_format, 3))
+            for i in (2, 0, 1):
+                writer.put(i, make_raster(i))
+            writer.close()
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['slice0.png', 'slice1.png', 'slice2.png'])
+            self.assertEqual(slice_writers.get_output_path('png', path_format, 2), path_format.format(2))
+            self.assertTrue(slice_writers.writes_single_file('rle'))
+            self.assertFalse(slice_writers.writes_single_file('jpg'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+# external libs
+import numpy
+
+from python_brlcad_tcl import stl_tools
+
+
+def write_ascii_stl(path, facets):
+    with open(path, 'w') as f:
+        f.write('solid test\n')
+        for normal, vertices in facets:
+            f.write('  facet normal {} {} {}\n    outer loop\n'.format(*normal))
+            for vertex in vertices:
+                f.write('      vertex {} {} {}\n'.format(*vertex))
+            f.write('    endloop\n  endfacet\n')
+        f.write('endsolid test\n')
+
+
+def read_binary_stl(path):
+    with open(path, 'rb') as f:
+        f.read(80)
+        num_triangles = numpy.frombuffer(f.read(4), dtype='<u4')[0]
+        facets = numpy.frombuffer(f.read(), dtype=stl_tools.BINARY_STL_DTYPE)
+    return num_triangles, facets
+
+
+class AsciiStlToBinaryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        random = numpy.random.RandomState(0)
+        self.facets = [(random.uniform(-1, 1, 3), random.uniform(-100, 100, (3, 3))) for _ in range(50)]
+        self.ascii_path = os.path.join(self.temp_dir, 'in.stl')
+        write_ascii_stl(self.ascii_path, self.facets)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def convert(self, **kwargs):
+        binary_path = os.path.join(self.temp_dir, 'out.stl')
+        summary = stl_tools.ascii_stl_to_binary(self.ascii_path, binary_path, **kwargs)
+        num_triangles, facets = read_binary_stl(binary_path)
+        self.assertEqual(num_triangles, summary.num_triangles)
+        self.assertEqual(len(facets), summary.num_triangles)
+        return summary, facets
+
+    def test_every_facet_is_converted(self):
+        summary, facets = self.convert()
+        self.assertEqual(summary.num_triangles, len(self.facets))
+        numpy.testing.assert_allclose(facets['vertices'], [v for n, v in self.facets], rtol=1e-6)
+        numpy.testing.assert_allclose(facets['normal'], [n for n, v in self.facets], rtol=1e-6)
+
+    def test_chunk_boundaries(self):
+        _, whole = self.convert()
+        facet_bytes = os.path.getsize(self.ascii_path) // len(self.facets)
+        # smaller than a facet (the chunk has to grow), and cutting facets at every other place
+        for chunk_bytes in (facet_bytes // 3, facet_bytes - 1, facet_bytes, facet_bytes + 1, 3 * facet_bytes + 7):
+            summary, facets = self.convert(chunk_bytes=chunk_bytes)
+            self.assertEqual(summary.num_triangles, len(self.facets), chunk_bytes)
+            numpy.testing.assert_array_equal(facets, whole)
+
+    def test_weld_tolerance_welds_and_drops_collapsed_facets(self):
+        # the corners the facets share, slightly off (and on either side of 0.15, so rounding wouldn't merge them)
+        facets = [([0, 0, 1], [[0.149, 0, 0], [1, 0, 0], [0, 1, 0]]),
+                  ([0, 0, 1], [[0.151, 0, 0], [1.0001, 0, 0], [0.3, -1, 0]]),
+                  # collapses, its first two corners within the tolerance
+                  ([0, 0, 1], [[5, 5, 5], [5.05, 5, 5], [5, 6, 5]])]
+        write_ascii_stl(self.ascii_path, facets + self.facets)
+        # (the facets in chunks of their own)
+        summary, welded = self.convert(weld_tolerance=0.1, chunk_bytes=100)
+        self.assertEqual(summary.num_degenerate_removed, 1)
+        self.assertEqual(summary.num_vertices_welded, 3)
+        self.assertEqual(summary.num_triangles, len(self.facets) + 2)
+        # welded into the first ones seen, the ones further apart than the tolerance left as they are
+        numpy.testing.assert_allclose(welded['vertices'][:2], [[[0.149, 0, 0], [1, 0, 0], [0, 1, 0]],
+                                                               [[0.149, 0, 0], [1, 0, 0], [0.3, -1, 0]]], rtol=1e-6)
+        numpy.testing.assert_allclose(welded['vertices'][2:], [v for n, v in self.facets], rtol=1e-6)
+
+    def test_vertex_welder(self):
+        welder = stl_tools.VertexWelder(0.5)
+        vertices = numpy.array([[0, 0, 0], [0.3, 0.3, 0], [0.4, 0.4, 0], [0, 0, 0.49], [1, 1, 1]], dtype=float)
+        # within the tolerance of the first, but not (0.57 apart) of each other
+        numpy.testing.assert_array_equal(welder.weld(vertices),
+                                         [[0, 0, 0], [0, 0, 0], [0.4, 0.4, 0], [0, 0, 0], [1, 1, 1]])
+        # and into the ones seen before
+        numpy.testing.assert_array_equal(welder.weld(numpy.array([[0.9, 1, 1], [0.1, 0, 0]])), [[1, 1, 1], [0, 0, 0]])
+        # in the order they come in (sorted, 0.8 would go into 0.4 instead)
+        welder = stl_tools.VertexWelder(0.5)
+        numpy.testing.assert_array_equal(welder.weld(numpy.array([[1, 0, 0], [0.8, 0, 0], [0.4, 0, 0]])),
+                                         [[1, 0, 0], [1, 0, 0], [0.4, 0, 0]])
+
+    def test_in_place(self):
+        summary = stl_tools.ascii_stl_to_binary(self.ascii_path)
+        self.assertEqual(read_binary_stl(self.ascii_path)[0], len(self.facets))
+        self.assertEqual(summary.num_triangles, len(self.facets))
+
+
+if __name__ == '__main__':
+    unittest.main()